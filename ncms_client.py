@@ -0,0 +1,63 @@
+"""
+ncms_client.py — Send one ncms_fetch.py command to a running NCMS worker.
+
+Start the worker once with ``python ncms_fetch.py serve``; then
+
+    python ncms_client.py publish --bundle-dir ... --metadata-file ...
+    python ncms_client.py mark-published --page-id ... --expected-slug ...
+
+take the same arguments, print the same output and exit with the same
+status as ``python ncms_fetch.py ...``. Relative paths are resolved against
+this client's working directory. The worker uses its own environment.
+Binary output such as ``diff --tar -`` arrives base64-encoded and is written
+to stdout's binary buffer.
+
+Environment:
+    NCMS_SOCKET  Worker socket (default .ncms.sock)
+"""
+
+import base64
+import json
+import os
+import socket
+import sys
+
+
+def write_bytes(stream, data):
+    """Write binary job output after any text already written to ``stream``."""
+    if not hasattr(stream, 'buffer'):
+        raise RuntimeError('binary output needs a stdout with a binary buffer')
+    stream.flush()
+    stream.buffer.write(data)
+    stream.buffer.flush()
+
+
+def run(argv, socket_path=None, stdout=None, stderr=None):
+    """Run ``argv`` on the worker, copying its output; return the exit status."""
+    socket_path = socket_path or os.getenv('NCMS_SOCKET', '.ncms.sock')
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    request = {'argv': list(argv), 'cwd': os.getcwd()}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        with connection.makefile('r', encoding='utf-8') as replies:
+            for line in replies:
+                message = json.loads(line)
+                if 'exit' in message:
+                    return message['exit']
+                if 'stdout' in message:
+                    stdout.write(message['stdout'])
+                if 'stdout_bytes' in message:
+                    write_bytes(stdout, base64.b64decode(message['stdout_bytes']))
+                if 'stderr' in message:
+                    stderr.write(message['stderr'])
+    raise RuntimeError('NCMS worker closed the connection without an exit status')
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(run(sys.argv[1:]))
+    except (OSError, RuntimeError) as error:
+        print(f"NCMS client error: {error}", file=sys.stderr)
+        sys.exit(1)
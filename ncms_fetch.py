@@ -1,45 +1,217 @@
 import argparse
+import asyncio
+import base64
+import contextlib
+import hashlib
+import io
 import json
 import os
+import queue
 import re
+import shutil
+import socketserver
+import stat
 import sys
+import tarfile
+import tempfile
+import threading
 from html import escape
-from notion_client import Client
 from dotenv import load_dotenv
 import subprocess
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from urllib.parse import urlsplit, urlunsplit
 
+import ncms_notion
+
 # Load environment variables
 load_dotenv()
-notion = Client(auth=os.getenv('NOTION_API_KEY'))
+notion = ncms_notion.LazyClient()
 database_id = os.getenv('NOTION_DATABASE_ID')
 output_dir = os.getenv('OUTPUT_DIR')
 project_dir = os.getenv('PROJECT_DIR')
 git_push_enabled = os.getenv('GIT_PUSH', 'false').lower() == 'true'
+git_plumbing_enabled = os.getenv('GIT_PLUMBING', 'false').lower() == 'true'
 notion_update_enabled = os.getenv('NOTION_UPDATE', 'false').lower() == 'true'
+fetch_workers = int(os.getenv('FETCH_WORKERS', '0'))
+block_cache_enabled = os.getenv('BLOCK_CACHE', 'true').lower() == 'true'
+block_cache_dir = os.getenv('BLOCK_CACHE_DIR', '.ncms_cache')
+block_cache_max_bytes = int(os.getenv('BLOCK_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+pipeline_depth = int(os.getenv('PIPELINE_DEPTH', '4'))
+WRITE_BUFFER_BYTES = 64 * 1024
 
 SAFE_SLUG_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_./-]*$')
 LANGUAGE_PREFIX_PATTERN = re.compile(r'^[a-z]{2,3}(?:-[a-z]{2})?$')
 NESTED_TRANSLATION_TITLE_PATTERN = re.compile(
     r'^.+\(([A-Za-z]{2,3}(?:-[A-Za-z]{2})?)\)\s*$'
 )
+SITEMAP_URL_PATTERN = re.compile(
+    r'\t<url>\n\t\t<loc>(.*?)</loc>\n.*?\t</url>\n', re.DOTALL
+)
 
-# Fetch database content
-def fetch_database_content(database_id, status='publish'):
-    results = []
-    has_more = True
-    start_cursor = None
-    while has_more:
-        response = notion.databases.query(
+# --- Async Notion fetching ---
+# The fetch path runs on notion_client.AsyncClient so one event loop can keep
+# many block requests in flight; run_async opens one client per batch of work.
+# Single listings (the database query, one page's blocks) go through the sync
+# client instead, whose connection pool lasts for the whole process.
+
+def run_async(function, *args, **kwargs):
+    """Run ``function(client, *args, **kwargs)`` with a fresh AsyncClient.
+
+    Under ``serve`` the coroutine runs on the worker's long-lived event loop
+    and client instead, so connections stay open between jobs.
+    """
+    if _service is not None:
+        loop, client = _service
+        return asyncio.run_coroutine_threadsafe(
+            function(client, *args, **kwargs), loop
+        ).result()
+
+    async def runner():
+        async with ncms_notion.create_async_client() as client:
+            return await function(client, *args, **kwargs)
+    return asyncio.run(runner())
+
+
+# (event loop, AsyncClient) of a running ``serve`` worker, else None.
+_service = None
+
+
+# Database properties NCMS reads; queries ask Notion for only these.
+PAGE_PROPERTIES = (
+    "Id", "Status", "Label", "Title", "JS", "Description", "Type", "Flags",
+    "Language", "TranslationGroup",
+)
+_property_ids = {}
+
+
+class PageRecord:
+    """Compact projection of a database page onto the properties NCMS reads.
+
+    ``flags`` is None when the database has no Flags property, so ID.tsv only
+    grows a Flags column for databases that use it.
+    """
+
+    __slots__ = (
+        'id', 'last_edited_time', 'slug', 'status', 'label', 'title', 'js',
+        'description', 'type', 'flags', 'language', 'translation_group',
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields[name])
+
+    def __repr__(self):
+        return f"PageRecord(id={self.id!r}, slug={self.slug!r}, status={self.status!r})"
+
+
+def page_record(page):
+    """Project a raw Notion page onto a PageRecord; records pass through."""
+    if isinstance(page, PageRecord):
+        return page
+    properties = page.get('properties', {})
+
+    def get_rich_text(prop_name, default=""):
+        prop = properties.get(prop_name) or {}
+        rich_text = prop.get('rich_text') or []
+        return rich_text[0].get('plain_text', default) if rich_text else default
+
+    def get_select(prop_name, default=""):
+        select = (properties.get(prop_name) or {}).get('select')
+        return select.get('name', default) if select else default
+
+    def get_flags():
+        prop = properties.get("Flags") or {}
+        if prop.get("rich_text"):
+            return " ".join(
+                item.get("plain_text", "") for item in prop["rich_text"]
+                if item.get("plain_text")
+            )
+        if prop.get("select"):
+            return prop["select"].get("name", "")
+        if prop.get("multi_select"):
+            return " ".join(
+                item.get("name", "") for item in prop["multi_select"]
+                if item.get("name")
+            )
+        return ""
+
+    title = (properties.get("Id") or {}).get("title") or []
+    slug = title[0].get("plain_text", "") if title else ""
+    return PageRecord(
+        id=page.get('id'),
+        last_edited_time=page.get('last_edited_time'),
+        slug=slug,
+        status=get_select("Status"),
+        label=get_rich_text("Label"),
+        title=get_rich_text("Title"),
+        js=get_select("JS", "0"),
+        description=get_rich_text("Description"),
+        type=get_select("Type"),
+        flags=get_flags() if "Flags" in properties else None,
+        language=get_select("Language", "en"),
+        translation_group=get_rich_text("TranslationGroup", slug),
+    )
+
+
+def page_property_ids(database):
+    """Return the ids of the PAGE_PROPERTIES present in a database schema."""
+    schema = database.get('properties', {})
+    return [schema[name]['id'] for name in PAGE_PROPERTIES if name in schema]
+
+
+async def fetch_property_ids_async(client, database_id):
+    if database_id not in _property_ids:
+        database = await client.databases.retrieve(database_id=database_id)
+        _property_ids[database_id] = page_property_ids(database)
+    return _property_ids[database_id]
+
+
+def fetch_property_ids(database_id):
+    if database_id not in _property_ids:
+        _property_ids[database_id] = page_property_ids(
+            notion.databases.retrieve(database_id=database_id)
+        )
+    return _property_ids[database_id]
+
+
+def database_query_filter(status='publish'):
+    return {"property": "Status", "select": {"equals": status}}
+
+
+async def fetch_database_content_async(client, database_id, status='publish'):
+    return [
+        page_record(page) async for page in ncms_notion.aiter_paginated(
+            client.databases.query,
             database_id=database_id,
-            filter={"property": "Status", "select": {"equals": status}},
-            start_cursor=start_cursor
+            filter=database_query_filter(status),
+            filter_properties=await fetch_property_ids_async(client, database_id),
+        )
+    ]
+
+
+async def fetch_page_blocks_async(client, page_id):
+    return [
+        block async for block in ncms_notion.aiter_paginated(
+            client.blocks.children.list, block_id=page_id
         )
-        results.extend(response.get('results', []))
-        has_more = response.get('has_more', False)
-        start_cursor = response.get('next_cursor', None)
-    return results
+    ]
+
+
+# Fetch database content
+def fetch_database_content(database_id, status='publish'):
+    return list(iter_database_content(database_id, status))
+
+
+def iter_database_content(database_id, status='publish'):
+    """Yield queued pages as records as each cursor page of the query arrives."""
+    pages = ncms_notion.iter_paginated(
+        notion.databases.query,
+        database_id=database_id,
+        filter=database_query_filter(status),
+        filter_properties=fetch_property_ids(database_id),
+    )
+    for page in pages:
+        yield page_record(page)
 
 # --- Rich text rendering ---
 
@@ -139,17 +311,25 @@ def handle_numbered_list_item(block, notion_client):
     text = render_rich_text(rich_text)
     return ('numbered_list_item', f"\t\t<li><div>{text}</div></li>\n")
 
-def handle_table(block, notion_client):
-    content = "\t<table>\n"
-    table_rows = notion_client.blocks.children.list(block_id=block['id'])['results']
+def stream_table(block, notion_client):
+    """Yield a table's HTML row by row."""
+    # Rows prefetched by fetch_block_trees are attached to the table block;
+    # otherwise page through them, since tables can exceed 100 rows.
+    table_rows = block['table'].get('children')
+    if table_rows is None:
+        table_rows = ncms_notion.iter_paginated(
+            notion_client.blocks.children.list, block_id=block['id']
+        )
+    yield "\t<table>\n"
     for row in table_rows:
-        cells = ''.join([
-            f"<td>{render_rich_text(cell)}</td>"
-            for cell in row['table_row']['cells']
-        ])
-        content += f"\t\t<tr>{cells}</tr>\n"
-    content += "\t</table>\n"
-    return ('table', content)
+        cells = ''.join(
+            f"<td>{render_rich_text(cell)}</td>" for cell in row['table_row']['cells']
+        )
+        yield f"\t\t<tr>{cells}</tr>\n"
+    yield "\t</table>\n"
+
+def handle_table(block, notion_client):
+    return ('table', ''.join(stream_table(block, notion_client)))
 
 def handle_quote(block, notion_client):
     rich_text = block['quote'].get('rich_text', [])
@@ -255,12 +435,25 @@ BLOCK_HANDLERS = {
     'divider': handle_divider,
 }
 
+# Block types whose HTML is produced as a stream of fragments when rendering
+# straight to a file; their BLOCK_HANDLERS entry joins the same fragments.
+STREAM_HANDLERS = {
+    'table': stream_table,
+}
+
 
 # --- List wrapping ---
 
 def wrap_lists(block_tuples):
     """Wrap consecutive list items in <ul>/<ol> tags."""
-    result = []
+    return ''.join(iter_wrap_lists(block_tuples))
+
+
+def iter_wrap_lists(block_tuples):
+    """Streaming wrap_lists: yield fragments as ``block_tuples`` arrive.
+
+    ``html`` may be a string or an iterable of fragments (see STREAM_HANDLERS).
+    """
     current_list_type = None
 
     for block_type, html in block_tuples:
@@ -270,45 +463,218 @@ def wrap_lists(block_tuples):
         if is_bulleted and current_list_type != 'bulleted':
             if current_list_type:
                 tag = 'ul' if current_list_type == 'bulleted' else 'ol'
-                result.append(f"\t</{tag}>\n")
-            result.append("\t<ul class=\"list-bullet content-list\">\n")
+                yield f"\t</{tag}>\n"
+            yield "\t<ul class=\"list-bullet content-list\">\n"
             current_list_type = 'bulleted'
         elif is_numbered and current_list_type != 'numbered':
             if current_list_type:
                 tag = 'ul' if current_list_type == 'bulleted' else 'ol'
-                result.append(f"\t</{tag}>\n")
-            result.append("\t<ol class=\"list-bullet content-list\">\n")
+                yield f"\t</{tag}>\n"
+            yield "\t<ol class=\"list-bullet content-list\">\n"
             current_list_type = 'numbered'
         elif not is_bulleted and not is_numbered and current_list_type:
             tag = 'ul' if current_list_type == 'bulleted' else 'ol'
-            result.append(f"\t</{tag}>\n")
+            yield f"\t</{tag}>\n"
             current_list_type = None
 
-        if html:
-            result.append(html)
+        if isinstance(html, str):
+            if html:
+                yield html
+        else:
+            yield from html
 
     # Close any remaining open list
     if current_list_type:
         tag = 'ul' if current_list_type == 'bulleted' else 'ol'
-        result.append(f"\t</{tag}>\n")
-
-    return ''.join(result)
+        yield f"\t</{tag}>\n"
 
 
 # Fetch page content blocks with pagination
 def fetch_page_blocks(page_id):
-    blocks = []
-    has_more = True
-    start_cursor = None
-    while has_more:
-        kwargs = {'block_id': page_id}
-        if start_cursor:
-            kwargs['start_cursor'] = start_cursor
-        response = notion.blocks.children.list(**kwargs)
-        blocks.extend(response.get('results', []))
-        has_more = response.get('has_more', False)
-        start_cursor = response.get('next_cursor')
-    return blocks
+    return list(ncms_notion.iter_paginated(notion.blocks.children.list, block_id=page_id))
+
+
+def is_nested_block_parent(block):
+    """Return True for blocks whose children NCMS renders: tables and translations."""
+    if block.get('type') == 'table':
+        return True
+    if block.get('type') == 'child_page':
+        title = block.get('child_page', {}).get('title', '')
+        return translation_language_from_title(title) is not None
+    return False
+
+
+# --- Block cache ---
+# Raw block lists are cached on disk per page, with table rows embedded, and
+# reused while the page's last_edited_time is unchanged. Notion rounds that
+# timestamp to the minute, so an entry fetched during the same minute as the
+# last edit is never trusted.
+
+def parse_notion_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def block_cache_path(block_id):
+    return os.path.join(block_cache_dir, f"{block_id.replace('-', '')}.json")
+
+
+def read_block_cache(block_id, last_edited_time):
+    """Return cached blocks for an unchanged page, or None."""
+    if not block_cache_enabled or not last_edited_time:
+        return None
+    path = block_cache_path(block_id)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get('last_edited_time') != last_edited_time:
+        return None
+    fetched_at = parse_notion_time(entry['fetched_at'])
+    if fetched_at < parse_notion_time(last_edited_time) + timedelta(minutes=1):
+        return None
+    os.utime(path)  # Eviction drops the least recently used entries first.
+    return entry['blocks']
+
+
+def write_block_cache(block_id, last_edited_time, blocks, fetched_at):
+    if not block_cache_enabled or not last_edited_time:
+        return
+    os.makedirs(block_cache_dir, exist_ok=True)
+    path = block_cache_path(block_id)
+    entry = {
+        'id': block_id,
+        'last_edited_time': last_edited_time,
+        'fetched_at': fetched_at.isoformat(),
+        'blocks': blocks,
+    }
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def evict_block_cache(max_bytes=None):
+    """Delete least recently used cache entries until the cache fits max_bytes."""
+    max_bytes = block_cache_max_bytes if max_bytes is None else max_bytes
+    if not os.path.isdir(block_cache_dir):
+        return
+    entries = []
+    for name in os.listdir(block_cache_dir):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(block_cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def edited_since(last_edited_time, edited_after):
+    """Return True unless both timestamps are known and the edit is older."""
+    if not edited_after or not last_edited_time:
+        return True
+    return parse_notion_time(last_edited_time) >= parse_notion_time(edited_after)
+
+
+async def fetch_block_trees_async(
+    client, page_ids, workers=None, edited_times=None, edited_after=None, semaphore=None
+):
+    """Fetch the blocks of each page and its nested tables and translations.
+
+    This is the nested-translation walk: as soon as a block list arrives, the
+    rows of its tables and the bodies of its translation child pages are
+    requested, with at most ``workers`` (or FETCH_WORKERS) block lists in
+    flight. Without either, up to NOTION_MAX_CONCURRENCY tasks are started and
+    the AIMD window in ncms_notion decides how many requests run. Returns a
+    dict mapping each page or block id to its child blocks. Table rows are
+    also attached to their table block as ``table['children']`` so rendering
+    does not request them again.
+
+    ``edited_times`` maps page ids to their ``last_edited_time``. Pages listed
+    there, and translation child pages, are served from the block cache while
+    unchanged. Each child_page block is given its child page's current
+    ``last_edited_time``, which a cached block would otherwise have stale.
+    With ``edited_after``, translation child pages last edited before that
+    timestamp are not fetched at all. Callers running several walks at once
+    pass a shared ``semaphore`` instead of ``workers``.
+    """
+    if semaphore is None:
+        semaphore = fetch_semaphore(workers)
+    edited_times = edited_times or {}
+    trees = {}
+
+    async def fetch_tree(block_id, last_edited_time=None):
+        blocks = read_block_cache(block_id, last_edited_time)
+        cached = blocks is not None
+        if not cached:
+            fetched_at = datetime.now(timezone.utc)
+            async with semaphore:
+                blocks = await fetch_page_blocks_async(client, block_id)
+        trees[block_id] = blocks
+
+        children = []
+        for block in blocks:
+            if not is_nested_block_parent(block) or block['id'] in trees:
+                continue
+            if block['type'] == 'table':
+                if cached:
+                    trees[block['id']] = block['table']['children']
+                else:
+                    children.append(fetch_tree(block['id']))
+                continue
+            child_edited_time = block.get('last_edited_time')
+            if cached:
+                # A cached child_page block carries the child's old timestamp.
+                async with semaphore:
+                    child = await client.pages.retrieve(page_id=block['id'])
+                child_edited_time = child.get('last_edited_time')
+                block['last_edited_time'] = child_edited_time
+            if not edited_since(child_edited_time, edited_after):
+                continue
+            children.append(fetch_tree(block['id'], child_edited_time))
+        await asyncio.gather(*children)
+
+        for block in blocks:
+            if block.get('type') == 'table' and block['id'] in trees:
+                block['table']['children'] = trees[block['id']]
+        if not cached:
+            write_block_cache(block_id, last_edited_time, blocks, fetched_at)
+
+    await asyncio.gather(*(
+        fetch_tree(page_id, edited_times.get(page_id))
+        for page_id in dict.fromkeys(page_ids)
+    ))
+    return trees
+
+
+def fetch_semaphore(workers=None):
+    return asyncio.Semaphore(
+        max(1, workers or fetch_workers or ncms_notion.get_concurrency().maximum)
+    )
+
+
+def fetch_block_trees(page_ids, workers=None, edited_times=None, edited_after=None):
+    trees = run_async(
+        fetch_block_trees_async,
+        page_ids,
+        workers=workers,
+        edited_times=edited_times,
+        edited_after=edited_after,
+    )
+    if block_cache_enabled:
+        evict_block_cache()
+    return trees
 
 
 def translation_language_from_title(title):
@@ -360,26 +726,40 @@ def parse_translation_metadata(blocks, expected_language):
 
 
 def render_page_blocks(blocks, skip_block_ids=()):
-    block_tuples = []
+    return ''.join(render_page_fragments(blocks, skip_block_ids))
+
+
+def render_page_fragments(blocks, skip_block_ids=()):
+    """Yield a page's HTML in fragments, rendering each block when reached."""
+    return iter_wrap_lists(iter_block_html(blocks, skip_block_ids))
+
+
+def iter_block_html(blocks, skip_block_ids=()):
     skip_block_ids = set(skip_block_ids)
     for block in blocks:
         if block.get('id') in skip_block_ids:
             continue
         block_type = block['type']
+        streamer = STREAM_HANDLERS.get(block_type)
+        if streamer:
+            yield (block_type, streamer(block, notion))
+            continue
         handler = BLOCK_HANDLERS.get(block_type)
         if handler:
             result = handler(block, notion)
             if result[1]:
-                block_tuples.append(result)
-    return wrap_lists(block_tuples)
+                yield result
 
 
 def fetch_page_content(page_id):
     return render_page_blocks(fetch_page_blocks(page_id))
 
 
-def extract_nested_translations(page_blocks, base_article):
+def extract_nested_translations(
+    page_blocks, base_article, block_trees=None, edited_after=None, stream=False
+):
     translations = []
+    block_trees = block_trees or {}
     seen_languages = set()
     for block in page_blocks:
         if block.get('type') != 'child_page':
@@ -394,8 +774,15 @@ def extract_nested_translations(page_blocks, base_article):
             raise RuntimeError(
                 f"Duplicate nested translation {language!r} for {base_article['slug']}"
             )
-        child_blocks = fetch_page_blocks(block['id'])
+        seen_languages.add(language)
+        if not edited_since(block.get('last_edited_time'), edited_after):
+            print(f"Unchanged nested translation: Id={base_article['slug']}, Language={language}")
+            continue
+        child_blocks = block_trees.get(block['id'])
+        if child_blocks is None:
+            child_blocks = fetch_page_blocks(block['id'])
         metadata = parse_translation_metadata(child_blocks, language)
+        render = render_page_fragments if stream else render_page_blocks
         translations.append({
             'id': block['id'],
             'status': base_article['status'],
@@ -407,85 +794,216 @@ def extract_nested_translations(page_blocks, base_article):
             'js': base_article['js'],
             'description': metadata['description'],
             'type': base_article['type'],
-            'content': render_page_blocks(
+            'content': render(
                 child_blocks,
                 skip_block_ids=(metadata['metadata_block_id'],),
             ),
         })
-        seen_languages.add(language)
     return translations
+
+
+def included_page(page, included_statuses):
+    """Return the page's record when its status is included, else None."""
+    page = page_record(page)
+    if page.status not in included_statuses:
+        if page.status in ("draft", "published", "test", "publish"):
+            print(f"Skipping ({page.status}): Id={page.slug}")
+        else:
+            print(f"Unknown status '{page.status}' for Id={page.slug}")
+        return None
+    return page
+
+
+def build_articles(page, block_trees, edited_after=None, stream=False):
+    """Render one fetched page and its nested translations into articles.
+
+    With ``stream``, each article's content is a lazy fragment iterator that
+    renders as write_component consumes it, instead of a string. With
+    ``edited_after``, a page not edited since then yields only its edited
+    nested translations.
+    """
+    page = page_record(page)
+    render = render_page_fragments if stream else render_page_blocks
+    page_blocks = block_trees[page.id]
+    changed = edited_since(page.last_edited_time, edited_after)
+    article = {
+        "id": page.id,
+        "status": page.status,
+        "slug": page.slug,
+        "language": page.language,
+        "translation_group": page.translation_group,
+        "label": page.label,
+        "title": page.title,
+        "js": page.js,
+        "description": page.description,
+        "type": page.type,
+        "content": render(page_blocks) if changed else None,
+    }
+    if page.flags is not None:
+        article["flags"] = page.flags
+    translations = extract_nested_translations(
+        page_blocks, article, block_trees, edited_after=edited_after, stream=stream
+    )
+    if changed:
+        print(f"Extracted article: Id={article['slug']}, Title={article['title']}")
+    else:
+        print(f"Unchanged article: Id={article['slug']}")
+    for translation in translations:
+        print(
+            f"Extracted nested translation: Id={translation['slug']}, "
+            f"Language={translation['language']}, Title={translation['title']}"
+        )
+    return ([article] if changed else []) + translations
+
+
 # Extract fields with corrected slug handling
-def extract_fields(database_content, included_statuses=('publish',)):
-    """Extract articles whose status is explicitly allowed by the caller."""
+def extract_fields(
+    database_content, included_statuses=('publish',), workers=None, edited_after=None
+):
+    """Extract articles whose status is explicitly allowed by the caller.
+
+    Block lists for every included page are fetched up front by
+    fetch_block_trees, concurrently unless ``workers`` (or FETCH_WORKERS) is
+    one. Articles are assembled in database order afterwards.
+    With ``edited_after``, pages and nested translations not edited since
+    then are skipped.
+    """
     articles = []
     included_statuses = set(included_statuses)
-    for page in database_content:
-        properties = page['properties']
-        def get_rich_text(prop_name, default=""):
-            prop = properties.get(prop_name, {})
-            rich_text = prop.get('rich_text', [])
-            return rich_text[0]['plain_text'] if rich_text else default
-
-        def get_flags():
-            prop = properties.get("Flags", {})
-            if prop.get("rich_text"):
-                return " ".join(
-                    item.get("plain_text", "") for item in prop["rich_text"]
-                    if item.get("plain_text")
-                )
-            if prop.get("select"):
-                return prop["select"].get("name", "")
-            if prop.get("multi_select"):
-                return " ".join(
-                    item.get("name", "") for item in prop["multi_select"]
-                    if item.get("name")
-                )
-            return ""
-
-        slug = properties["Id"]["title"][0]["plain_text"] if properties["Id"].get("title") else ""
-        language = "en"
-        if properties.get("Language") and properties["Language"].get("select") and properties["Language"]["select"]:
-            language = properties["Language"]["select"]["name"]
-        translation_group = slug
-        if properties.get("TranslationGroup") and properties["TranslationGroup"].get("rich_text"):
-            tg = properties["TranslationGroup"]["rich_text"]
-            if tg:
-                translation_group = tg[0]["plain_text"]
-        status = properties["Status"]["select"]["name"] if properties["Status"].get("select") else ""
-        if status not in included_statuses:
-            if status in ("draft", "published", "test", "publish"):
-                print(f"Skipping ({status}): Id={slug}")
-            else:
-                print(f"Unknown status '{status}' for Id={slug}")
-            continue
+    included_pages = [
+        page for page in (included_page(page, included_statuses) for page in database_content)
+        if page
+    ]
 
-        page_blocks = fetch_page_blocks(page["id"])
-        article = {
-            "id": page["id"],
-            "status": status,
-            "slug": slug,
-            "language": language,
-            "translation_group": translation_group,
-            "label": get_rich_text("Label"),
-            "title": get_rich_text("Title"),
-            "js": properties["JS"]["select"]["name"] if properties["JS"].get("select") else "0",
-            "description": get_rich_text("Description"),
-            "type": properties["Type"]["select"]["name"] if properties.get("Type", {}).get("select") else "",
-            "content": render_page_blocks(page_blocks)
-        }
-        if "Flags" in properties:
-            article["flags"] = get_flags()
-        articles.append(article)
-        translations = extract_nested_translations(page_blocks, article)
-        articles.extend(translations)
-        print(f"Extracted article: Id={article['slug']}, Title={article['title']}")
-        for translation in translations:
-            print(
-                f"Extracted nested translation: Id={translation['slug']}, "
-                f"Language={translation['language']}, Title={translation['title']}"
-            )
+    block_trees = fetch_block_trees(
+        [page.id for page in included_pages],
+        workers=workers,
+        edited_times={page.id: page.last_edited_time for page in included_pages},
+        edited_after=edited_after,
+    )
+
+    for page in included_pages:
+        articles.extend(build_articles(page, block_trees, edited_after))
     return articles
 
+# --- Output layer ---
+# Generated files are written to a temp file beside the target, hashed with
+# SHA-256 as the bytes go out, and only moved into place when they differ
+# from the file on disk. Unchanged files keep their mtime. output_changes
+# lists the paths a run actually changed for git staging and deploys, and
+# output_manifest maps every path it wrote to its digest and size.
+
+output_changes = []
+output_manifest = {}
+_output_changes_lock = threading.Lock()
+
+
+def reset_output_changes():
+    with _output_changes_lock:
+        output_changes.clear()
+        output_manifest.clear()
+
+
+class _HashingWriter(io.RawIOBase):
+    """Raw file wrapper that hashes and counts every byte written."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        written = self.raw.write(data)
+        self.sha256.update(memoryview(data)[:written])
+        self.size += written
+        return written
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+        super().close()
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(WRITE_BUFFER_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def manifest_entry(path):
+    """Return {"sha256", "size"} for ``path``, from output_manifest if written this run."""
+    entry = output_manifest.get(os.path.abspath(path))
+    if entry is None:
+        entry = {"sha256": file_digest(path), "size": os.path.getsize(path)}
+    return dict(entry)
+
+
+class OutputFile:
+    """Text file that atomically replaces ``path`` only if its bytes change.
+
+    Use as a context manager; ``changed`` is set once the block exits.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.changed = None
+        self.sha256 = None
+        self.size = None
+        self._file = None
+        self._hashing = None
+
+    def __enter__(self):
+        # Same text mode as open(path, 'w', encoding='utf-8').
+        self._hashing = _HashingWriter(open(self.temp_path, 'wb', buffering=0))
+        self._file = io.TextIOWrapper(
+            io.BufferedWriter(self._hashing, WRITE_BUFFER_BYTES), encoding='utf-8'
+        )
+        return self._file
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            self._file.close()
+            if exc_type is not None:
+                return False
+            self.sha256 = self._hashing.sha256.hexdigest()
+            self.size = self._hashing.size
+            self.changed = not (
+                os.path.exists(self.path)
+                and os.path.getsize(self.path) == self.size
+                and file_digest(self.path) == self.sha256
+            )
+            if self.changed:
+                os.replace(self.temp_path, self.path)
+            with _output_changes_lock:
+                if self.changed:
+                    output_changes.append(self.path)
+                output_manifest[os.path.abspath(self.path)] = {
+                    "sha256": self.sha256, "size": self.size,
+                }
+        finally:
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+        return False
+
+    @property
+    def status(self):
+        return "Updated" if self.changed else "Unchanged"
+
+
+def write_output(path, text):
+    """Write ``text`` to ``path`` through OutputFile; return True if it changed."""
+    output = OutputFile(path)
+    with output as f:
+        f.write(text)
+    return output.changed
+
+
 # Update ID.tsv with overwrite for existing entries (per-language files)
 def update_id_tsv(articles, output_base):
     # Group articles by language
@@ -547,12 +1065,13 @@ def update_id_tsv(articles, output_base):
                 row.append(str(article.get(key, '')) if key else '')
             existing_entries[article['slug']] = row
 
-        with open(id_tsv_path, 'w', encoding='utf-8') as f:
+        output = OutputFile(id_tsv_path)
+        with output as f:
             f.write('\t'.join(header) + '\n')
             for row in existing_entries.values():
                 row = row + [''] * (len(header) - len(row))
                 f.write('\t'.join(row[:len(header)]) + '\n')
-        print(f"Updated {id_tsv_path}")
+        print(f"{output.status} {id_tsv_path}")
 
     # Generate Translations.tsv cross-index
     update_translations_tsv(articles, output_base)
@@ -577,6 +1096,8 @@ def update_translations_tsv(articles, output_base):
             if lines:
                 header = lines[0].strip().split('\t')
                 old_langs = header[1:]
+                # Keep languages this run did not touch.
+                all_langs.extend(lang for lang in old_langs if lang not in all_langs)
                 for line in lines[1:]:
                     parts = line.strip().split('\t')
                     if parts:
@@ -597,14 +1118,15 @@ def update_translations_tsv(articles, output_base):
         existing[group][lang] = article['status']
 
     # Write
-    with open(trans_path, 'w', encoding='utf-8') as f:
+    output = OutputFile(trans_path)
+    with output as f:
         f.write('TranslationGroup\t' + '\t'.join(all_langs) + '\n')
         for group in sorted(existing.keys()):
             row = [group]
             for lang in all_langs:
                 row.append(existing[group].get(lang, ''))
             f.write('\t'.join(row) + '\n')
-    print(f"Updated {trans_path}")
+    print(f"{output.status} {trans_path}")
 
 # Update Url.tsv with overwrite for existing entries (per-language)
 def update_url_tsv(articles, output_base):
@@ -626,17 +1148,25 @@ def update_url_tsv(articles, output_base):
                     if len(parts) >= 1:
                         existing_entries[parts[0]] = line.strip()
 
-        with open(url_tsv_path, 'w', encoding='utf-8') as f:
+        output = OutputFile(url_tsv_path)
+        with output as f:
             for article in lang_articles:
                 path = article['slug'].replace('/', '\\')
                 line = f"{path}\tindex\tjpg"
                 existing_entries[path] = line
             for entry in existing_entries.values():
                 f.write(f"{entry}\n")
-        print(f"Updated {url_tsv_path}")
+        print(f"{output.status} {url_tsv_path}")
+
+def merge_by_source(existing, generated):
+    """Replace rules in ``existing`` whose source is regenerated; append new ones."""
+    generated_by_source = {rule['source']: rule for rule in generated}
+    merged = [generated_by_source.pop(rule.get('source'), rule) for rule in existing]
+    merged.extend(generated_by_source.values())
+    return merged
 
 # Update firebase.json with dynamic rewrites and redirects
-def update_firebase_json(articles, output_base):
+def update_firebase_json(articles, output_base, merge=False):
     firebase_json_path = os.path.join(project_dir, 'build', 'firebase.json')  # Use FIREBASE_DIR
     if not os.path.exists(firebase_json_path):
         firebase_data = {
@@ -700,17 +1230,42 @@ def update_firebase_json(articles, output_base):
                 {"source": f"{prefix}/{slug}.jpg", "destination": f"{prefix}/{slug}/index.jpg"}
             ])
 
+    if merge:
+        # Incremental runs only see edited articles; keep everyone else's rules.
+        redirects = merge_by_source(firebase_data["hosting"].get("redirects", []), redirects)
+        rewrites = merge_by_source(firebase_data["hosting"].get("rewrites", []), rewrites)
+
     firebase_data["hosting"]["redirects"] = redirects
     firebase_data["hosting"]["rewrites"] = rewrites
 
     # if directory does not exist, create it
     os.makedirs(os.path.dirname(firebase_json_path), exist_ok=True)
-    with open(firebase_json_path, 'w', encoding='utf-8') as f:
+    output = OutputFile(firebase_json_path)
+    with output as f:
         json.dump(firebase_data, f, indent=4)
-    print(f"Updated {firebase_json_path}")
+    print(f"{output.status} {firebase_json_path}")
+
+def read_translation_languages(output_base):
+    """Return {translation_group: [languages]} from Config/Translations.tsv."""
+    trans_path = os.path.join(output_base, 'Config/Translations.tsv')
+    if not os.path.exists(trans_path):
+        return {}
+    with open(trans_path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    if not lines:
+        return {}
+    langs = lines[0].split('\t')[1:]
+    groups = {}
+    for line in lines[1:]:
+        parts = line.split('\t')
+        groups[parts[0]] = [
+            lang for i, lang in enumerate(langs)
+            if i + 1 < len(parts) and parts[i + 1]
+        ]
+    return groups
 
 # Update sitemap.xml with overwrite for existing URLs and hreflang
-def update_sitemap_xml(articles, output_base):
+def update_sitemap_xml(articles, output_base, merge=False):
     sitemap_xml_path = os.path.join(output_base, 'Site/sitemap.xml')
     os.makedirs(os.path.dirname(sitemap_xml_path), exist_ok=True)
     base_url = "https://ujnotes.com"
@@ -721,6 +1276,17 @@ def update_sitemap_xml(articles, output_base):
         group = article.get('translation_group', article['slug'])
         groups.setdefault(group, []).append(article)
 
+    if merge:
+        # Variants an incremental run skipped still belong in hreflang alternates.
+        known_languages = read_translation_languages(output_base)
+        for group, group_articles in groups.items():
+            present = {article.get('language', 'en') for article in group_articles}
+            for lang in known_languages.get(group, []):
+                if lang not in present:
+                    group_articles.append(
+                        {'slug': group, 'language': lang, 'translation_group': group}
+                    )
+
     urlset_start = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:xhtml="http://www.w3.org/1999/xhtml">\n'
     urlset_end = '</urlset>'
     new_urls = []
@@ -746,40 +1312,233 @@ def update_sitemap_xml(articles, output_base):
             url_entry += "\t</url>\n"
             new_urls.append(url_entry)
 
-    with open(sitemap_xml_path, 'w', encoding='utf-8') as f:
-        f.write(urlset_start + ''.join(new_urls) + urlset_end)
-    print(f"Updated {sitemap_xml_path} with {len(new_urls)} URLs")
+    if merge and os.path.exists(sitemap_xml_path):
+        with open(sitemap_xml_path, 'r', encoding='utf-8') as f:
+            existing = {
+                match.group(1): match.group(0)
+                for match in SITEMAP_URL_PATTERN.finditer(f.read())
+            }
+        for url_entry in new_urls:
+            existing[SITEMAP_URL_PATTERN.match(url_entry).group(1)] = url_entry
+        new_urls = list(existing.values())
+
+    changed = write_output(sitemap_xml_path, urlset_start + ''.join(new_urls) + urlset_end)
+    print(f"{'Updated' if changed else 'Unchanged'} {sitemap_xml_path} with {len(new_urls)} URLs")
 
 # Helper function for running git commands with error capture
-def _run_cmd(cmd, cwd):
-    return subprocess.run(cmd, cwd=cwd, text=True, capture_output=True)
+def _run_cmd(cmd, cwd, input=None, env=None):
+    return subprocess.run(cmd, cwd=cwd, text=True, capture_output=True, input=input, env=env)
 
-# Call push_git.sh equivalent
-def push_git(output_base):
-    try:
-        # Stage all changes
-        result = _run_cmd(["git", "add", "-A"], cwd=output_base)
+
+def repo_relative_paths(paths, repo_root):
+    """Return ``paths`` relative to ``repo_root`` in git form, dropping outsiders."""
+    relative = []
+    for path in dict.fromkeys(paths):
+        try:
+            rel = os.path.relpath(os.path.abspath(path), repo_root)
+        except ValueError:  # Different drive on Windows.
+            rel = os.pardir
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            print(f"Not staging {path}: outside {repo_root}")
+            continue
+        relative.append(rel.replace(os.sep, '/'))
+    return relative
+
+
+def commit_message(slugs):
+    timestamp = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+    message = f"Update articles from Notion - {timestamp}\n"
+    slugs = list(dict.fromkeys(slugs))
+    if slugs:
+        message += "\n" + "".join(f"- {slug}\n" for slug in slugs)
+    return message
+
+
+def stage_paths(repo_root, paths, env=None):
+    """git add exactly ``paths``; return False on failure."""
+    result = _run_cmd(
+        ["git", "--literal-pathspecs", "add", "--pathspec-from-file=-", "--pathspec-file-nul"],
+        cwd=repo_root,
+        input="\0".join(paths),
+        env=env,
+    )
+    if result.returncode != 0:
+        print(f"Git add failed: {result.stderr}")
+        return False
+    return True
+
+
+def commit_staged(repo_root, message, env=None):
+    """Commit the index; return True, False on failure, or None if unchanged."""
+    result = _run_cmd(["git", "diff", "--cached", "--quiet"], cwd=repo_root, env=env)
+    if result.returncode == 0:
+        return None
+    result = _run_cmd(["git", "commit", "-F", "-"], cwd=repo_root, input=message, env=env)
+    if result.returncode != 0:
+        print(f"Git commit failed: {result.stderr}")
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def scratch_index(repo_root):
+    """Yield a git environment whose index holds HEAD's tree and nothing else.
+
+    NCMS commits are built in this temporary index (GIT_INDEX_FILE), so
+    changes the user has staged in the real index are never swept into them.
+    It starts as a copy of the real index, so git keeps the cached file
+    stats of unchanged entries.
+    """
+    with tempfile.TemporaryDirectory(prefix="ncms-index-") as temp_dir:
+        env = dict(os.environ, GIT_INDEX_FILE=os.path.join(temp_dir, "index"))
+        real_index = _run_cmd(["git", "rev-parse", "--git-path", "index"], cwd=repo_root)
+        real_index = os.path.join(repo_root, real_index.stdout.strip())
+        if os.path.exists(real_index):
+            shutil.copyfile(real_index, env["GIT_INDEX_FILE"])
+        has_head = _run_cmd(
+            ["git", "rev-parse", "--verify", "-q", "HEAD"], cwd=repo_root
+        ).returncode == 0
+        result = _run_cmd(
+            ["git", "read-tree", *(["-m", "HEAD"] if has_head else ["--empty"])],
+            cwd=repo_root,
+            env=env,
+        )
         if result.returncode != 0:
-            print(f"Git add failed: {result.stderr}")
+            raise RuntimeError(f"Git read-tree failed: {result.stderr}")
+        yield env
+
+
+def commit_paths(repo_root, paths, message):
+    """Commit exactly ``paths`` with git add and git commit.
+
+    Same return values as commit_staged. The real index is updated for
+    ``paths`` afterwards, so git status matches the new commit.
+    """
+    with scratch_index(repo_root) as env:
+        if not stage_paths(repo_root, paths, env):
             return False
+        committed = commit_staged(repo_root, message, env)
+    if committed and not stage_paths(repo_root, paths):
+        return False
+    return committed
 
-        # Check if there are staged changes
-        result = _run_cmd(["git", "diff", "--cached", "--quiet"], cwd=output_base)
-        if result.returncode == 0:
-            # No staged changes - nothing to commit
-            print("No changes to commit")
-            return True
 
-        # Commit staged changes
-        timestamp = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
-        commit_message = f"Update articles from Notion - {timestamp}"
-        result = _run_cmd(["git", "commit", "-m", commit_message], cwd=output_base)
+def commit_paths_plumbing(repo_root, paths, message):
+    """Commit ``paths`` with plumbing commands only.
+
+    hash-object and update-index write the blobs and the entries of a
+    scratch index, then write-tree, commit-tree and update-ref create the
+    commit, so nothing stats or walks the rest of the working tree. The real
+    index gets the same entries once the commit exists. Same return values
+    as commit_staged.
+    """
+    result = _run_cmd(
+        ["git", "hash-object", "-w", "--stdin-paths"],
+        cwd=repo_root,
+        input="".join(f"{path}\n" for path in paths),
+    )
+    if result.returncode != 0:
+        print(f"Git hash-object failed: {result.stderr}")
+        return False
+    blobs = result.stdout.split()
+    index_info = "".join(f"100644 {blob}\t{path}\n" for blob, path in zip(blobs, paths))
+    update_index = ["git", "update-index", "--add", "--index-info"]
+    with scratch_index(repo_root) as env:
+        result = _run_cmd(update_index, cwd=repo_root, input=index_info, env=env)
         if result.returncode != 0:
-            print(f"Git commit failed: {result.stderr}")
+            print(f"Git update-index failed: {result.stderr}")
+            return False
+        tree = _run_cmd(["git", "write-tree"], cwd=repo_root, env=env)
+    if tree.returncode != 0:
+        print(f"Git write-tree failed: {tree.stderr}")
+        return False
+    tree = tree.stdout.strip()
+    parent = _run_cmd(["git", "rev-parse", "--verify", "-q", "HEAD"], cwd=repo_root).stdout.strip()
+    if parent:
+        head_tree = _run_cmd(["git", "rev-parse", "HEAD^{tree}"], cwd=repo_root).stdout.strip()
+        if head_tree == tree:
+            return None
+    commit = _run_cmd(
+        ["git", "commit-tree", tree, *(["-p", parent] if parent else []), "-F", "-"],
+        cwd=repo_root,
+        input=message,
+    )
+    if commit.returncode != 0:
+        print(f"Git commit-tree failed: {commit.stderr}")
+        return False
+    commit = commit.stdout.strip()
+    result = _run_cmd(
+        ["git", "update-ref", "-m", message.splitlines()[0], "HEAD", commit, *([parent] if parent else [])],
+        cwd=repo_root,
+    )
+    if result.returncode != 0:
+        print(f"Git update-ref failed: {result.stderr}")
+        return False
+    result = _run_cmd(update_index, cwd=repo_root, input=index_info)
+    if result.returncode != 0:
+        print(f"Git update-index failed: {result.stderr}")
+        return False
+    return True
+
+
+def has_unpushed_commits(repo_root):
+    """True when HEAD has commits that origin/main does not."""
+    if _run_cmd(["git", "rev-parse", "--verify", "-q", "HEAD"], cwd=repo_root).returncode != 0:
+        return False
+    result = _run_cmd(["git", "rev-list", "--count", "origin/main..HEAD"], cwd=repo_root)
+    if result.returncode != 0:
+        # origin/main does not exist yet, so every commit is unpushed.
+        return True
+    return result.stdout.strip() != "0"
+
+
+# Call push_git.sh equivalent
+def push_git(output_base, paths=None, slugs=()):
+    """Commit the files a run produced and push.
+
+    With ``paths`` (normally every file in output_manifest), exactly those
+    files are staged and one commit lists every article slug in the batch;
+    GIT_PLUMBING=true stages and commits them without touching the rest of
+    the working tree. Without ``paths`` the whole tree is staged as before.
+    Commits left unpushed by an earlier failed run are pushed even when
+    there is nothing new to commit.
+    """
+    try:
+        repo_root = os.path.abspath(output_base)
+        if paths is None:
+            # Stage all changes
+            result = _run_cmd(["git", "add", "-A"], cwd=repo_root)
+            if result.returncode != 0:
+                print(f"Git add failed: {result.stderr}")
+                return False
+            committed = commit_staged(repo_root, commit_message(slugs))
+        else:
+            top_level = _run_cmd(["git", "rev-parse", "--show-toplevel"], cwd=repo_root)
+            if top_level.returncode != 0:
+                print(f"Not a git repository: {top_level.stderr}")
+                return False
+            repo_root = os.path.abspath(top_level.stdout.strip())
+            paths = repo_relative_paths(paths, repo_root)
+            if not paths:
+                committed = None
+            else:
+                print(f"Staging {len(paths)} generated files")
+                if git_plumbing_enabled:
+                    committed = commit_paths_plumbing(repo_root, paths, commit_message(slugs))
+                else:
+                    committed = commit_paths(repo_root, paths, commit_message(slugs))
+
+        if committed is None:
+            # No staged changes - nothing to commit
+            print("No changes to commit")
+            if not has_unpushed_commits(repo_root):
+                return True
+            print("Pushing commits left by an earlier run")
+        elif not committed:
             return False
 
         # Push to remote
-        result = _run_cmd(["git", "push", "-u", "origin", "main"], cwd=output_base)
+        result = _run_cmd(["git", "push", "-u", "origin", "main"], cwd=repo_root)
         if result.returncode != 0:
             print(f"Git push failed: {result.stderr}")
             return False
@@ -806,72 +1565,84 @@ def update_notion_status(articles):
         except Exception as e:
             print(f"Failed to update status for {article['slug']}: {e}")
 
-# Transform to PHP with correct directory structure and auto-indent
-def transform_to_php(articles):
+def component_output_base():
     if not output_dir:
         print("Error: OUTPUT_DIR not set in .env, defaulting to 'test'")
-        output_base = 'test'
+        return 'test'
+    return output_dir
+
+
+def write_component(article, output_base, written_dirs):
+    """Write one article's component file; ``written_dirs`` spans the run."""
+    lang = article.get('language', 'en')
+    if lang == 'en':
+        output_base_html = os.path.join(output_base, 'HTML/Component/')
     else:
-        output_base = output_dir
-    written_dirs = set()
+        output_base_html = os.path.join(output_base, f'HTML/Component/{lang}/')
 
-    for article in articles:
-        lang = article.get('language', 'en')
-        if lang == 'en':
-            output_base_html = os.path.join(output_base, 'HTML/Component/')
-        else:
-            output_base_html = os.path.join(output_base, f'HTML/Component/{lang}/')
+    category_path = article['slug'].strip()
+    if not category_path:
+        category_path = article['title'].replace(' ', '_').lower()
+        print(f"Warning: Empty Id for {article['title']}, using {category_path}")
 
-        category_path = article['slug'].strip()
-        if not category_path:
-            category_path = article['title'].replace(' ', '_').lower()
-            print(f"Warning: Empty Id for {article['title']}, using {category_path}")
+    full_output_dir = os.path.join(output_base_html, category_path)
+    print(f"Creating directory: {full_output_dir}")
 
-        full_output_dir = os.path.join(output_base_html, category_path)
-        print(f"Creating directory: {full_output_dir}")
+    try:
+        os.makedirs(full_output_dir, exist_ok=True)
+    except Exception as e:
+        print(f"Error creating directory {full_output_dir}: {e}")
+        return
 
-        try:
-            os.makedirs(full_output_dir, exist_ok=True)
-        except Exception as e:
-            print(f"Error creating directory {full_output_dir}: {e}")
-            continue
+    php_file = 'index.php'
+    full_file_path = os.path.join(full_output_dir, php_file)
 
-        php_file = 'index.php'
+    if full_file_path in written_dirs:
+        php_file = f"{article['title'].replace(' ', '_').lower()}.php"
         full_file_path = os.path.join(full_output_dir, php_file)
+        print(f"Index.php exists, using {php_file} instead")
 
-        if full_file_path in written_dirs:
-            php_file = f"{article['title'].replace(' ', '_').lower()}.php"
-            full_file_path = os.path.join(full_output_dir, php_file)
-            print(f"Index.php exists, using {php_file} instead")
+    written_dirs.add(full_file_path)
 
-        written_dirs.add(full_file_path)
+    js_include = "<?php require('../JS/Base/page.js'); ?>" if article['js'] == "1" else ""
+    content = article['content']
+    fragments = (content,) if isinstance(content, str) else content
 
-        js_include = "<?php require('../JS/Base/page.js'); ?>" if article['js'] == "1" else ""
-        php_code_lines = [
-            "<div id='message'>",
-            f"\t{article['content']}",
-            "</div>",
-            js_include,
-            "<?php require('../HTML/Fragment/Component_bottom.php') ?>"
-        ]
-        php_code = '\n'.join(php_code_lines)
+    print(f"Writing to: {full_file_path}")
+    output = OutputFile(full_file_path)
+    try:
+        # Fragments go straight into the file buffer; the body is never joined
+        # into one string. A fragment that fails to render fails this file only.
+        with output as f:
+            f.write("<div id='message'>\n\t")
+            for fragment in fragments:
+                f.write(fragment)
+            f.write("\n</div>\n")
+            f.write(js_include)
+            f.write("\n<?php require('../HTML/Fragment/Component_bottom.php') ?>")
+    except Exception as e:
+        print(f"Error writing to {full_file_path}: {e}")
+        return
+    if not output.changed:
+        print(f"Unchanged: {full_file_path}")
 
-        print(f"Writing to: {full_file_path}")
-        try:
-            with open(full_file_path, 'w', encoding='utf-8') as f:
-                f.write(php_code)
-        except Exception as e:
-            print(f"Error writing to {full_file_path}: {e}")
 
-    # Perform additional updates
+def update_site_config(articles, merge_config=False):
+    """Write the config files, then push to git and update Notion if enabled."""
     update_id_tsv(articles, output_dir or '.')
     update_url_tsv(articles, output_dir or '.')
-    update_firebase_json(articles, output_dir or '.')
-    update_sitemap_xml(articles, output_dir or '.')
+    update_firebase_json(articles, output_dir or '.', merge=merge_config)
+    update_sitemap_xml(articles, output_dir or '.', merge=merge_config)
+    print(f"Changed {len(output_changes)} generated files")
+    for path in output_changes:
+        print(f"  {path}")
 
     # Push to Git if enabled
     if git_push_enabled:
-        push_git(project_dir)
+        # Stage everything this run wrote, not only what changed: git skips
+        # identical files, and files a failed earlier run left uncommitted
+        # are picked up again.
+        push_git(project_dir, list(output_manifest), [article['slug'] for article in articles])
     else:
         print("Git push disabled (set GIT_PUSH=true to enable)")
 
@@ -881,6 +1652,16 @@ def transform_to_php(articles):
     else:
         print("Notion status update disabled (set NOTION_UPDATE=true to enable)")
 
+
+# Transform to PHP with correct directory structure and auto-indent
+def transform_to_php(articles, merge_config=False):
+    reset_output_changes()
+    output_base = component_output_base()
+    written_dirs = set()
+    for article in articles:
+        write_component(article, output_base, written_dirs)
+    update_site_config(articles, merge_config=merge_config)
+
 def write_ids_tsv(articles):
     """Write article metadata to a TSV file, including Flags when available.
     Updates the row if an entry with the same Id exists; otherwise, appends a new row.
@@ -912,15 +1693,14 @@ def write_ids_tsv(articles):
         if include_flags:
             row.append(article.get("flags", ""))
         existing[article["slug"]] = row
-    with open(file_path, "w", encoding="utf-8") as f:
+    with OutputFile(file_path) as f:
         f.write("\t".join(header) + "\n")
         for row in existing.values():
             row = row + [""] * (len(header) - len(row))
             f.write("\t".join(row[:len(header)]) + "\n")
 
 def page_slug(page):
-    title = page.get("properties", {}).get("Id", {}).get("title", [])
-    return title[0].get("plain_text", "") if title else ""
+    return page_record(page).slug
 
 
 def validate_slug(slug):
@@ -959,13 +1739,16 @@ def parse_publish_target(requested_slug, candidate_slugs=()):
 
 
 def select_publish_page(pages, requested_slug=None):
-    candidates = [{"slug": page_slug(page), "page_id": page["id"]} for page in pages]
+    records = [page_record(page) for page in pages]
+    candidates = [{"slug": record.slug, "page_id": record.id} for record in records]
     if requested_slug:
         base_slug, language = parse_publish_target(
             requested_slug,
             [item["slug"] for item in candidates],
         )
-        selected = [page for page in pages if page_slug(page) == base_slug]
+        selected = [
+            page for page, record in zip(pages, records) if record.slug == base_slug
+        ]
         if len(selected) != 1:
             raise RuntimeError(
                 f"Expected one publish page for {requested_slug!r}; found {len(selected)}. "
@@ -979,11 +1762,36 @@ def select_publish_page(pages, requested_slug=None):
             f"Found {len(pages)}: {[item['slug'] for item in candidates]}. "
             "Pass --slug to select one explicitly."
         )
-    validate_slug(page_slug(pages[0]))
+    validate_slug(records[0].slug)
     return pages[0], candidates, None
 
 
-def publish_to_bundle(status, slug, bundle_dir, metadata_file, allow_empty=False):
+def bundle_files(bundle_dir, extra_paths=()):
+    """Manifest of the files this run wrote under ``bundle_dir``, sorted by path."""
+    bundle_dir = os.path.abspath(bundle_dir)
+    paths = {
+        path for path in output_manifest
+        if os.path.commonpath([bundle_dir, path]) == bundle_dir
+    }
+    paths.update(os.path.abspath(path) for path in extra_paths)
+    files = [
+        {"path": os.path.relpath(path, bundle_dir).replace("\\", "/"), **manifest_entry(path)}
+        for path in paths
+    ]
+    return sorted(files, key=lambda item: item["path"])
+
+
+def bundle_digest(files):
+    """SHA-256 over the sorted "path NUL sha256 NUL size" lines of a manifest."""
+    digest = hashlib.sha256()
+    for item in sorted(files, key=lambda item: item["path"]):
+        digest.update(f"{item['path']}\0{item['sha256']}\0{item['size']}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def publish_to_bundle(
+    status, slug, bundle_dir, metadata_file, allow_empty=False, workers=None
+):
     global output_dir, project_dir, git_push_enabled, notion_update_enabled
 
     if not database_id:
@@ -1005,12 +1813,23 @@ def publish_to_bundle(status, slug, bundle_dir, metadata_file, allow_empty=False
 
     selected, candidates, requested_language = select_publish_page(pages, slug)
 
-    output_dir = bundle_dir
-    project_dir = bundle_dir
     git_push_enabled = False
     notion_update_enabled = False
+    output_dir = bundle_dir
+    project_dir = bundle_dir
+
+    articles = extract_fields([selected], included_statuses=(status,), workers=workers)
+    metadata = write_bundle(articles, bundle_dir, metadata_file, candidates, requested_language)
+    print("NCMS_RESULT=" + json.dumps(metadata, ensure_ascii=True))
+    return metadata
+
+
+def write_bundle(articles, bundle_dir, metadata_file, candidates, requested_language=None):
+    """Write one page's extracted articles into ``bundle_dir`` and its metadata file."""
+    global output_dir, project_dir
 
-    articles = extract_fields([selected], included_statuses=(status,))
+    output_dir = bundle_dir
+    project_dir = bundle_dir
     if not articles:
         raise RuntimeError("Expected at least one extracted article")
     base_articles = [
@@ -1053,6 +1872,7 @@ def publish_to_bundle(status, slug, bundle_dir, metadata_file, allow_empty=False
             "description": article["description"],
             "language": language,
             "component": os.path.relpath(component_path, bundle_dir).replace("\\", "/"),
+            **manifest_entry(component_path),
         })
 
     primary_variant = variants[0]
@@ -1069,17 +1889,270 @@ def publish_to_bundle(status, slug, bundle_dir, metadata_file, allow_empty=False
     if requested_language:
         metadata["requested_language"] = requested_language
         metadata["translation_merge"] = True
+    metadata["files"] = bundle_files(bundle_dir, [
+        os.path.join(bundle_dir, *variant["component"].split("/")) for variant in variants
+    ])
+    metadata["bundle_sha256"] = bundle_digest(metadata["files"])
+    write_metadata(metadata_file, metadata)
+    return metadata
+
+
+def write_metadata(metadata_file, metadata):
     with open(metadata_file, "w", encoding="utf-8", newline="\n") as target:
         json.dump(metadata, target, ensure_ascii=False, indent=2)
         target.write("\n")
 
-    print("NCMS_RESULT=" + json.dumps(metadata, ensure_ascii=True))
-    return metadata
 
+def publish_all(status, bundle_root, metadata_file, allow_empty=False, workers=None, depth=None):
+    """Render every queued page into its own bundle under ``bundle_root``.
 
-def mark_published(page_id, expected_slug):
-    validate_slug(expected_slug)
-    page = notion.pages.retrieve(page_id=page_id)
+    Each page gets ``<page_id>/`` as its bundle directory and ``<page_id>.json``
+    as its metadata file, exactly as a single-page publish would write them.
+    Block trees are fetched ahead on the pipeline fetch thread while earlier
+    bundles are rendered. A page that fails to fetch or render is reported in
+    the index with its error and does not stop the others. The combined
+    index is written to ``metadata_file`` and returned.
+    """
+    global git_push_enabled, notion_update_enabled
+
+    if not database_id:
+        raise RuntimeError("NOTION_DATABASE_ID is not set")
+
+    bundle_root = os.path.abspath(bundle_root)
+    metadata_file = os.path.abspath(metadata_file)
+    os.makedirs(bundle_root, exist_ok=True)
+    os.makedirs(os.path.dirname(metadata_file), exist_ok=True)
+
+    pages = fetch_database_content(database_id, status=status)
+    if not pages and not allow_empty:
+        raise RuntimeError(f"No pages with Status={status} are queued")
+    candidates = [{"slug": record.slug, "page_id": record.id} for record in pages]
+
+    git_push_enabled = False
+    notion_update_enabled = False
+
+    entries = {}
+    queued = []
+    for record in pages:
+        entry = entries.setdefault(record.id, {"page_id": record.id, "slug": record.slug})
+        try:
+            validate_slug(record.slug)
+        except ValueError as error:
+            entry["error"] = str(error)
+            continue
+        queued.append(record)
+
+    depth = max(1, depth or pipeline_depth)
+    stop = threading.Event()
+    errors = []
+    fetch_thread, fetched = start_fetch_stage(
+        queued, (status,), workers, None, depth, stop, errors, isolate_errors=True
+    )
+    try:
+        while True:
+            item = _pipeline_get(fetched, stop)
+            if item is _PIPELINE_DONE:
+                break
+            record, block_trees = item
+            entry = entries[record.id]
+            bundle_dir = os.path.join(bundle_root, record.id)
+            page_metadata_file = os.path.join(bundle_root, f"{record.id}.json")
+            try:
+                if isinstance(block_trees, Exception):
+                    raise block_trees
+                os.makedirs(bundle_dir, exist_ok=True)
+                articles = build_articles(record, block_trees)
+                metadata = write_bundle(articles, bundle_dir, page_metadata_file, candidates)
+            except Exception as error:
+                entry["error"] = str(error)
+                print(f"Failed to publish {record.slug}: {error}")
+                continue
+            entry.update(metadata)
+            entry["bundle_dir"] = os.path.relpath(bundle_dir, bundle_root).replace("\\", "/")
+            entry["metadata_file"] = os.path.relpath(
+                page_metadata_file, bundle_root
+            ).replace("\\", "/")
+    finally:
+        stop.set()
+        fetch_thread.join()
+        if block_cache_enabled:
+            evict_block_cache()
+    if errors:
+        raise errors[0]
+
+    bundles = list(entries.values())
+    index = {
+        "status": status,
+        "bundles": bundles,
+        "failed": [entry["slug"] for entry in bundles if "error" in entry],
+        "queued_slugs": [item["slug"] for item in candidates],
+    }
+    if not bundles:
+        index["no_work"] = True
+    write_metadata(metadata_file, index)
+    print(f"Published {len(bundles) - len(index['failed'])} of {len(bundles)} bundles")
+    return index
+
+
+PATCH_MANIFEST = "patch.json"
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def validate_bundle_path(path):
+    """Reject manifest paths that are absolute or climb out of the bundle.
+
+    Component file names come from article titles, so any other characters
+    are allowed. Backslashes count as separators, as they do on Windows.
+    """
+    parts = path.replace("\\", "/").split("/")
+    if (
+        not path
+        or not parts[0]
+        or os.path.isabs(path)
+        or re.match(r"[A-Za-z]:", path)
+        or ".." in parts
+    ):
+        raise ValueError(f"Unsafe bundle path: {path!r}")
+    return path
+
+
+def read_bundle_manifest(metadata_file):
+    """Return {path: {"path", "sha256", "size"}} from a publish metadata file."""
+    with open(metadata_file, "r", encoding="utf-8") as source:
+        metadata = json.load(source)
+    if "files" not in metadata:
+        raise RuntimeError(
+            f"{metadata_file} has no files manifest; deploy the full bundle instead"
+        )
+    files = {}
+    for item in metadata["files"]:
+        try:
+            validate_bundle_path(item["path"])
+        except ValueError:
+            raise RuntimeError(f"Unsafe path in {metadata_file}: {item['path']!r}") from None
+        files[item["path"]] = item
+    return metadata, files
+
+
+def bundle_changes(previous_files, files):
+    """Split two manifests into added, changed and removed entries, sorted by path."""
+    added = [files[path] for path in sorted(files.keys() - previous_files.keys())]
+    changed = [
+        files[path] for path in sorted(files.keys() & previous_files.keys())
+        if (files[path]["sha256"], files[path]["size"])
+        != (previous_files[path]["sha256"], previous_files[path]["size"])
+    ]
+    removed = [previous_files[path] for path in sorted(previous_files.keys() - files.keys())]
+    return added, changed, removed
+
+
+class _HashingReader:
+    """File reader that hashes every byte read, for verifying copies against a manifest."""
+
+    def __init__(self, source):
+        self.source = source
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+
+def _check_copied(item, reader):
+    if (reader.sha256.hexdigest(), reader.size) != (item["sha256"], item["size"]):
+        raise RuntimeError(f"Bundle file changed after publish: {item['path']}")
+
+
+def write_patch_dir(bundle_dir, patch_dir, patch, entries):
+    if os.path.isdir(patch_dir) and os.listdir(patch_dir):
+        raise RuntimeError(f"Patch directory is not empty: {patch_dir}")
+    for item in entries:
+        target = os.path.join(patch_dir, *item["path"].split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(os.path.join(bundle_dir, *item["path"].split("/")), "rb") as source:
+            reader = _HashingReader(source)
+            with open(target, "wb") as copy:
+                while chunk := reader.read(COPY_CHUNK_BYTES):
+                    copy.write(chunk)
+        _check_copied(item, reader)
+    os.makedirs(patch_dir, exist_ok=True)
+    with open(os.path.join(patch_dir, PATCH_MANIFEST), "w", encoding="utf-8", newline="\n") as target:
+        json.dump(patch, target, ensure_ascii=False, indent=2)
+        target.write("\n")
+
+
+def write_patch_tar(bundle_dir, target, patch, entries):
+    """Stream the patch as a tar archive; gzip when ``target`` ends in .tgz or .tar.gz."""
+    mode = "w|gz" if target.endswith((".tgz", ".tar.gz")) else "w|"
+    stream = sys.stdout.buffer if target == "-" else open(target, "wb")
+    try:
+        with tarfile.open(fileobj=stream, mode=mode) as archive:
+            for item in entries:
+                path = os.path.join(bundle_dir, *item["path"].split("/"))
+                info = tarfile.TarInfo(item["path"])
+                info.size = item["size"]
+                info.mtime = int(os.path.getmtime(path))
+                info.mode = 0o644
+                with open(path, "rb") as source:
+                    reader = _HashingReader(source)
+                    archive.addfile(info, reader)
+                _check_copied(item, reader)
+            data = (json.dumps(patch, ensure_ascii=False, indent=2) + "\n").encode("utf-8")
+            info = tarfile.TarInfo(PATCH_MANIFEST)
+            info.size = len(data)
+            info.mode = 0o644
+            archive.addfile(info, io.BytesIO(data))
+    finally:
+        if target == "-":
+            stream.flush()
+        else:
+            stream.close()
+
+
+def diff_bundle(bundle_dir, metadata_file, previous_metadata_file, patch_dir=None, tar_file=None):
+    """Emit the files that differ from the previously deployed bundle.
+
+    Added and changed files are copied into ``patch_dir`` or streamed to
+    ``tar_file`` ("-" for stdout) together with a patch.json listing them and
+    the removed paths. Config files such as ID*.tsv and Translations.tsv are
+    part of the manifest, so their merged rows ship whenever they change.
+    """
+    if (patch_dir is None) == (tar_file is None):
+        raise RuntimeError("Pass exactly one of a patch directory or a tar file")
+    bundle_dir = os.path.abspath(bundle_dir)
+    metadata, files = read_bundle_manifest(metadata_file)
+    previous, previous_files = read_bundle_manifest(previous_metadata_file)
+    added, changed, removed = bundle_changes(previous_files, files)
+    patch = {
+        "base_bundle_sha256": previous.get("bundle_sha256"),
+        "bundle_sha256": metadata.get("bundle_sha256"),
+        "added": added,
+        "changed": changed,
+        "removed": [item["path"] for item in removed],
+    }
+    entries = added + changed
+    if patch_dir is not None:
+        write_patch_dir(bundle_dir, os.path.abspath(patch_dir), patch, entries)
+    else:
+        write_patch_tar(bundle_dir, tar_file, patch, entries)
+    log = sys.stderr if tar_file == "-" else sys.stdout
+    print(
+        f"Patch: {len(added)} added, {len(changed)} changed, {len(removed)} removed, "
+        f"{sum(item['size'] for item in entries)} of "
+        f"{sum(item['size'] for item in files.values())} bytes",
+        file=log,
+    )
+    return patch
+
+
+PUBLISHED_PROPERTIES = {"Status": {"select": {"name": "published"}}}
+
+
+def check_publish_target(page, expected_slug):
+    """Return the status of ``page`` after checking it may be marked published."""
     actual_slug = page_slug(page)
     if actual_slug != expected_slug:
         raise RuntimeError(
@@ -1090,37 +2163,524 @@ def mark_published(page_id, expected_slug):
     status_name = status_property.get("name") if status_property else ""
     if status_name not in {"publish", "published"}:
         raise RuntimeError(f"Refusing to update unexpected status {status_name!r}")
+    return status_name
 
-    if status_name != "published":
-        notion.pages.update(
-            page_id=page_id,
-            properties={"Status": {"select": {"name": "published"}}},
-        )
 
-    check = notion.pages.retrieve(page_id=page_id)
+def check_final_status(page):
     final_status = (
-        check.get("properties", {})
+        page.get("properties", {})
         .get("Status", {})
         .get("select", {})
         .get("name", "")
     )
     if final_status != "published":
         raise RuntimeError(f"Unexpected final status: {final_status!r}")
+    return final_status
+
+
+def mark_published(page_id, expected_slug):
+    validate_slug(expected_slug)
+    page = notion.pages.retrieve(page_id=page_id)
+    status_name = check_publish_target(page, expected_slug)
+
+    if status_name != "published":
+        notion.pages.update(page_id=page_id, properties=PUBLISHED_PROPERTIES)
+
+    final_status = check_final_status(notion.pages.retrieve(page_id=page_id))
     print(f"{expected_slug} status={final_status}")
 
 
-def legacy_main():
+async def mark_published_async(client, page_id, expected_slug):
+    """mark_published on an AsyncClient; returns the status the page had before."""
+    validate_slug(expected_slug)
+    page = await client.pages.retrieve(page_id=page_id)
+    status_name = check_publish_target(page, expected_slug)
+
+    if status_name != "published":
+        await client.pages.update(page_id=page_id, properties=PUBLISHED_PROPERTIES)
+
+    check_final_status(await client.pages.retrieve(page_id=page_id))
+    return status_name
+
+
+def publish_targets(metadata_file):
+    """Return (page_id, slug) pairs from a publish metadata file or --all index.
+
+    Index entries that failed to publish are left out.
+    """
+    with open(metadata_file, "r", encoding="utf-8") as source:
+        metadata = json.load(source)
+    if "bundles" in metadata:
+        return [
+            (entry["page_id"], entry["slug"])
+            for entry in metadata["bundles"] if "error" not in entry
+        ]
+    if metadata.get("no_work"):
+        return []
+    return [(metadata["page_id"], metadata["slug"])]
+
+
+def mark_published_batch(targets):
+    """Mark many (page_id, expected_slug) pairs published concurrently.
+
+    Every page gets the same checks as mark_published; the requests share the
+    rate limit and concurrency window in ncms_notion. A failure is reported in
+    that page's result and does not stop the others. Returns a summary with
+    one result per target, in input order.
+    """
+    async def mark_all(client):
+        async def mark(page_id, expected_slug):
+            result = {"page_id": page_id, "slug": expected_slug}
+            try:
+                result["previous_status"] = await mark_published_async(
+                    client, page_id, expected_slug
+                )
+                result["status"] = "published"
+            except Exception as error:
+                result["error"] = str(error)
+            return result
+
+        return await asyncio.gather(*(mark(*target) for target in targets))
+
+    targets = list(dict.fromkeys(targets))
+    results = run_async(mark_all) if targets else []
+    for result in results:
+        if "error" in result:
+            print(f"{result['slug']} failed: {result['error']}")
+        else:
+            print(f"{result['slug']} status={result['status']}")
+    return {
+        "results": results,
+        "published": sum("error" not in result for result in results),
+        "failed": [result["slug"] for result in results if "error" in result],
+    }
+
+
+# --- Pipelined rebuild ---
+# fetch -> render -> write, joined by bounded queues. Component files are
+# written while later pages are still downloading, and at most about
+# ``depth`` fetched pages plus ``depth`` rendered articles are held at once.
+
+_PIPELINE_DONE = object()
+
+
+def _pipeline_put(channel, item, stop):
+    """Put ``item`` unless another stage has failed; return False if so."""
+    while not stop.is_set():
+        try:
+            channel.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _pipeline_get(channel, stop):
+    while not stop.is_set():
+        try:
+            return channel.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _PIPELINE_DONE
+
+
+class _ChunkChannel:
+    """Bounded hand-over of one article's rendered body between two stages.
+
+    The render thread calls render() with the article's lazy fragments and
+    the writer iterates the channel. Fragments are joined into chunks of
+    about WRITE_BUFFER_BYTES, and at most ``depth`` chunks wait in between.
+    A render error is raised to the writer in place of the next chunk.
+    """
+
+    def __init__(self, depth, stop):
+        self._chunks = queue.Queue(maxsize=depth)
+        self._stop = stop
+        self._done = False
+
+    def render(self, fragments):
+        """Render ``fragments`` into the channel; return False if the pipeline stopped."""
+        buffer, size = [], 0
+        try:
+            for fragment in fragments:
+                buffer.append(fragment)
+                size += len(fragment)
+                if size >= WRITE_BUFFER_BYTES:
+                    if not _pipeline_put(self._chunks, ''.join(buffer), self._stop):
+                        return False
+                    buffer, size = [], 0
+            if buffer and not _pipeline_put(self._chunks, ''.join(buffer), self._stop):
+                return False
+        except Exception as error:
+            return _pipeline_put(self._chunks, error, self._stop)
+        return _pipeline_put(self._chunks, _PIPELINE_DONE, self._stop)
+
+    def __iter__(self):
+        while not self._done:
+            chunk = _pipeline_get(self._chunks, self._stop)
+            if chunk is _PIPELINE_DONE:
+                self._done = True
+                if self._stop.is_set():
+                    # Never let a cut-off body replace the component file.
+                    raise RuntimeError("Rebuild stopped before the page was rendered")
+            elif isinstance(chunk, Exception):
+                self._done = True
+                raise chunk
+            else:
+                yield chunk
+
+    def drain(self):
+        """Consume what the writer left unread, so render() can finish."""
+        with contextlib.suppress(Exception):
+            for _ in self:
+                pass
+
+
+def start_fetch_stage(
+    database_content, included_statuses, workers, edited_after, depth, stop, errors,
+    isolate_errors=False,
+):
+    """Start the fetch thread of a pipeline; return it and its output queue.
+
+    The thread walks the block trees of up to ``depth`` included pages at a
+    time and puts ``(record, block_trees)`` on the queue in database order,
+    then _PIPELINE_DONE. A failed walk stops the pipeline, unless
+    ``isolate_errors`` is set, in which case the exception is handed over in
+    place of the block trees.
+    """
+    included_statuses = set(included_statuses)
+    fetched = queue.Queue(maxsize=depth)
+
+    async def fetch_pages(client):
+        semaphore = fetch_semaphore(workers)
+        pages = iter(database_content)
+        pending = []
+        try:
+            while True:
+                page = await asyncio.to_thread(next, pages, None)
+                record = page and included_page(page, included_statuses)
+                if record:
+                    pending.append((record, asyncio.ensure_future(
+                        fetch_block_trees_async(
+                            client,
+                            [record.id],
+                            edited_times={record.id: record.last_edited_time},
+                            edited_after=edited_after,
+                            semaphore=semaphore,
+                        )
+                    )))
+                # Hand over finished pages in order; wait once the window is full.
+                while pending and (
+                    page is None or len(pending) >= depth or pending[0][1].done()
+                ):
+                    record, walk = pending.pop(0)
+                    try:
+                        item = (record, await walk)
+                    except Exception as error:
+                        if not isolate_errors:
+                            raise
+                        item = (record, error)
+                    if not await asyncio.to_thread(_pipeline_put, fetched, item, stop):
+                        return
+                if page is None:
+                    return
+        finally:
+            for _, walk in pending:
+                walk.cancel()
+
+    def fetch_stage():
+        try:
+            run_async(fetch_pages)
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            _pipeline_put(fetched, _PIPELINE_DONE, stop)
+
+    stage = threading.Thread(target=fetch_stage, name="ncms-fetch", daemon=True)
+    stage.start()
+    return stage, fetched
+
+
+def rebuild_pipeline(
+    database_content, included_statuses=('publish',), workers=None, edited_after=None,
+    depth=None, edited_times=None,
+):
+    """Fetch, render and write every included page as a staged pipeline.
+
+    One thread walks the block trees of up to ``depth`` (PIPELINE_DEPTH)
+    pages at a time on the asyncio fetch path and hands them over in database
+    order; a render thread turns them into articles and renders each body
+    into a _ChunkChannel; the calling thread writes each component file from
+    its channel while the next chunks are rendered. A page whose body fails
+    to render is reported and skipped like a failed write. Returns the
+    articles without their rendered content, ready for update_site_config.
+    The ``last_edited_time`` of every child page seen is appended to the
+    ``edited_times`` list when one is given.
+    """
+    depth = max(1, depth or pipeline_depth)
+    rendered = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+    fetch_thread, fetched = start_fetch_stage(
+        database_content, included_statuses, workers, edited_after, depth, stop, errors
+    )
+
+    def render_stage():
+        try:
+            while True:
+                item = _pipeline_get(fetched, stop)
+                if item is _PIPELINE_DONE:
+                    return
+                record, block_trees = item
+                if edited_times is not None:
+                    edited_times.extend(
+                        block['last_edited_time'] for block in block_trees[record.id]
+                        if block.get('type') == 'child_page' and block.get('last_edited_time')
+                    )
+                for article in build_articles(record, block_trees, edited_after, stream=True):
+                    fragments = article['content']
+                    article['content'] = channel = _ChunkChannel(depth, stop)
+                    if not _pipeline_put(rendered, article, stop):
+                        return
+                    if not channel.render(fragments):
+                        return
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            _pipeline_put(rendered, _PIPELINE_DONE, stop)
+
+    render_thread = threading.Thread(target=render_stage, name="ncms-render", daemon=True)
+    render_thread.start()
+    stages = [fetch_thread, render_thread]
+
+    articles = []
+    output_base = component_output_base()
+    written_dirs = set()
+    try:
+        while True:
+            article = _pipeline_get(rendered, stop)
+            if article is _PIPELINE_DONE:
+                break
+            write_component(article, output_base, written_dirs)
+            article.pop('content').drain()
+            articles.append(article)
+    except BaseException as error:
+        errors.append(error)
+        stop.set()
+    finally:
+        for stage in stages:
+            stage.join()
+        if block_cache_enabled:
+            evict_block_cache()
+    if errors:
+        raise errors[0]
+    return articles
+
+
+def sync_state_path(output_base):
+    return os.path.join(output_base, '.ncms_sync.json')
+
+
+def read_sync_watermark(output_base):
+    """Return the newest last_edited_time rendered by a previous rebuild."""
+    try:
+        with open(sync_state_path(output_base), 'r', encoding='utf-8') as f:
+            return json.load(f).get('last_edited_time')
+    except (OSError, ValueError):
+        return None
+
+
+def write_sync_watermark(output_base, last_edited_time):
+    os.makedirs(output_base, exist_ok=True)
+    with open(sync_state_path(output_base), 'w', encoding='utf-8', newline='\n') as f:
+        json.dump({'last_edited_time': last_edited_time}, f, indent=2)
+        f.write('\n')
+
+
+def legacy_main(incremental=False, workers=None):
     if not database_id:
         print("Error: NOTION_DATABASE_ID not set in .env")
         return 1
-    database_content = fetch_database_content(database_id)
-    articles = extract_fields(database_content)
+    output_base = output_dir or '.'
+    watermark = read_sync_watermark(output_base) if incremental else None
+    reset_output_changes()
+    if watermark:
+        print(f"Incremental rebuild: pages edited since {watermark}")
+    edited_times = []
+
+    def track_edited_times(pages):
+        for page in pages:
+            if page.last_edited_time:
+                edited_times.append(page.last_edited_time)
+            yield page
+
+    # Every published row is queried: an edit inside a translation child page
+    # does not change its base page's last_edited_time. Staleness is decided
+    # per page and per child page instead, mostly from the block cache.
+    database_content = iter_database_content(database_id)
+    articles = rebuild_pipeline(
+        track_edited_times(database_content), workers=workers, edited_after=watermark,
+        edited_times=edited_times,
+    )
     write_ids_tsv(articles)
-    transform_to_php(articles)
+    update_site_config(articles, merge_config=bool(watermark))
+    if edited_times:
+        write_sync_watermark(output_base, max(edited_times, key=parse_notion_time))
     print(f"Processed {len(articles)} articles")
     return 0
 
 
+# --- Worker process ---
+# ``serve`` keeps one process warm: imports, the Notion clients and their
+# connection pools, the property id cache and the concurrency window all
+# survive between jobs. Each job is one CLI invocation sent by ncms_client.py
+# over a Unix domain socket as a JSON line {"argv": [...], "cwd": "..."}.
+# Output comes back as {"stdout": text} / {"stderr": text} lines while the
+# job runs, then {"exit": code}. Binary output written to sys.stdout.buffer,
+# such as ``diff --tar -``, comes back base64-encoded as {"stdout_bytes": ...}
+# lines in the same order. Jobs run one at a time because the CLI
+# commands switch module settings such as output_dir.
+
+SERVE_COMMANDS = ("publish", "mark-published", "diff", "rebuild")
+# Settings a job may change; restored after every job.
+JOB_SETTINGS = (
+    "output_dir", "project_dir", "git_push_enabled", "notion_update_enabled",
+    "block_cache_enabled",
+)
+
+
+class _JobBytes(io.RawIOBase):
+    """Binary stream that forwards writes to the client as base64 JSON lines."""
+
+    def __init__(self, name, send):
+        self.name = name
+        self.send = send
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if data:
+            self.send({self.name: base64.b64encode(data).decode("ascii")})
+        return len(data)
+
+
+class _JobStream(io.TextIOBase):
+    """Text stream that forwards writes to the client as JSON lines."""
+
+    def __init__(self, name, send):
+        self.name = name
+        self.send = send
+        self.buffer = _JobBytes(f"{name}_bytes", send)
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text:
+            self.send({self.name: text})
+        return len(text)
+
+
+def run_job(argv, cwd, stdout, stderr):
+    """Run one CLI invocation in this process, as ``python ncms_fetch.py argv``."""
+    settings = {name: globals()[name] for name in JOB_SETTINGS}
+    previous_cwd = os.getcwd()
+    ncms_notion.reset_stats()
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                if not argv or argv[0] not in SERVE_COMMANDS:
+                    raise RuntimeError(
+                        f"serve accepts {', '.join(SERVE_COMMANDS)}; got {argv[:1]}"
+                    )
+                os.chdir(cwd)
+                return main(argv)
+            except SystemExit as error:
+                code = error.code
+                return code if isinstance(code, int) else (0 if code is None else 1)
+            except Exception as error:
+                print(f"NCMS error: {error}", file=sys.stderr)
+                return 1
+    finally:
+        os.chdir(previous_cwd)
+        globals().update(settings)
+
+
+class ServeHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        send_lock = threading.Lock()
+        connected = True
+
+        def send(message):
+            # A client that hangs up does not abort the job half way.
+            nonlocal connected
+            data = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+            with send_lock:
+                if not connected:
+                    return
+                try:
+                    self.wfile.write(data)
+                    self.wfile.flush()
+                except OSError:
+                    connected = False
+
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+            argv = [str(arg) for arg in request["argv"]]
+            cwd = request.get("cwd") or os.getcwd()
+        except (ValueError, KeyError, TypeError) as error:
+            send({"stderr": f"NCMS error: bad request: {error}\n"})
+            send({"exit": 2})
+            return
+        code = run_job(argv, cwd, _JobStream("stdout", send), _JobStream("stderr", send))
+        send({"exit": code})
+
+
+def serve(socket_path, ready=None):
+    """Accept jobs on ``socket_path`` until interrupted."""
+    global _service
+
+    if not hasattr(socketserver, "UnixStreamServer"):
+        raise RuntimeError("serve needs Unix domain sockets, which this platform lacks")
+    socket_path = os.path.abspath(socket_path)
+    if os.path.exists(socket_path):
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            raise RuntimeError(f"Refusing to replace non-socket file: {socket_path}")
+        os.unlink(socket_path)
+
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, name="ncms-serve-loop", daemon=True)
+    loop_thread.start()
+
+    async def open_client():
+        return await ncms_notion.create_async_client().__aenter__()
+
+    client = asyncio.run_coroutine_threadsafe(open_client(), loop).result()
+    _service = (loop, client)
+    try:
+        with socketserver.UnixStreamServer(socket_path, ServeHandler) as server:
+            os.chmod(socket_path, 0o600)
+            print(f"NCMS worker listening on {socket_path}")
+            if ready is not None:
+                ready(server)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    finally:
+        _service = None
+        asyncio.run_coroutine_threadsafe(client.__aexit__(None, None, None), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join()
+        loop.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+    return 0
+
+
 def build_parser():
     parser = argparse.ArgumentParser(description="Publish Notion content through NCMS")
     subparsers = parser.add_subparsers(dest="command")
@@ -1130,22 +2690,109 @@ def build_parser():
         help="Render exactly one queued Notion page into an isolated bundle",
     )
     publish_parser.add_argument("--status", default="publish")
-    publish_parser.add_argument("--slug")
+    publish_target = publish_parser.add_mutually_exclusive_group()
+    publish_target.add_argument("--slug")
+    publish_target.add_argument(
+        "--all",
+        action="store_true",
+        help="Render every queued page into BUNDLE_DIR/<page_id>/ and write a "
+             "combined index to METADATA_FILE",
+    )
     publish_parser.add_argument("--allow-empty", action="store_true")
     publish_parser.add_argument("--bundle-dir", required=True)
     publish_parser.add_argument("--metadata-file", required=True)
+    publish_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Concurrent Notion block fetches (default: FETCH_WORKERS or adaptive)",
+    )
+    publish_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore and do not update the on-disk block cache",
+    )
+
+    rebuild_parser = subparsers.add_parser(
+        "rebuild",
+        help="Render every queued Notion page into OUTPUT_DIR (the default command)",
+    )
+    rebuild_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only render pages and translations edited since the last rebuild",
+    )
+    rebuild_parser.add_argument("--workers", type=int)
+    rebuild_parser.add_argument("--no-cache", action="store_true")
+
+    diff_parser = subparsers.add_parser(
+        "diff",
+        help="Emit only the files that changed since a previously deployed bundle",
+    )
+    diff_parser.add_argument("--bundle-dir", required=True)
+    diff_parser.add_argument("--metadata-file", required=True)
+    diff_parser.add_argument(
+        "--previous-metadata-file",
+        required=True,
+        help="Metadata file of the bundle currently deployed",
+    )
+    diff_target = diff_parser.add_mutually_exclusive_group(required=True)
+    diff_target.add_argument("--patch-dir", help="Empty directory to copy the patch into")
+    diff_target.add_argument(
+        "--tar", help="Tar file to write, - for stdout; .tgz or .tar.gz is gzipped"
+    )
 
     mark_parser = subparsers.add_parser(
         "mark-published",
         help="Mark a verified Notion page as published",
     )
-    mark_parser.add_argument("--page-id", required=True)
-    mark_parser.add_argument("--expected-slug", required=True)
+    mark_parser.add_argument("--page-id")
+    mark_parser.add_argument("--expected-slug")
+    mark_parser.add_argument(
+        "--page",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("PAGE_ID", "EXPECTED_SLUG"),
+        help="Add a page to a batch; may be repeated",
+    )
+    mark_parser.add_argument(
+        "--from-metadata",
+        action="append",
+        default=[],
+        metavar="METADATA_FILE",
+        help="Add the pages of a publish metadata file or publish --all index",
+    )
+    mark_parser.add_argument("--summary-file", help="Also write the batch summary here")
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Keep a warm worker that runs publish and mark-published jobs from ncms_client.py",
+    )
+    serve_parser.add_argument(
+        "--socket",
+        default=os.getenv("NCMS_SOCKET", ".ncms.sock"),
+        help="Unix domain socket to listen on (default: NCMS_SOCKET or .ncms.sock)",
+    )
     return parser
 
 
 def main(argv=None):
+    global block_cache_enabled
+
     args = build_parser().parse_args(argv)
+    if args.command in ("publish", "rebuild") and args.no_cache:
+        block_cache_enabled = False
+    if args.command == "publish" and args.all:
+        index = publish_all(
+            status=args.status,
+            bundle_root=args.bundle_dir,
+            metadata_file=args.metadata_file,
+            allow_empty=args.allow_empty,
+            workers=args.workers,
+        )
+        print("NCMS_RESULT=" + json.dumps(index, ensure_ascii=True))
+        print(ncms_notion.format_stats())
+        return 1 if index["failed"] else 0
     if args.command == "publish":
         publish_to_bundle(
             status=args.status,
@@ -1153,12 +2800,46 @@ def main(argv=None):
             bundle_dir=args.bundle_dir,
             metadata_file=args.metadata_file,
             allow_empty=args.allow_empty,
+            workers=args.workers,
         )
+        print(ncms_notion.format_stats())
         return 0
-    if args.command == "mark-published":
-        mark_published(args.page_id, args.expected_slug)
+    if args.command == "serve":
+        return serve(args.socket)
+    if args.command == "diff":
+        diff_bundle(
+            args.bundle_dir,
+            args.metadata_file,
+            args.previous_metadata_file,
+            patch_dir=args.patch_dir,
+            tar_file=args.tar,
+        )
         return 0
-    return legacy_main()
+    if args.command == "mark-published":
+        if (args.page_id is None) != (args.expected_slug is None):
+            raise RuntimeError("--page-id and --expected-slug must be passed together")
+        if not args.page and not args.from_metadata and not args.summary_file:
+            if args.page_id is None:
+                raise RuntimeError("Pass --page-id, --page or --from-metadata")
+            mark_published(args.page_id, args.expected_slug)
+            return 0
+        targets = [tuple(page) for page in args.page]
+        if args.page_id is not None:
+            targets.insert(0, (args.page_id, args.expected_slug))
+        for metadata_file in args.from_metadata:
+            targets.extend(publish_targets(metadata_file))
+        summary = mark_published_batch(targets)
+        if args.summary_file:
+            write_metadata(args.summary_file, summary)
+        print("NCMS_RESULT=" + json.dumps(summary, ensure_ascii=True))
+        print(ncms_notion.format_stats())
+        return 1 if summary["failed"] else 0
+    if args.command == "rebuild":
+        result = legacy_main(incremental=args.incremental, workers=args.workers)
+    else:
+        result = legacy_main()
+    print(ncms_notion.format_stats())
+    return result
 
 if __name__ == "__main__":
     try:
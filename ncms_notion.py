@@ -0,0 +1,514 @@
+"""
+ncms_notion.py — Shared Notion client construction and rate limiting.
+
+Every NCMS script creates its Notion clients here so that all requests pass
+through one token bucket (Notion allows an average of three requests per
+second, with short bursts) and are retried with exponential backoff on 429
+and 5xx responses, honouring Retry-After.
+
+The bucket's state is kept in a locked file so that concurrent NCMS
+processes on the same machine using the same integration token share one
+budget instead of each spending the full rate.
+
+How many requests a process keeps in flight is adapted at run time (AIMD):
+the window grows by about one request per round trip while latency stays
+under target and is halved when Notion answers 429.
+
+Environment:
+    NOTION_RATE_LIMIT       Average requests per second (default 3)
+    NOTION_RATE_BURST       Requests allowed back to back before throttling (default 10)
+    NOTION_MAX_RETRIES      Retries per request on 429/5xx/timeouts (default 5)
+    NOTION_RATE_LIMIT_FILE  Shared bucket state file (default: one per token in the
+                            temp directory; "none" keeps the bucket per process)
+    NOTION_CONCURRENCY      Initial in-flight request window (default 2)
+    NOTION_MAX_CONCURRENCY  Upper bound of the window (default 8)
+    NOTION_LATENCY_TARGET   Mean latency in seconds above which the window stops
+                            growing (default 3)
+"""
+
+import asyncio
+import collections
+import hashlib
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# notion_client (and httpx under it) is imported by _define_clients when the
+# first client is created, so importing an NCMS script stays cheap.
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket that hands out reservations.
+
+    ``reserve()`` always takes a token, letting the balance go negative, and
+    returns how long the caller must wait before using it. Concurrent callers
+    are therefore spaced out at ``rate`` per second instead of all waking at
+    once when a token becomes available.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+if os.name == 'nt':
+    def lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue  # LK_LOCK gives up after ~10 seconds; keep waiting.
+
+    def unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    def lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class SharedTokenBucket:
+    """Token bucket whose balance lives in a file shared by local processes.
+
+    Same reservation semantics as TokenBucket, but every reservation locks the
+    state file, refills from the wall clock and writes the new balance back,
+    so the combined request rate of all processes stays within ``rate``.
+    """
+
+    RECORD = struct.Struct('<dd')  # tokens, updated (time.time())
+
+    def __init__(self, path, rate, burst):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._file = os.fdopen(fd, 'r+b', buffering=0)
+        return self._file
+
+    def reserve(self):
+        with self._lock:
+            f = self._open()
+            lock_file(f)
+            try:
+                f.seek(0)
+                data = f.read(self.RECORD.size)
+                now = time.time()
+                if len(data) == self.RECORD.size:
+                    tokens, updated = self.RECORD.unpack(data)
+                else:
+                    tokens, updated = self.burst, now
+                tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+                tokens -= 1
+                f.seek(0)
+                f.write(self.RECORD.pack(tokens, now))
+            finally:
+                unlock_file(f)
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ConcurrencyController:
+    """Additive-increase, multiplicative-decrease limit on in-flight requests.
+
+    Each successful request under the latency target adds ``1 / window``, so
+    the window grows by about one per round trip. A throttled request halves
+    it, at most once per mean latency so one burst of 429s from requests that
+    were already in flight counts as a single signal. Sync callers block on a
+    condition; async callers await a future resolved on release.
+    """
+
+    DECREASE_FACTOR = 0.5
+    LATENCY_SMOOTHING = 0.2
+
+    def __init__(self, initial, maximum, latency_target, minimum=1):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.window = float(min(self.maximum, max(minimum, initial)))
+        self.latency_target = latency_target
+        self.latency = None
+        self.in_flight = 0
+        self.peak_window = self.window
+        self.decreases = 0
+        self._last_decrease = float('-inf')
+        self._cond = threading.Condition()
+        self._async_waiters = collections.deque()
+
+    def _has_slot(self):
+        return self.in_flight < int(self.window)
+
+    def acquire(self):
+        with self._cond:
+            while not self._has_slot():
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        while True:
+            with self._cond:
+                if self._has_slot():
+                    self.in_flight += 1
+                    return
+                loop = asyncio.get_running_loop()
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, latency=None, throttled=False):
+        """Free a slot and feed the request's outcome back into the window."""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease >= (self.latency or 0.0):
+                    self.window = max(self.minimum, self.window * self.DECREASE_FACTOR)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif latency is not None:
+                if self.latency is None:
+                    self.latency = latency
+                else:
+                    self.latency += self.LATENCY_SMOOTHING * (latency - self.latency)
+                if self.latency <= self.latency_target:
+                    self.window = min(self.maximum, self.window + 1.0 / self.window)
+                    self.peak_window = max(self.peak_window, self.window)
+            self._cond.notify_all()
+            while self._async_waiters:
+                loop, waiter = self._async_waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_wake_waiter, waiter)
+                except RuntimeError:
+                    pass  # The waiter's event loop has already closed.
+
+    def summary(self):
+        with self._cond:
+            latency = f"{self.latency * 1000:.0f} ms" if self.latency is not None else "n/a"
+            return (
+                f"concurrency window {self.window:.1f} (peak {self.peak_window:.1f}, "
+                f"max {self.maximum}, {self.decreases} cuts), mean latency {latency}"
+            )
+
+
+def _wake_waiter(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+# --- Counters ---
+
+_stats_lock = threading.Lock()
+stats = {'requests': 0, 'retries': 0, 'throttled_seconds': 0.0, 'backoff_seconds': 0.0}
+
+
+def record(**increments):
+    with _stats_lock:
+        for key, value in increments.items():
+            stats[key] += value
+
+
+def reset_stats():
+    with _stats_lock:
+        for key in stats:
+            stats[key] = type(stats[key])()
+
+
+def format_stats():
+    """One-line run summary of Notion API usage."""
+    with _stats_lock:
+        line = (
+            f"Notion API: {stats['requests']} requests, {stats['retries']} retries, "
+            f"{stats['throttled_seconds']:.1f}s throttled, "
+            f"{stats['backoff_seconds']:.1f}s backing off"
+        )
+    if _concurrency is not None:
+        line += f", {_concurrency.summary()}"
+    return line
+
+
+# --- Rate limiting and retry policy ---
+
+_rate_limiter = None
+_concurrency = None
+
+
+def rate_limit_file():
+    """Return the shared bucket path for this integration token, or None."""
+    path = os.getenv('NOTION_RATE_LIMIT_FILE')
+    if path is None:
+        token = os.getenv('NOTION_API_KEY') or ''
+        digest = hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(tempfile.gettempdir(), f'ncms-notion-{digest}.bucket')
+    if path.strip().lower() in ('', 'none', 'off'):
+        return None
+    return path
+
+
+def get_rate_limiter():
+    """Return the process-wide token bucket, configured on first use."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        rate = float(os.getenv('NOTION_RATE_LIMIT', '3'))
+        burst = float(os.getenv('NOTION_RATE_BURST', '10'))
+        path = rate_limit_file()
+        if path:
+            _rate_limiter = SharedTokenBucket(path, rate, burst)
+        else:
+            _rate_limiter = TokenBucket(rate, burst)
+    return _rate_limiter
+
+
+def get_concurrency():
+    """Return the process-wide AIMD controller, configured on first use."""
+    global _concurrency
+    if _concurrency is None:
+        _concurrency = ConcurrencyController(
+            initial=int(os.getenv('NOTION_CONCURRENCY', '2')),
+            maximum=int(os.getenv('NOTION_MAX_CONCURRENCY', '8')),
+            latency_target=float(os.getenv('NOTION_LATENCY_TARGET', '3')),
+        )
+    return _concurrency
+
+
+def max_retries():
+    return int(os.getenv('NOTION_MAX_RETRIES', '5'))
+
+
+def is_idempotent(path, method):
+    """Return False for requests that must not be replayed after a 5xx.
+
+    Appending children (PATCH blocks/{id}/children) and creating pages may
+    have been applied before the server failed; replaying them duplicates
+    content. Everything else NCMS sends is a read or an absolute update.
+    """
+    method = method.upper()
+    if method == 'PATCH' and path.rstrip('/').endswith('/children'):
+        return False
+    if method == 'POST' and path.strip('/') == 'pages':
+        return False
+    return True
+
+
+def retry_delay(error, attempt, path, method):
+    """Return seconds to wait before retrying ``error``, or None to give up."""
+    from notion_client.errors import HTTPResponseError
+
+    if attempt >= max_retries():
+        return None
+    status = getattr(error, 'status', None)
+    if isinstance(error, HTTPResponseError) and status not in RETRY_STATUSES:
+        return None
+    if status != 429 and not is_idempotent(path, method):
+        return None
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+    delay *= random.uniform(0.5, 1.0)
+    headers = getattr(error, 'headers', None)
+    retry_after = headers.get('Retry-After') if headers is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+def _define_clients():
+    """Define RateLimitedClient and RateLimitedAsyncClient on first use."""
+    global RateLimitedClient, RateLimitedAsyncClient
+    with _clients_lock:
+        if RateLimitedClient is None:
+            RateLimitedClient, RateLimitedAsyncClient = _client_classes()
+
+
+def _client_classes():
+    from notion_client import AsyncClient, Client
+    from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+    class RateLimitedClient(Client):
+        """Synchronous Notion client that throttles and retries every request."""
+
+        def request(self, path, method, query=None, body=None, auth=None):
+            attempt = 0
+            concurrency = get_concurrency()
+            while True:
+                concurrency.acquire()
+                latency = None
+                throttled = False
+                try:
+                    wait = get_rate_limiter().reserve()
+                    if wait:
+                        record(throttled_seconds=wait)
+                        time.sleep(wait)
+                    record(requests=1)
+                    started = time.monotonic()
+                    result = super().request(path, method, query, body, auth)
+                    latency = time.monotonic() - started
+                    return result
+                except (HTTPResponseError, RequestTimeoutError) as error:
+                    throttled = getattr(error, 'status', None) == 429
+                    delay = retry_delay(error, attempt, path, method)
+                    if delay is None:
+                        raise
+                finally:
+                    concurrency.release(latency, throttled)
+                record(retries=1, backoff_seconds=delay)
+                time.sleep(delay)
+                attempt += 1
+
+
+    class RateLimitedAsyncClient(AsyncClient):
+        """Asynchronous Notion client sharing the same token bucket and policy."""
+
+        async def request(self, path, method, query=None, body=None, auth=None):
+            attempt = 0
+            concurrency = get_concurrency()
+            while True:
+                await concurrency.acquire_async()
+                latency = None
+                throttled = False
+                try:
+                    wait = get_rate_limiter().reserve()
+                    if wait:
+                        record(throttled_seconds=wait)
+                        await asyncio.sleep(wait)
+                    record(requests=1)
+                    started = time.monotonic()
+                    result = await super().request(path, method, query, body, auth)
+                    latency = time.monotonic() - started
+                    return result
+                except (HTTPResponseError, RequestTimeoutError) as error:
+                    throttled = getattr(error, 'status', None) == 429
+                    delay = retry_delay(error, attempt, path, method)
+                    if delay is None:
+                        raise
+                finally:
+                    concurrency.release(latency, throttled)
+                record(retries=1, backoff_seconds=delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    return RateLimitedClient, RateLimitedAsyncClient
+
+
+RateLimitedClient = None
+RateLimitedAsyncClient = None
+_clients_lock = threading.Lock()
+
+
+class LazyClient:
+    """Module-level client that is constructed on first attribute access.
+
+    Scripts keep ``notion = ncms_notion.LazyClient()`` at module level, so
+    commands and tests that never talk to Notion do not import notion_client
+    or open a connection pool.
+    """
+
+    def __init__(self, factory=None):
+        self._factory = factory or create_client
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get_client(), name)
+
+
+# --- Pagination ---
+
+def iter_paginated(method, **kwargs):
+    """Yield every result of a paginated endpoint as each cursor page arrives.
+
+    ``method`` is a sync client call such as ``notion.databases.query``. The
+    next cursor page is requested on a background thread while the caller
+    works through the current one.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        response = method(**kwargs)
+        while True:
+            upcoming = None
+            if response.get('has_more') and response.get('next_cursor'):
+                upcoming = executor.submit(
+                    method, **kwargs, start_cursor=response['next_cursor']
+                )
+            yield from response.get('results', [])
+            if upcoming is None:
+                return
+            response = upcoming.result()
+
+
+async def aiter_paginated(method, **kwargs):
+    """Async counterpart of iter_paginated for AsyncClient calls."""
+    response = await method(**kwargs)
+    while True:
+        upcoming = None
+        if response.get('has_more') and response.get('next_cursor'):
+            upcoming = asyncio.ensure_future(
+                method(**kwargs, start_cursor=response['next_cursor'])
+            )
+        try:
+            for result in response.get('results', []):
+                yield result
+        except BaseException:
+            # The consumer stopped early (aclose or cancellation).
+            if upcoming is not None:
+                upcoming.cancel()
+            raise
+        if upcoming is None:
+            return
+        response = await upcoming
+
+
+def create_client(**kwargs):
+    _define_clients()
+    return RateLimitedClient(auth=os.getenv('NOTION_API_KEY'), **kwargs)
+
+
+def create_async_client(**kwargs):
+    _define_clients()
+    return RateLimitedAsyncClient(auth=os.getenv('NOTION_API_KEY'), **kwargs)
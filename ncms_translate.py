@@ -14,13 +14,12 @@ Prerequisites:
 """
 import sys
 import os
-from notion_client import Client
 from dotenv import load_dotenv
 
-sys.stdout.reconfigure(encoding='utf-8')
+import ncms_notion
 
 load_dotenv()
-notion = Client(auth=os.getenv('NOTION_API_KEY'))
+notion = ncms_notion.LazyClient()
 database_id = os.getenv('NOTION_DATABASE_ID')
 
 SUPPORTED_LANGUAGES = {'hi': 'Hindi', 'hi-in': 'Hindi (India)'}
@@ -59,33 +58,22 @@ def translate_text(text, target_lang):
 # --- Notion helpers ---
 
 def fetch_english_articles(slug_filter=None):
-    """Fetch published English articles from Notion."""
-    results = []
-    has_more = True
-    start_cursor = None
-    while has_more:
-        query_filter = {
-            "and": [
-                {"property": "Status", "select": {"equals": "published"}},
-                {"or": [
-                    {"property": "Language", "select": {"equals": "en"}},
-                    {"property": "Language", "select": {"is_empty": True}}
-                ]}
-            ]
-        }
-        response = notion.databases.query(
-            database_id=database_id,
-            filter=query_filter,
-            start_cursor=start_cursor
-        )
-        results.extend(response.get('results', []))
-        has_more = response.get('has_more', False)
-        start_cursor = response.get('next_cursor')
-
-    if slug_filter:
-        results = [p for p in results
-                   if p['properties'].get('Id', {}).get('title', [{}])[0].get('plain_text') == slug_filter]
-    return results
+    """Yield published English articles from Notion as they arrive."""
+    query_filter = {
+        "and": [
+            {"property": "Status", "select": {"equals": "published"}},
+            {"or": [
+                {"property": "Language", "select": {"equals": "en"}},
+                {"property": "Language", "select": {"is_empty": True}}
+            ]}
+        ]
+    }
+    for page in ncms_notion.iter_paginated(
+        notion.databases.query, database_id=database_id, filter=query_filter
+    ):
+        if slug_filter and page['properties'].get('Id', {}).get('title', [{}])[0].get('plain_text') != slug_filter:
+            continue
+        yield page
 
 def translation_exists(slug, target_lang):
     """Check if a translation page already exists."""
@@ -101,19 +89,8 @@ def translation_exists(slug, target_lang):
     return len(response.get('results', [])) > 0
 
 def fetch_blocks(page_id):
-    """Fetch all blocks from a page."""
-    blocks = []
-    has_more = True
-    start_cursor = None
-    while has_more:
-        kwargs = {'block_id': page_id}
-        if start_cursor:
-            kwargs['start_cursor'] = start_cursor
-        response = notion.blocks.children.list(**kwargs)
-        blocks.extend(response['results'])
-        has_more = response.get('has_more', False)
-        start_cursor = response.get('next_cursor')
-    return blocks
+    """Yield all blocks of a page as each cursor page arrives."""
+    return ncms_notion.iter_paginated(notion.blocks.children.list, block_id=page_id)
 
 # --- Block translation ---
 
@@ -280,13 +257,11 @@ def main():
         print(f"Filtering to slug: {slug_filter}")
     print()
 
-    pages = fetch_english_articles(slug_filter)
-    print(f"Found {len(pages)} English articles to translate\n")
-
     translated_count = 0
     skipped_count = 0
 
-    for page in pages:
+    # Articles are translated while later cursor pages are still downloading.
+    for page in fetch_english_articles(slug_filter):
         slug = page['properties']['Id']['title'][0]['plain_text']
         print(f"Processing: {slug}")
 
@@ -296,9 +271,8 @@ def main():
             continue
 
         # Fetch and translate blocks
-        blocks = fetch_blocks(page['id'])
         translated_blocks = []
-        for block in blocks:
+        for block in fetch_blocks(page['id']):
             tb = translate_block(block, target_lang)
             if tb:
                 translated_blocks.append(tb)
@@ -313,7 +287,10 @@ def main():
 
         translated_count += 1
 
-    print(f"\nDone: {translated_count} translated, {skipped_count} skipped")
+    print(f"\nDone: {translated_count + skipped_count} English articles, "
+          f"{translated_count} translated, {skipped_count} skipped")
+    print(ncms_notion.format_stats())
 
 if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
     main()
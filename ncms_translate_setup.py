@@ -11,28 +11,22 @@ Prerequisites:
 """
 import sys
 import os
-from notion_client import Client
 from dotenv import load_dotenv
 
-sys.stdout.reconfigure(encoding='utf-8')
+import ncms_notion
 
 load_dotenv()
-notion = Client(auth=os.getenv('NOTION_API_KEY'))
+notion = ncms_notion.LazyClient()
 database_id = os.getenv('NOTION_DATABASE_ID')
 
 def fetch_all_pages():
-    results = []
-    has_more = True
-    start_cursor = None
-    while has_more:
-        response = notion.databases.query(
-            database_id=database_id,
-            start_cursor=start_cursor
-        )
-        results.extend(response.get('results', []))
-        has_more = response.get('has_more', False)
-        start_cursor = response.get('next_cursor', None)
-    return results
+    """Return every database page.
+
+    The query runs to the end before main() updates anything: an update
+    changes the row's last_edited_time and can move it under a live cursor
+    of this unsorted query, so rows would be skipped or returned twice.
+    """
+    return list(ncms_notion.iter_paginated(notion.databases.query, database_id=database_id))
 
 def get_slug(page):
     props = page['properties']
@@ -59,13 +53,12 @@ def main():
     if dry_run:
         print("DRY RUN — pass --apply to make changes\n")
 
-    pages = fetch_all_pages()
-    print(f"Found {len(pages)} pages\n")
-
+    found = 0
     updated = 0
     skipped = 0
 
-    for page in pages:
+    for page in fetch_all_pages():
+        found += 1
         slug = get_slug(page)
         current_lang = get_language(page)
         current_group = get_translation_group(page)
@@ -104,7 +97,10 @@ def main():
         else:
             updated += 1
 
-    print(f"\n{'Would update' if dry_run else 'Updated'}: {updated}, Already set: {skipped}")
+    print(f"\nFound {found} pages")
+    print(f"{'Would update' if dry_run else 'Updated'}: {updated}, Already set: {skipped}")
+    print(ncms_notion.format_stats())
 
 if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
     main()
@@ -10,20 +10,35 @@ Usage:
     python ncms_upload.py about            # Upload a single article by slug
     python ncms_upload.py --dry-run        # Parse and show blocks without uploading
     python ncms_upload.py --dry-run about  # Dry-run a single article
+    python ncms_upload.py --sync about     # Change only the blocks that differ
+    python ncms_upload.py --no-sanitize    # Skip rejected blocks without retrying them cleaned
+    python ncms_upload.py --jobs 8         # Parse files in 8 processes (0: one per CPU)
+    python ncms_upload.py --parser fast    # Parse without BeautifulSoup (falls back per file)
+    python ncms_upload.py --check-parser   # Compare both parsers on every component file
+
+Blocks Notion rejects are found by bisecting the failed append, retried once
+sanitized and otherwise skipped; the run ends with an NCMS_UPLOAD_REPORT=
+JSON line listing them per article.
 """
 
 import os
 import re
 import sys
+import collections
+import importlib
+import itertools
 import json
 import time
+import types
 import base64
 import html as html_module
-from bs4 import BeautifulSoup, NavigableString, Tag
-from notion_client import Client
+from html.entities import html5 as html_entities
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from difflib import SequenceMatcher
 from dotenv import load_dotenv
 
-sys.stdout.reconfigure(encoding='utf-8')
+import ncms_notion
+
 
 # --- Config ---
 
@@ -31,7 +46,7 @@ COMPONENT_DIR = r'H:\Website\site\project\root\HTML\Component'
 TSV_PATH = r'H:\Website\site\project\config\ID.tsv'
 
 load_dotenv()
-notion = Client(auth=os.getenv('NOTION_API_KEY'))
+notion = ncms_notion.LazyClient()
 database_id = os.getenv('NOTION_DATABASE_ID')
 
 # Boilerplate PHP patterns to skip entirely
@@ -89,19 +104,12 @@ def read_tsv_slugs():
 
 def fetch_all_notion_pages():
     """Query the entire database (no filter) to get slug → page_id."""
-    results = []
-    has_more = True
-    start_cursor = None
-    while has_more:
-        kwargs = {'database_id': database_id}
-        if start_cursor:
-            kwargs['start_cursor'] = start_cursor
-        response = notion.databases.query(**kwargs)
-        results.extend(response.get('results', []))
-        has_more = response.get('has_more', False)
-        start_cursor = response.get('next_cursor')
     page_map = {}
-    for page in results:
+    # Only the title property (id "title") is needed for the map.
+    pages = ncms_notion.iter_paginated(
+        notion.databases.query, database_id=database_id, filter_properties=['title']
+    )
+    for page in pages:
         props = page['properties']
         title_prop = props.get('Id', {}).get('title', [])
         if title_prop:
@@ -145,8 +153,46 @@ def make_text(content, annotations=None, link=None):
     return rt
 
 
+SOURCE_LINE_BREAK = re.compile(r'[\r\n]+[ \t]*')
+
+
+def text_node_rich_text(text, annotations, link):
+    """Rich text for one source text node, or None when it is only whitespace."""
+    # HTML source indentation is formatting, not article content. Keeping
+    # it next to a <br> produces doubled Notion newlines on round-trip.
+    if '\n' in text or '\r' in text:
+        leading = SOURCE_LINE_BREAK.match(text)
+        if leading:
+            text = text[leading.end():]
+        text = SOURCE_LINE_BREAK.sub(' ', text)
+    if not text.strip():
+        return None
+    # Check if this is a PHP marker
+    if text.strip().startswith('%%PHP_'):
+        # This shouldn't happen in well-structured content
+        return make_text(text.strip(), annotations, link)
+    return make_text(text, annotations, link)
+
+
+def inline_php_rich_text(php_code, annotations, link):
+    """Rich text for a PHP tag inside a paragraph, heading or list item."""
+    # Check if it's link_xurl
+    m = re.match(r"<\?php\s+link_xurl\(\s*'([^']+)'\s*,\s*'([^']+)'\s*\)\s*\?>", php_code)
+    if m:
+        path, label = m.group(1), m.group(2)
+        url = '/' + path if not path.startswith('/') else path
+        return make_text(label, annotations, url)
+    # Check for echo $desc
+    if 'echo $desc' in php_code:
+        return None  # skip, part of cover pattern
+    # Other inline PHP — render as code
+    return make_text(php_code.strip(), {**annotations, 'code': True}, link)
+
+
 def element_to_rich_text(element):
     """Recursively convert a BS4 element's children into Notion rich_text array."""
+    from bs4 import NavigableString, Tag
+
     rich_text = []
 
     def walk(node, annotations=None, link=None):
@@ -154,24 +200,9 @@ def element_to_rich_text(element):
             annotations = {}
 
         if isinstance(node, NavigableString):
-            text = str(node)
-            # HTML source indentation is formatting, not article content. Keeping
-            # it next to a <br> produces doubled Notion newlines on round-trip.
-            text = re.sub(r'^[\r\n]+[ \t]*', '', text)
-            text = re.sub(r'[\r\n]+[ \t]*', ' ', text)
-            if not text.strip():
-                return
-            # Check if this is a PHP marker
-            if text.strip().startswith('%%PHP_'):
-                # This shouldn't happen in well-structured content
-                rt = make_text(text.strip(), annotations, link)
-                if rt:
-                    rich_text.append(rt)
-                return
-            if text:
-                rt = make_text(text, annotations, link)
-                if rt:
-                    rich_text.append(rt)
+            rt = text_node_rich_text(str(node), annotations, link)
+            if rt:
+                rich_text.append(rt)
             return
 
         if not isinstance(node, Tag):
@@ -190,20 +221,7 @@ def element_to_rich_text(element):
             php_code = node.get('data-code', '')
             if php_code:
                 php_code = base64.b64decode(php_code).decode('utf-8')
-            # Check if it's link_xurl
-            m = re.match(r"<\?php\s+link_xurl\(\s*'([^']+)'\s*,\s*'([^']+)'\s*\)\s*\?>", php_code)
-            if m:
-                path, label = m.group(1), m.group(2)
-                url = '/' + path if not path.startswith('/') else path
-                rt = make_text(label, annotations, url)
-                if rt:
-                    rich_text.append(rt)
-                return
-            # Check for echo $desc
-            if 'echo $desc' in php_code:
-                return  # skip, part of cover pattern
-            # Other inline PHP — render as code
-            rt = make_text(php_code.strip(), {**annotations, 'code': True}, link)
+            rt = inline_php_rich_text(php_code, annotations, link)
             if rt:
                 rich_text.append(rt)
             return
@@ -539,10 +557,28 @@ def classify_php_block(php_code):
 
 # --- Main parser ---
 
-def parse_file_to_blocks(file_path):
-    """Parse a PHP/HTML file and return a list of Notion block objects."""
+PARSERS = ('bs4', 'fast')
+
+
+def parse_file_to_blocks(file_path, parser='bs4'):
+    """Parse a PHP/HTML file and return a list of Notion block objects.
+
+    ``parser`` is 'bs4' (BeautifulSoup) or 'fast' (parse_markup_fast, which
+    hands markup outside its subset back to BeautifulSoup).
+    """
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
+    if parser == 'fast':
+        try:
+            return parse_markup_fast(content)
+        except UnsupportedMarkup:
+            pass
+    return parse_markup_to_blocks(content)
+
+
+def parse_markup_to_blocks(content):
+    """Parse PHP/HTML source with BeautifulSoup into Notion block objects."""
+    from bs4 import BeautifulSoup, NavigableString, Tag
 
     # Preprocess PHP tags
     processed, php_tags = preprocess_php(content)
@@ -754,6 +790,8 @@ def parse_file_to_blocks(file_path):
 
 def parse_children_to_blocks(parent_element, php_tags):
     """Parse children of a div into blocks (for nested content)."""
+    from bs4 import NavigableString, Tag
+
     blocks = []
     for element in parent_element.children:
         if isinstance(element, NavigableString):
@@ -840,48 +878,812 @@ def parse_children_to_blocks(parent_element, php_tags):
     return blocks
 
 
+# --- Fast parser ---
+# Component files use a narrow slice of HTML plus the PHP idioms above.
+# parse_markup_fast reads that source once into a small element tree with
+# PHP islands as leaves (no <php-marker> rewriting, no base64) and builds
+# the same blocks as parse_markup_to_blocks. Tree building follows
+# html.parser and BeautifulSoup for that slice: entity decoding, whitespace
+# collapsing, unmatched end tags and void elements. Anything else raises
+# UnsupportedMarkup so the caller can fall back to BeautifulSoup.
+
+class UnsupportedMarkup(RuntimeError):
+    """Source the fast parser cannot build the same tree for as BeautifulSoup."""
+
+
+class _Element:
+    __slots__ = ('name', 'attrs', 'children')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+
+class _Comment(str):
+    """An HTML comment: rich text reads it like text, get_text skips it."""
+
+
+class _PhpIsland:
+    __slots__ = ('code',)
+
+    def __init__(self, code):
+        self.code = code
+
+
+# One markup token per match; the source between matches is character data.
+_TOKEN = re.compile(r'''
+    (?P<php><\?php\s.*?\?>)
+  | (?P<start><(?P<name>[a-zA-Z][-.:a-zA-Z0-9_]*)
+        (?P<attrs>(?:\s+[a-zA-Z_:][-.:a-zA-Z0-9_]*
+            (?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'<>/=`]+))?)*)
+        \s*(?P<empty>/?)>)
+  | (?P<end></(?P<end_name>[a-zA-Z][-.:a-zA-Z0-9_]*)\s*>)
+  | (?P<comment><!--(?P<comment_text>.*?)-->)
+  | (?P<charref>&\#(?P<number>[0-9]+|[xX][0-9a-fA-F]+)(?:;|(?=[^0-9a-fA-F])))
+  | (?P<entity>&(?P<entity_name>[a-zA-Z][-.a-zA-Z0-9]*)(?:;|(?=[^a-zA-Z0-9])))
+  | (?P<other>[<&])
+''', re.DOTALL | re.VERBOSE)
+_ATTRIBUTE = re.compile(
+    r'([a-zA-Z_:][-.:a-zA-Z0-9_]*)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s"\'<>/=`]+))?'
+)
+# A < or & that html.parser would read as the start of markup it then
+# handles on its own terms (declarations, processing instructions,
+# malformed tags, references cut off at the end of the file).
+_UNSUPPORTED_OPEN = re.compile(r'<[a-zA-Z/!?]|&[a-zA-Z#]')
+
+# BeautifulSoup's html.parser void elements: closed as soon as they open.
+_VOID_TAGS = frozenset((
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed',
+    'frame', 'hr', 'image', 'img', 'input', 'isindex', 'keygen', 'link',
+    'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr',
+))
+# Raw-text elements, elements whose strings BeautifulSoup gives their own
+# class, and our own marker tag.
+_UNSUPPORTED_TAGS = frozenset((
+    'script', 'style', 'textarea', 'title', 'xmp', 'iframe', 'noembed',
+    'noframes', 'noscript', 'plaintext', 'template', 'rt', 'rp', 'php-marker',
+))
+_ASCII_SPACES = ' \n\t\x0c\r'
+_NO_ATTRIBUTES = types.MappingProxyType({})
+_INLINE_ANNOTATIONS = {
+    'strong': 'bold', 'b': 'bold', 'em': 'italic', 'i': 'italic',
+    'code': 'code', 's': 'strikethrough', 'u': 'underline',
+}
+
+
+def _charref_text(number):
+    number = int(number[1:], 16) if number[0] in 'xX' else int(number)
+    text = None
+    if number < 256:
+        # BeautifulSoup reads small references as windows-1252, like browsers.
+        try:
+            text = bytes([number]).decode('windows-1252')
+        except UnicodeDecodeError:
+            pass
+    if not text:
+        try:
+            text = chr(number)
+        except (ValueError, OverflowError):
+            pass
+    return text or '\N{REPLACEMENT CHARACTER}'
+
+
+def _scan_markup(content, on_child):
+    """Build, in one pass, the tree BeautifulSoup would build from the preprocessed source.
+
+    Each finished child of the document or of its div#message is passed to
+    ``on_child(node, parent)`` instead of being kept, so memory is bounded
+    by the largest top-level element rather than the file. Text directly
+    inside those two is dropped; no block is built from it. Returns the
+    message div, or None.
+    """
+    root = _Element('[document]', _NO_ATTRIBUTES)
+    stack = [root]
+    data = []
+    closed_voids = []
+    message = None
+
+    def collapse(text):
+        # BeautifulSoup keeps whitespace-only strings as one space or newline
+        # unless they are inside <pre>.
+        if not text.strip(_ASCII_SPACES) and not any(e.name == 'pre' for e in stack):
+            return '\n' if '\n' in text else ' '
+        return text
+
+    def attach(node):
+        if stack[-1] is not root and stack[-1] is not message:
+            stack[-1].children.append(node)
+
+    def finish(node):
+        if stack[-1] is root or stack[-1] is message:
+            on_child(node, stack[-1])
+
+    def flush():
+        if data:
+            attach(collapse(''.join(data)))
+            data.clear()
+
+    def close_to(depth):
+        while len(stack) > depth:
+            finish(stack.pop())
+
+    pos = 0
+    for token in _TOKEN.finditer(content):
+        start = token.start()
+        if start > pos:
+            data.append(content[pos:start])
+        pos = token.end()
+        kind = token.lastgroup
+
+        if kind == 'entity':
+            name = token.group('entity_name')
+            data.append(html_entities.get(name + ';', '&' + name))
+        elif kind == 'charref':
+            data.append(_charref_text(token.group('number')))
+        elif kind == 'start':
+            name = token.group('name').lower()
+            if name in _UNSUPPORTED_TAGS or '<?php' in token.group():
+                raise UnsupportedMarkup(f"Unsupported <{name}> tag at {start}")
+            attrs = {} if token.group('attrs') else _NO_ATTRIBUTES
+            for attr in _ATTRIBUTE.finditer(token.group('attrs')):
+                value = attr.group(2) or ''
+                if value[:1] in ('"', "'"):
+                    value = value[1:-1]
+                attrs[attr.group(1).lower()] = html_module.unescape(value)
+            if 'class' in attrs:
+                attrs['class'] = attrs['class'].split()
+            flush()
+            element = _Element(name, attrs)
+            attach(element)
+            if token.group('empty'):
+                # BeautifulSoup leaves <x/> open when an earlier <x> was void.
+                if name in closed_voids:
+                    closed_voids.remove(name)
+                    stack.append(element)
+                else:
+                    finish(element)
+            elif name in _VOID_TAGS:
+                closed_voids.append(name)
+                finish(element)
+            else:
+                stack.append(element)
+            if name == 'div' and attrs.get('id') == 'message':
+                if message is not None:
+                    raise UnsupportedMarkup("More than one message div")
+                message = element
+        elif kind == 'end':
+            name = token.group('end_name').lower()
+            if name in closed_voids:
+                # The end tag of an element already closed as void; the text
+                # on either side stays one string.
+                closed_voids.remove(name)
+                continue
+            flush()
+            for depth in range(len(stack) - 1, 0, -1):
+                if stack[depth].name == name:
+                    close_to(depth)
+                    break
+        elif kind == 'php':
+            flush()
+            island = _PhpIsland(token.group())
+            attach(island)
+            finish(island)
+        elif kind == 'comment':
+            text = token.group('comment_text')
+            if ('--' in text or '<?php' in text
+                    or text.startswith(('>', '->')) or text.endswith('-')):
+                raise UnsupportedMarkup(f"Unsupported comment at {start}")
+            flush()
+            attach(_Comment(collapse(text)))
+        elif _UNSUPPORTED_OPEN.match(content, start):
+            raise UnsupportedMarkup(f"Unsupported markup at {start}")
+        else:
+            data.append(token.group())
+    if pos < len(content):
+        data.append(content[pos:])
+    flush()
+    close_to(1)
+    return message
+
+
+def _iter_descendants(element):
+    """Every node below ``element``, in document order."""
+    pending = element.children[::-1]
+    while pending:
+        node = pending.pop()
+        yield node
+        if isinstance(node, _Element):
+            pending.extend(reversed(node.children))
+
+
+def _find_all(element, names, recursive=True):
+    nodes = _iter_descendants(element) if recursive else element.children
+    return [node for node in nodes if isinstance(node, _Element) and node.name in names]
+
+
+def _get_text(element):
+    return ''.join(node for node in _iter_descendants(element) if type(node) is str)
+
+
+def _mentions_desc(element):
+    """Whether str(element) under BeautifulSoup, or PHP inside it, contains echo $desc."""
+    for node in (element, *_iter_descendants(element)):
+        if isinstance(node, _PhpIsland):
+            if 'echo $desc' in node.code:
+                return True
+            continue
+        if not isinstance(node, _Element):
+            continue
+        for value in node.attrs.values():
+            if 'echo' in (' '.join(value) if isinstance(value, list) else value):
+                raise UnsupportedMarkup("echo in a heading attribute")
+        # Adjacent strings render as one run of text.
+        text = ''
+        for child in (*node.children, None):
+            if type(child) is str:
+                text += child
+                continue
+            if 'echo $desc' in text or (isinstance(child, _Comment) and 'echo $desc' in child):
+                return True
+            text = ''
+    return False
+
+
+def _fast_rich_text(element):
+    """element_to_rich_text for the fast parser's tree."""
+    rich_text = []
+
+    def walk(node, annotations, link):
+        if isinstance(node, _PhpIsland):
+            rt = inline_php_rich_text(node.code, annotations, link)
+        elif isinstance(node, str):
+            rt = text_node_rich_text(str(node), annotations, link)
+        elif node.name == 'br':
+            rt = make_text('\n')
+        elif node.name == 'img':
+            rt = make_text(f"[image: {node.get('alt', '')}]", annotations, link)
+        else:
+            if node.name in _INLINE_ANNOTATIONS:
+                annotations = {**annotations, _INLINE_ANNOTATIONS[node.name]: True}
+            elif node.name == 'a':
+                link = node.get('href', '')
+            elif node.name == 'span' and 'bold' in node.get('class', []):
+                annotations = {**annotations, 'bold': True}
+            for child in node.children:
+                walk(child, annotations, link)
+            return
+        if rt:
+            rich_text.append(rt)
+
+    for child in element.children:
+        walk(child, {}, None)
+    return clean_rich_text(rich_text)
+
+
+def _fast_list_items(element, make_item):
+    blocks = []
+    for li in _find_all(element, ('li',), recursive=False):
+        # Content is often in a <div> inside <li>
+        divs = _find_all(li, ('div',), recursive=False)
+        block = make_item(_fast_rich_text(divs[0] if divs else li))
+        if block:
+            blocks.append(block)
+    return blocks
+
+
+def _fast_table(element):
+    rows = []
+    for tr in _find_all(element, ('tr',)):
+        cells = [_get_text(td).strip() for td in _find_all(tr, ('td', 'th'))]
+        if cells:
+            rows.append(cells)
+    return make_table(rows)
+
+
+def _is_separator(div):
+    div_class = ' '.join(div.get('class', []))
+    return 'content-body-separator' in div.get('id', '') or 'content-body-separator' in div_class
+
+
+def _message_child_blocks(element):
+    """Blocks for one child of the message div, as parse_markup_to_blocks builds them."""
+    if isinstance(element, _PhpIsland):
+        block = classify_php_block(element.code)
+    elif element.name == 'h2':
+        if _mentions_desc(element):
+            return []  # Skip — generated from metadata
+        block = make_heading(2, _fast_rich_text(element))
+    elif element.name == 'h3':
+        block = make_heading(1, _fast_rich_text(element))
+    elif element.name == 'h4':
+        block = make_heading(3, _fast_rich_text(element))
+    elif element.name == 'p':
+        rt = _fast_rich_text(element)
+        if 'first-letter-high' in element.get('class', []):
+            block = make_rich_text_callout('🔠', rt)
+        else:
+            block = make_paragraph(rt)
+    elif element.name == 'ul':
+        return _fast_list_items(element, make_bulleted_list_item)
+    elif element.name == 'ol':
+        return _fast_list_items(element, make_numbered_list_item)
+    elif element.name == 'table':
+        block = _fast_table(element)
+    elif element.name == 'pre':
+        codes = _find_all(element, ('code',))
+        block = make_code(_get_text(codes[0] if codes else element))
+    elif element.name == 'blockquote':
+        block = make_quote(_fast_rich_text(element))
+    elif element.name == 'div':
+        if _is_separator(element):
+            block = make_divider()
+        elif element.get('id', '') in ('fb_components', 'profile-image-container') \
+                or 'message_leave' in ' '.join(element.get('class', [])):
+            return []
+        else:
+            return _fast_child_blocks(element)
+    else:
+        return []
+    return [block] if block else []
+
+
+def _fast_child_blocks(parent):
+    """parse_children_to_blocks for the fast parser's tree."""
+    blocks = []
+    for element in parent.children:
+        if isinstance(element, _PhpIsland):
+            block = classify_php_block(element.code)
+        elif isinstance(element, str):
+            continue
+        elif element.name == 'p':
+            block = make_paragraph(_fast_rich_text(element))
+        elif element.name in ('h2', 'h3', 'h4'):
+            level_map = {'h2': 2, 'h3': 1, 'h4': 3}
+            block = make_heading(level_map[element.name], _fast_rich_text(element))
+        elif element.name == 'table':
+            block = _fast_table(element)
+        elif element.name in ('ul', 'ol'):
+            blocks.extend(_fast_list_items(element, (
+                make_bulleted_list_item if element.name == 'ul' else make_numbered_list_item
+            )))
+            continue
+        elif element.name == 'div':
+            if _is_separator(element):
+                block = make_divider()
+            elif element.get('id', '') in ('fb_components', 'profile-image-container'):
+                continue
+            else:
+                blocks.extend(_fast_child_blocks(element))
+                continue
+        else:
+            continue
+        if block:
+            blocks.append(block)
+    return blocks
+
+
+def _trailing_child_blocks(element):
+    """Blocks for a top-level node after the message div."""
+    if isinstance(element, _PhpIsland):
+        block = classify_php_block(element.code)
+    elif element.name != 'div':
+        return []
+    elif _is_separator(element):
+        block = make_divider()
+    elif element.get('id', '') == 'fb_components':
+        return []
+    else:
+        return _fast_child_blocks(element)
+    return [block] if block else []
+
+
+def parse_markup_fast(content):
+    """parse_markup_to_blocks in a single pass without BeautifulSoup.
+
+    Raises UnsupportedMarkup for source outside the component subset.
+    """
+    message_blocks = []
+    trailing_blocks = []
+    # Without a message div the document's own children are the content.
+    document_blocks = []
+    after_message = False
+
+    def on_child(node, parent):
+        nonlocal after_message
+        if parent.name != '[document]':
+            message_blocks.extend(_message_child_blocks(node))
+        elif after_message:
+            trailing_blocks.extend(_trailing_child_blocks(node))
+        elif isinstance(node, _Element) and node.name == 'div' and node.get('id') == 'message':
+            after_message = True
+        else:
+            document_blocks.extend(_message_child_blocks(node))
+
+    if _scan_markup(content, on_child) is None:
+        return document_blocks
+    return message_blocks + trailing_blocks
+
+
+def parse_files(file_paths, jobs=1, parser='bs4'):
+    """Yield (blocks, error) for each file, in the order given.
+
+    With ``jobs`` above one, files are parsed in that many worker processes,
+    at most two per worker ahead of the consumer, so uploading the first
+    article overlaps parsing the next ones.
+    """
+    if jobs <= 1:
+        for file_path in file_paths:
+            try:
+                yield parse_file_to_blocks(file_path, parser), None
+            except Exception as e:
+                yield None, e
+        return
+
+    file_paths = iter(file_paths)
+    pool = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        pending = collections.deque(
+            pool.submit(parse_file_to_blocks, file_path, parser)
+            for file_path in itertools.islice(file_paths, jobs * 2)
+        )
+        while pending:
+            future = pending.popleft()
+            file_path = next(file_paths, None)
+            if file_path is not None:
+                pending.append(pool.submit(parse_file_to_blocks, file_path, parser))
+            try:
+                yield future.result(), None
+            except Exception as e:
+                yield None, e
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def compare_parsers(file_paths):
+    """Parse each file with both parsers and compare the blocks as JSON text.
+
+    Returns {'files', 'mismatched': [paths], 'fallback': [paths],
+    'bs4_seconds', 'fast_seconds'}. Files the fast parser hands back to
+    BeautifulSoup are listed under 'fallback' and are not compared.
+    """
+    # Load BeautifulSoup before timing anything; the fast parser never imports it.
+    importlib.import_module('bs4')
+
+    report = {
+        'files': 0, 'mismatched': [], 'fallback': [], 'bs4_seconds': 0.0, 'fast_seconds': 0.0,
+    }
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        report['files'] += 1
+        start = time.perf_counter()
+        expected = parse_markup_to_blocks(content)
+        report['bs4_seconds'] += time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            actual = parse_markup_fast(content)
+        except UnsupportedMarkup:
+            report['fallback'].append(file_path)
+            continue
+        finally:
+            report['fast_seconds'] += time.perf_counter() - start
+        if json.dumps(actual, ensure_ascii=False) != json.dumps(expected, ensure_ascii=False):
+            report['mismatched'].append(file_path)
+    return report
+
+
 # ============================================================
 # Step 4: Upload blocks to Notion
 # ============================================================
 
-def clear_page_content(page_id):
-    """Remove all existing blocks from a Notion page."""
-    has_more = True
-    start_cursor = None
-    while has_more:
-        kwargs = {'block_id': page_id}
-        if start_cursor:
-            kwargs['start_cursor'] = start_cursor
-        response = notion.blocks.children.list(**kwargs)
-        for block in response['results']:
-            try:
-                notion.blocks.delete(block_id=block['id'])
-            except Exception as e:
-                print(f"  Warning: Failed to delete block {block['id']}: {e}")
-        has_more = response.get('has_more', False)
-        start_cursor = response.get('next_cursor')
-        # If we deleted blocks, the cursor is invalidated — restart
-        if has_more:
-            has_more = True
-            start_cursor = None
+DELETE_PROGRESS_EVERY = 100
 
 
-def upload_blocks(page_id, blocks):
-    """Append blocks to a Notion page, respecting the 100-block limit."""
-    # Notion API allows max 100 blocks per append call
-    for i in range(0, len(blocks), 100):
-        batch = blocks[i:i + 100]
+def delete_blocks(block_ids, workers=None):
+    """Delete blocks concurrently; return the (block_id, error) pairs that failed.
+
+    At most ``workers`` deletions (default NOTION_MAX_CONCURRENCY) are in
+    flight; the shared rate limit and AIMD window in ncms_notion decide how
+    many actually run.
+    """
+    block_ids = list(block_ids)
+    if not block_ids:
+        return []
+    workers = workers or ncms_notion.get_concurrency().maximum
+
+    def delete(block_id):
+        try:
+            notion.blocks.delete(block_id=block_id)
+        except Exception as e:
+            return block_id, e
+        return None
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=min(workers, len(block_ids))) as pool:
+        futures = [pool.submit(delete, block_id) for block_id in block_ids]
+        for done, future in enumerate(as_completed(futures), 1):
+            failure = future.result()
+            if failure:
+                failures.append(failure)
+            if done % DELETE_PROGRESS_EVERY == 0 and done < len(block_ids):
+                print(f"  Deleted {done - len(failures)} of {len(block_ids)} blocks...")
+    return failures
+
+
+def report_delete_failures(failures):
+    if not failures:
+        return
+    print(f"  Warning: Failed to delete {len(failures)} blocks")
+    for block_id, error in failures[:5]:
+        print(f"    {block_id}: {error}")
+    if len(failures) > 5:
+        print(f"    ... and {len(failures) - 5} more")
+
+
+def clear_page_content(page_id, workers=None):
+    """Remove all existing blocks from a Notion page.
+
+    The top-level block ids are listed once, then deleted concurrently.
+    Returns {'deleted': count, 'failed': [(block_id, error), ...]}.
+    """
+    block_ids = [
+        block['id']
+        for block in ncms_notion.iter_paginated(notion.blocks.children.list, block_id=page_id)
+    ]
+    failures = delete_blocks(block_ids, workers)
+    print(f"  Deleted {len(block_ids) - len(failures)} of {len(block_ids)} blocks")
+    report_delete_failures(failures)
+    return {'deleted': len(block_ids) - len(failures), 'failed': failures}
+
+
+def is_rejected_block_error(error):
+    """True when Notion rejected the request body (400), not for throttling or outages."""
+    return getattr(error, 'status', None) == 400
+
+
+def sanitize_block(block):
+    """Return a copy of ``block`` without the parts Notion most often rejects.
+
+    Links are dropped, rich_text is capped at Notion's 100 segments and code
+    languages fall back to plain text.
+    """
+    block = json.loads(json.dumps(block))
+    payload = block[block['type']]
+    rich_texts = [payload.get('rich_text')]
+    for row in payload.get('children', []):
+        rich_texts.extend(row.get('table_row', {}).get('cells', []))
+    for rich_text in rich_texts:
+        if not rich_text:
+            continue
+        for rt in rich_text:
+            rt.get('text', {}).pop('link', None)
+        del rich_text[100:]
+    if block['type'] == 'code':
+        payload['language'] = 'plain text'
+    return block
+
+
+def block_preview(block):
+    rich_text = block[block['type']].get('rich_text', [])
+    return ''.join(rt.get('text', {}).get('content', '') for rt in rich_text)[:80]
+
+
+def append_isolating(page_id, blocks, after, offset, report, sanitize):
+    """Append ``blocks`` after ``after``, bisecting rejected batches.
+
+    A batch Notion rejects is split in half and each half retried in order,
+    so one bad block among n costs about 2 log2(n) extra requests and every
+    good block still lands in position. A single rejected block is retried
+    once sanitized (when ``sanitize``) and otherwise skipped; either way it
+    is recorded in ``report``. Returns the id of the last appended block.
+    """
+    kwargs = {'block_id': page_id, 'children': blocks}
+    if after:
+        kwargs['after'] = after
+    try:
+        response = notion.blocks.children.append(**kwargs)
+        return response['results'][-1]['id'] if response.get('results') else after
+    except Exception as e:
+        if not is_rejected_block_error(e):
+            raise
+        error = e
+    if len(blocks) > 1:
+        middle = len(blocks) // 2
+        after = append_isolating(page_id, blocks[:middle], after, offset, report, sanitize)
+        return append_isolating(
+            page_id, blocks[middle:], after, offset + middle, report, sanitize
+        )
+
+    block = blocks[0]
+    entry = {
+        'index': offset,
+        'type': block['type'],
+        'text': block_preview(block),
+        'error': str(error),
+        'action': 'skipped',
+    }
+    report.append(entry)
+    cleaned = sanitize_block(block) if sanitize else block
+    if cleaned != block:
+        kwargs['children'] = [cleaned]
         try:
-            notion.blocks.children.append(block_id=page_id, children=batch)
+            response = notion.blocks.children.append(**kwargs)
         except Exception as e:
-            print(f"  Error appending blocks (batch {i//100 + 1}): {e}")
-            # Try one by one for this batch to identify the problematic block
-            for j, block in enumerate(batch):
-                try:
-                    notion.blocks.children.append(block_id=page_id, children=[block])
-                except Exception as e2:
-                    print(f"  Block {i+j} failed: {e2}")
-                    print(f"  Block content: {json.dumps(block, indent=2, ensure_ascii=False)[:500]}")
+            if not is_rejected_block_error(e):
+                raise
+        else:
+            entry['action'] = 'sanitized'
+            after = response['results'][-1]['id']
+    print(f"  Block {offset} {entry['action']}: {error}")
+    return after
+
+
+def upload_blocks(page_id, blocks, after=None, sanitize=True):
+    """Append blocks to a Notion page, respecting the 100-block limit.
+
+    With ``after``, the blocks are inserted after that block instead of at
+    the end. Rejected blocks are isolated by append_isolating; returns the
+    list of those blocks' report entries.
+    """
+    report = []
+    # Notion API allows max 100 blocks per append call
+    for i in range(0, len(blocks), 100):
+        after = append_isolating(page_id, blocks[i:i + 100], after, i, report, sanitize)
+    return report
+
+
+# --- Incremental sync ---
+# Instead of clearing the page and appending everything again, align the
+# page's current top-level blocks with the parsed blocks and send only the
+# updates, deletions and positional appends that turn one into the other.
+
+ANNOTATION_DEFAULTS = {
+    'bold': False, 'italic': False, 'strikethrough': False,
+    'underline': False, 'code': False, 'color': 'default',
+}
+
+
+def rich_text_key(rich_text):
+    """Comparable form of a rich_text array, from a request or a Notion response.
+
+    Adjacent segments with the same link and annotations are merged, so
+    segment boundaries (for example the 2000-character split) do not count.
+    """
+    segments = []
+    for rt in rich_text or []:
+        if rt.get('type', 'text') == 'text':
+            content = rt['text']['content']
+            link = (rt['text'].get('link') or {}).get('url')
+        else:
+            content = rt.get('plain_text', '')
+            link = rt.get('href')
+        annotations = tuple(sorted(
+            (name, value) for name, value in (rt.get('annotations') or {}).items()
+            if ANNOTATION_DEFAULTS.get(name, value) != value
+        ))
+        attributes = (rt.get('type', 'text'), link, annotations)
+        if segments and segments[-1][0] == attributes:
+            segments[-1] = (attributes, segments[-1][1] + content)
+        else:
+            segments.append((attributes, content))
+    return tuple(segments)
+
+
+def block_key(block):
+    """Comparable form of a block; equal keys render the same in Notion."""
+    block_type = block['type']
+    payload = block.get(block_type, {})
+    key = (block_type, rich_text_key(payload.get('rich_text')))
+    if block_type == 'code':
+        key += (payload.get('language'),)
+    elif block_type == 'callout':
+        key += ((payload.get('icon') or {}).get('emoji'),)
+    elif block_type == 'table':
+        key += (
+            payload.get('table_width'),
+            bool(payload.get('has_column_header')),
+            bool(payload.get('has_row_header')),
+            tuple(
+                tuple(rich_text_key(cell) for cell in row['table_row']['cells'])
+                for row in payload.get('children', [])
+            ),
+        )
+    return key
+
+
+def fetch_page_blocks(page_id):
+    """Top-level blocks of a page, with table rows attached as table['children']."""
+    blocks = list(ncms_notion.iter_paginated(notion.blocks.children.list, block_id=page_id))
+    for block in blocks:
+        if block['type'] == 'table' and block.get('has_children'):
+            block['table']['children'] = list(ncms_notion.iter_paginated(
+                notion.blocks.children.list, block_id=block['id']
+            ))
+    return blocks
+
+
+def can_update_in_place(existing, block):
+    # A table's rows are child blocks, which blocks.update cannot replace.
+    return existing['type'] == block['type'] and block['type'] != 'table'
+
+
+def plan_page_sync(existing, blocks):
+    """Return (updates, inserts, deletes) turning ``existing`` into ``blocks``.
+
+    ``updates`` is a list of (block_id, block), ``inserts`` a list of
+    (after_block_id, [blocks]) in page order and ``deletes`` a list of block
+    ids. Returns None when new blocks would have to go above every kept
+    block, which the append API cannot do.
+    """
+    matcher = SequenceMatcher(
+        None, [block_key(b) for b in existing], [block_key(b) for b in blocks],
+        autojunk=False,
+    )
+    updates, inserts, deletes = [], [], []
+    anchor = None
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        old, new = existing[i1:i2], blocks[j1:j2]
+        if tag == 'equal':
+            anchor = old[-1]['id']
+            continue
+        paired = 0
+        if tag == 'replace':
+            for existing_block, block in zip(old, new):
+                if not can_update_in_place(existing_block, block):
+                    break
+                updates.append((existing_block['id'], block))
+                anchor = existing_block['id']
+                paired += 1
+        deletes.extend(b['id'] for b in old[paired:])
+        if new[paired:]:
+            if anchor is None and i2 < len(existing):
+                return None
+            inserts.append((anchor, new[paired:]))
+    return updates, inserts, deletes
+
+
+def sync_page_blocks(page_id, blocks, sanitize=True):
+    """Make a page's top-level blocks match ``blocks`` with as few requests as possible.
+
+    Falls back to clear_page_content and upload_blocks when the change
+    cannot be expressed as positional appends. Returns counts of what was
+    kept, updated, inserted and deleted, and the upload_blocks report of
+    rejected blocks.
+    """
+    existing = fetch_page_blocks(page_id)
+    plan = plan_page_sync(existing, blocks)
+    if plan is None:
+        print("  New blocks precede every kept block; replacing the page content")
+        cleared = clear_page_content(page_id)
+        report = upload_blocks(page_id, blocks, sanitize=sanitize)
+        return {
+            'kept': 0, 'updated': 0, 'inserted': len(blocks), 'deleted': cleared['deleted'],
+            'rejected': report,
+        }
+
+    updates, inserts, deletes = plan
+    for block_id, block in updates:
+        payload = {k: v for k, v in block[block['type']].items() if k != 'children'}
+        notion.blocks.update(block_id=block_id, **{block['type']: payload})
+    report = []
+    for after, new_blocks in inserts:
+        report.extend(upload_blocks(page_id, new_blocks, after=after, sanitize=sanitize))
+    failures = delete_blocks(deletes)
+    report_delete_failures(failures)
+
+    inserted = sum(len(new_blocks) for _, new_blocks in inserts)
+    inserted -= sum(entry['action'] == 'skipped' for entry in report)
+    return {
+        'kept': len(existing) - len(updates) - len(deletes),
+        'updated': len(updates),
+        'inserted': inserted,
+        'deleted': len(deletes) - len(failures),
+        'rejected': report,
+    }
 
 
 # ============================================================
@@ -890,15 +1692,55 @@ def upload_blocks(page_id, blocks):
 
 def main():
     dry_run = '--dry-run' in sys.argv
+    sync = '--sync' in sys.argv
+    sanitize = '--no-sanitize' not in sys.argv
+    check_parser = '--check-parser' in sys.argv
+    jobs = 1
+    parser = 'bs4'
     target_slug = None
-    for arg in sys.argv[1:]:
-        if arg != '--dry-run':
+    args = iter(sys.argv[1:])
+    for arg in args:
+        if arg == '--jobs' or arg.startswith('--jobs='):
+            value = arg.split('=', 1)[1] if '=' in arg else next(args, '')
+            try:
+                jobs = int(value)
+            except ValueError:
+                jobs = -1
+            if jobs < 0:
+                print(f"Error: --jobs expects a number of processes, 0 for one per CPU; got '{value}'")
+                sys.exit(1)
+        elif arg == '--parser' or arg.startswith('--parser='):
+            parser = arg.split('=', 1)[1] if '=' in arg else next(args, '')
+        elif arg not in ('--dry-run', '--sync', '--no-sanitize', '--check-parser'):
             target_slug = arg
+    jobs = jobs or os.cpu_count() or 1
+    if parser not in PARSERS:
+        print(f"Error: unknown parser '{parser}' (expected one of {', '.join(PARSERS)})")
+        sys.exit(1)
 
     print("Building file map from Component directory...")
     file_map = build_file_map()
     print(f"  Found {len(file_map)} files")
 
+    if check_parser:
+        slugs = [slug for slug in sorted(file_map) if not target_slug or slug == target_slug]
+        print(f"Comparing the fast parser with BeautifulSoup on {len(slugs)} files...")
+        report = compare_parsers([file_map[slug] for slug in slugs])
+        for file_path in report['mismatched']:
+            print(f"MISMATCH {file_path}")
+        for file_path in report['fallback']:
+            print(f"FALLBACK {file_path}")
+        speedup = report['bs4_seconds'] / report['fast_seconds'] if report['fast_seconds'] else 0
+        print(
+            f"Parser check: {report['files'] - len(report['mismatched']) - len(report['fallback'])} "
+            f"identical, {len(report['mismatched'])} mismatched, "
+            f"{len(report['fallback'])} fell back to bs4; "
+            f"bs4 {report['bs4_seconds']:.2f}s, fast {report['fast_seconds']:.2f}s ({speedup:.1f}x)"
+        )
+        if report['mismatched']:
+            sys.exit(1)
+        return
+
     print("Reading TSV slugs...")
     tsv_slugs = read_tsv_slugs()
     print(f"  Found {len(tsv_slugs)} entries")
@@ -920,7 +1762,9 @@ def main():
     success = 0
     skipped = 0
     failed = 0
+    rejected = {}
 
+    work = []
     for slug in tsv_slugs:
         # Find file
         file_path = file_map.get(slug)
@@ -929,18 +1773,23 @@ def main():
             skipped += 1
             continue
 
+        page_id = None
         if not dry_run:
             page_id = page_map.get(slug)
             if not page_id:
                 print(f"SKIP {slug}: no Notion page found")
                 skipped += 1
                 continue
+        work.append((slug, file_path, page_id))
 
+    parsed = parse_files([file_path for _, file_path, _ in work], jobs, parser)
+    for (slug, file_path, page_id), (blocks, parse_error) in zip(work, parsed):
         print(f"\nProcessing: {slug}")
         print(f"  File: {file_path}")
 
         try:
-            blocks = parse_file_to_blocks(file_path)
+            if parse_error:
+                raise parse_error
             print(f"  Parsed {len(blocks)} blocks")
 
             if dry_run:
@@ -960,11 +1809,22 @@ def main():
                         text = ''.join(r['text']['content'] for r in rt)[:80]
                         print(f"    [{i}] {btype}: {text}")
                 success += 1
+            elif sync:
+                result = sync_page_blocks(page_id, blocks, sanitize=sanitize)
+                print(
+                    f"  Synced: {result['kept']} kept, {result['updated']} updated, "
+                    f"{result['inserted']} inserted, {result['deleted']} deleted"
+                )
+                if result['rejected']:
+                    rejected[slug] = result['rejected']
+                success += 1
             else:
                 print(f"  Clearing existing content...")
                 clear_page_content(page_id)
                 print(f"  Uploading {len(blocks)} blocks...")
-                upload_blocks(page_id, blocks)
+                report = upload_blocks(page_id, blocks, sanitize=sanitize)
+                if report:
+                    rejected[slug] = report
                 print(f"  Done!")
                 success += 1
 
@@ -976,7 +1836,13 @@ def main():
 
     print(f"\n{'='*50}")
     print(f"Results: {success} uploaded, {skipped} skipped, {failed} failed")
+    if rejected:
+        count = sum(len(entries) for entries in rejected.values())
+        print(f"Rejected blocks: {count} in {len(rejected)} articles")
+        print("NCMS_UPLOAD_REPORT=" + json.dumps(rejected, ensure_ascii=True))
+    print(ncms_notion.format_stats())
 
 
 if __name__ == '__main__':
+    sys.stdout.reconfigure(encoding='utf-8')
     main()
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import ncms_fetch
+import ncms_notion
+
+
+OLD_EDIT = "2024-01-01T10:00:00.000Z"
+NEW_EDIT = "2024-01-02T10:00:00.000Z"
+
+TREE = {
+    "page-a": [
+        {"id": "a-1", "type": "paragraph", "paragraph": {"rich_text": []}},
+        {"id": "table-a", "type": "table", "table": {"table_width": 1}},
+        {
+            "id": "child-hi",
+            "type": "child_page",
+            "last_edited_time": OLD_EDIT,
+            "child_page": {"title": "हिन्दी (hi)"},
+        },
+    ],
+    "table-a": [{"id": "row-1", "type": "table_row", "table_row": {"cells": []}}],
+    "child-hi": [{"id": "hi-1", "type": "paragraph", "paragraph": {"rich_text": []}}],
+}
+
+
+class FakeAsyncClient:
+    def __init__(self, child_edited_time=OLD_EDIT):
+        self.listed = []
+        self.retrieved = []
+        self.child_edited_time = child_edited_time
+        self.blocks = SimpleNamespace(children=SimpleNamespace(list=self.list_children))
+        self.pages = SimpleNamespace(retrieve=self.retrieve)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def list_children(self, block_id, start_cursor=None):
+        await asyncio.sleep(0)
+        self.listed.append(block_id)
+        blocks = json.loads(json.dumps(TREE[block_id]))
+        for block in blocks:
+            if block["type"] == "child_page":
+                block["last_edited_time"] = self.child_edited_time
+        return {"results": blocks, "has_more": False}
+
+    async def retrieve(self, page_id):
+        self.retrieved.append(page_id)
+        return {"id": page_id, "last_edited_time": self.child_edited_time}
+
+
+class BlockCacheTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.cache_dir = temp_dir.name
+        for name, value in (
+            ("block_cache_dir", self.cache_dir),
+            ("block_cache_enabled", True),
+        ):
+            patcher = patch.object(ncms_fetch, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fetch(self, client, edited_time=OLD_EDIT):
+        with patch.object(ncms_notion, "create_async_client", return_value=client):
+            return ncms_fetch.fetch_block_trees(
+                ["page-a"], edited_times={"page-a": edited_time}
+            )
+
+    def test_unchanged_pages_are_served_from_cache(self):
+        first = FakeAsyncClient()
+        self.fetch(first)
+        self.assertEqual({"page-a", "table-a", "child-hi"}, set(first.listed))
+
+        second = FakeAsyncClient()
+        trees = self.fetch(second)
+        self.assertEqual([], second.listed)
+        self.assertEqual(["child-hi"], second.retrieved)
+        self.assertEqual("row-1", trees["page-a"][1]["table"]["children"][0]["id"])
+        self.assertEqual("hi-1", trees["child-hi"][0]["id"])
+
+    def test_edited_page_and_translation_are_refetched(self):
+        self.fetch(FakeAsyncClient())
+
+        edited_child = FakeAsyncClient(child_edited_time=NEW_EDIT)
+        self.fetch(edited_child)
+        self.assertEqual(["child-hi"], edited_child.listed)
+
+        edited_page = FakeAsyncClient(child_edited_time=NEW_EDIT)
+        self.fetch(edited_page, edited_time=NEW_EDIT)
+        self.assertEqual({"page-a", "table-a"}, set(edited_page.listed))
+
+    def test_entry_fetched_in_the_edit_minute_is_not_trusted(self):
+        just_edited = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:00.000Z")
+        self.fetch(FakeAsyncClient(), edited_time=just_edited)
+        client = FakeAsyncClient()
+        self.fetch(client, edited_time=just_edited)
+        self.assertIn("page-a", client.listed)
+
+    def test_disabled_cache_neither_reads_nor_writes(self):
+        with patch.object(ncms_fetch, "block_cache_enabled", False):
+            self.fetch(FakeAsyncClient())
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_eviction_removes_least_recently_used_entries(self):
+        fetched_at = datetime.now(timezone.utc)
+        for index, block_id in enumerate(("old", "middle", "new")):
+            ncms_fetch.write_block_cache(block_id, OLD_EDIT, [{"x": "y" * 100}], fetched_at)
+            path = ncms_fetch.block_cache_path(block_id)
+            stamp = (fetched_at - timedelta(hours=3 - index)).timestamp()
+            os.utime(path, (stamp, stamp))
+        keep = sum(
+            os.path.getsize(ncms_fetch.block_cache_path(block_id))
+            for block_id in ("middle", "new")
+        )
+
+        ncms_fetch.evict_block_cache(max_bytes=keep)
+
+        self.assertEqual(
+            sorted(["middle.json", "new.json"]), sorted(os.listdir(self.cache_dir))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
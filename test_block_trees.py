@@ -0,0 +1,166 @@
+import asyncio
+import random
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import ncms_fetch
+import ncms_notion
+
+
+def make_page(slug, page_id):
+    return {
+        "id": page_id,
+        "properties": {
+            "Id": {"title": [{"plain_text": slug}]},
+            "Status": {"select": {"name": "publish"}},
+            "Label": {"rich_text": [{"plain_text": slug}]},
+            "Title": {"rich_text": [{"plain_text": slug}]},
+            "JS": {"select": {"name": "0"}},
+            "Description": {"rich_text": []},
+        },
+    }
+
+
+def paragraph(block_id, text):
+    return {
+        "id": block_id,
+        "type": "paragraph",
+        "paragraph": {"rich_text": [{"plain_text": text, "annotations": {}}]},
+    }
+
+
+def metadata_callout(language):
+    return {
+        "id": f"metadata-{language}",
+        "type": "callout",
+        "callout": {
+            "icon": {"type": "emoji", "emoji": "🌐"},
+            "rich_text": [{
+                "plain_text": (
+                    f"Language: {language}\nLabel: L\nTitle: T-{language}\n"
+                    "Description: D"
+                )
+            }],
+        },
+    }
+
+
+FAKE_TREE = {
+    "page-a": [
+        paragraph("a-1", "Alpha"),
+        {"id": "table-a", "type": "table", "table": {"table_width": 1}},
+        {"id": "child-hi", "type": "child_page", "child_page": {"title": "हिन्दी (hi)"}},
+        {"id": "notes", "type": "child_page", "child_page": {"title": "Notes"}},
+    ],
+    "page-b": [paragraph("b-1", "Beta")],
+    "table-a": [
+        {"id": "row-1", "type": "table_row", "table_row": {"cells": [[{"plain_text": "cell"}]]}},
+    ],
+    "child-hi": [
+        metadata_callout("hi"),
+        paragraph("hi-1", "Hindi body"),
+    ],
+}
+
+
+class FakeAsyncClient:
+    """Serve FAKE_TREE one block per cursor page, recording concurrency."""
+
+    def __init__(self, **kwargs):
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.blocks = SimpleNamespace(children=SimpleNamespace(list=self.list_children))
+        self.databases = SimpleNamespace(query=self.query, retrieve=self.retrieve)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def list_children(self, block_id, start_cursor=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Random delays make completion order differ from submission order.
+            await asyncio.sleep(random.uniform(0, 0.01))
+        finally:
+            self.in_flight -= 1
+        self.calls.append(block_id)
+        index = int(start_cursor or 0)
+        blocks = FAKE_TREE[block_id]
+        has_more = index + 1 < len(blocks)
+        return {
+            "results": [dict(block) for block in blocks[index:index + 1]],
+            "has_more": has_more,
+            "next_cursor": str(index + 1) if has_more else None,
+        }
+
+    async def retrieve(self, database_id):
+        return {"properties": {"Id": {"id": "title"}, "Status": {"id": "st"}}}
+
+    async def query(self, database_id, filter, filter_properties, start_cursor=None):
+        pages = [make_page("alpha", "page-a"), make_page("beta", "page-b")]
+        index = int(start_cursor or 0)
+        return {
+            "results": pages[index:index + 1],
+            "has_more": index == 0,
+            "next_cursor": "1" if index == 0 else None,
+        }
+
+
+def blocking_client(client):
+    """Expose a fake AsyncClient's endpoints as blocking calls, like notion_client.Client."""
+    def blocking(method):
+        return lambda **kwargs: asyncio.run(method(**kwargs))
+    return SimpleNamespace(
+        blocks=SimpleNamespace(children=SimpleNamespace(list=blocking(client.list_children))),
+        databases=SimpleNamespace(
+            query=blocking(client.query), retrieve=blocking(client.retrieve)
+        ),
+    )
+
+
+class BlockTreeFetchTests(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeAsyncClient()
+        patcher = patch.object(ncms_notion, "create_async_client", return_value=self.client)
+        self.create_async_client = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sync_wrappers_follow_cursors_on_the_shared_client(self):
+        with patch.object(ncms_fetch, "notion", blocking_client(self.client)):
+            pages = ncms_fetch.fetch_database_content("database")
+            blocks = ncms_fetch.fetch_page_blocks("page-a")
+        self.assertEqual(["page-a", "page-b"], [page.id for page in pages])
+        self.assertEqual(["a-1", "table-a", "child-hi", "notes"], [b["id"] for b in blocks])
+        self.create_async_client.assert_not_called()
+
+    def test_fetches_tables_and_translation_children_but_not_other_pages(self):
+        trees = ncms_fetch.fetch_block_trees(["page-a", "page-b"], workers=2)
+
+        self.assertEqual(
+            {"page-a", "page-b", "table-a", "child-hi"}, set(self.client.calls)
+        )
+        self.assertLessEqual(self.client.max_in_flight, 2)
+        table_block = trees["page-a"][1]
+        self.assertEqual("row-1", table_block["table"]["children"][0]["id"])
+
+    def test_concurrent_extraction_keeps_article_order(self):
+        pages = [make_page("alpha", "page-a"), make_page("beta", "page-b")]
+        with patch.object(ncms_fetch, "notion") as notion:
+            articles = ncms_fetch.extract_fields(pages, workers=4)
+
+        notion.blocks.children.list.assert_not_called()
+        self.assertEqual(
+            [("alpha", "en"), ("alpha", "hi"), ("beta", "en")],
+            [(article["slug"], article["language"]) for article in articles],
+        )
+        self.assertIn("<td>cell</td>", articles[0]["content"])
+        self.assertIn("Hindi body", articles[1]["content"])
+
+
+if __name__ == "__main__":
+    unittest.main()
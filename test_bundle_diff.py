@@ -0,0 +1,141 @@
+import io
+import json
+import os
+import tarfile
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ncms_fetch
+
+
+class BundleDiffTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = temp_dir.name
+        patcher = patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_bundle(self, name, files):
+        """Write ``files`` through the output layer and return the metadata path."""
+        bundle_dir = os.path.join(self.root, name)
+        ncms_fetch.reset_output_changes()
+        for relative_path, text in files.items():
+            path = os.path.join(bundle_dir, *relative_path.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            ncms_fetch.write_output(path, text)
+        manifest = ncms_fetch.bundle_files(bundle_dir)
+        metadata_file = os.path.join(self.root, f"{name}.json")
+        with open(metadata_file, "w", encoding="utf-8") as target:
+            json.dump({"files": manifest, "bundle_sha256": ncms_fetch.bundle_digest(manifest)}, target)
+        return bundle_dir, metadata_file
+
+    def make_bundles(self):
+        _, previous = self.make_bundle("old", {
+            "HTML/Component/world/a/index.php": "<p>A</p>",
+            "HTML/Component/hi/world/a/index.php": "<p>Old</p>",
+            "Config/ID.tsv": "Status\tId\npublish\tworld/a\n",
+            "Config/ID_fr.tsv": "Status\tId\n",
+        })
+        bundle_dir, current = self.make_bundle("new", {
+            "HTML/Component/world/a/index.php": "<p>A</p>",
+            "HTML/Component/hi/world/a/index.php": "<p>New</p>",
+            "Config/ID.tsv": "Status\tId\npublish\tworld/a\n",
+            "Config/Translations.tsv": "Group\ten\thi\n",
+        })
+        return bundle_dir, current, previous
+
+    def test_patch_dir_holds_only_added_and_changed_files(self):
+        bundle_dir, current, previous = self.make_bundles()
+        patch_dir = os.path.join(self.root, "patch")
+
+        result = ncms_fetch.diff_bundle(bundle_dir, current, previous, patch_dir=patch_dir)
+
+        copied = sorted(
+            os.path.relpath(os.path.join(directory, name), patch_dir).replace(os.sep, "/")
+            for directory, _, names in os.walk(patch_dir) for name in names
+        )
+        self.assertEqual(
+            ["Config/Translations.tsv", "HTML/Component/hi/world/a/index.php", "patch.json"],
+            copied,
+        )
+        self.assertEqual(["Config/Translations.tsv"], [item["path"] for item in result["added"]])
+        self.assertEqual(
+            ["HTML/Component/hi/world/a/index.php"], [item["path"] for item in result["changed"]]
+        )
+        self.assertEqual(["Config/ID_fr.tsv"], result["removed"])
+        with open(os.path.join(patch_dir, "patch.json"), encoding="utf-8") as source:
+            self.assertEqual(result, json.load(source))
+
+    def test_tar_stream_matches_patch_dir(self):
+        bundle_dir, current, previous = self.make_bundles()
+        tar_path = os.path.join(self.root, "patch.tgz")
+
+        result = ncms_fetch.diff_bundle(bundle_dir, current, previous, tar_file=tar_path)
+
+        with tarfile.open(tar_path) as archive:
+            names = archive.getnames()
+            component = archive.extractfile("HTML/Component/hi/world/a/index.php").read()
+            manifest = json.load(archive.extractfile("patch.json"))
+        self.assertEqual(
+            ["Config/Translations.tsv", "HTML/Component/hi/world/a/index.php", "patch.json"],
+            names,
+        )
+        self.assertEqual(b"<p>New</p>", component)
+        self.assertEqual(result, manifest)
+
+    def test_identical_bundles_give_an_empty_patch(self):
+        bundle_dir, current = self.make_bundle("same", {"Config/ID.tsv": "Status\tId\n"})
+        stdout = io.BytesIO()
+        with patch("sys.stdout", io.TextIOWrapper(stdout)):
+            result = ncms_fetch.diff_bundle(bundle_dir, current, current, tar_file="-")
+            with tarfile.open(fileobj=io.BytesIO(stdout.getvalue())) as archive:
+                self.assertEqual(["patch.json"], archive.getnames())
+        self.assertEqual(([], [], []), (result["added"], result["changed"], result["removed"]))
+        self.assertEqual(result["base_bundle_sha256"], result["bundle_sha256"])
+
+    def test_edited_bundle_file_is_rejected(self):
+        bundle_dir, current, previous = self.make_bundles()
+        with open(os.path.join(bundle_dir, "Config", "Translations.tsv"), "a", encoding="utf-8") as f:
+            f.write("tampered\n")
+        with self.assertRaisesRegex(RuntimeError, "changed after publish"):
+            ncms_fetch.diff_bundle(
+                bundle_dir, current, previous, patch_dir=os.path.join(self.root, "patch")
+            )
+
+    def test_unsafe_manifest_path_is_rejected(self):
+        bundle_dir, current, _ = self.make_bundles()
+        previous = os.path.join(self.root, "evil.json")
+        for path in ("../etc/passwd", "/etc/passwd", "C:/Windows/win.ini", "a\\..\\..\\b", ""):
+            with self.subTest(path=path):
+                with open(previous, "w", encoding="utf-8") as target:
+                    json.dump({"files": [{"path": path, "sha256": "", "size": 0}]}, target)
+                with self.assertRaisesRegex(RuntimeError, "Unsafe path"):
+                    ncms_fetch.diff_bundle(bundle_dir, current, previous, tar_file="-")
+
+    def test_title_derived_component_names_are_accepted(self):
+        _, previous = self.make_bundle("old", {"HTML/Component/world/a/index.php": "<p>A</p>"})
+        bundle_dir, current = self.make_bundle("new", {
+            "HTML/Component/world/a/index.php": "<p>A</p>",
+            "HTML/Component/world/a/second_title_with spaces.php": "<p>B</p>",
+            "HTML/Component/hi/world/a/हिन्दी_शीर्षक.php": "<p>C</p>",
+        })
+        patch_dir = os.path.join(self.root, "patch")
+        ncms_fetch.diff_bundle(bundle_dir, current, previous, patch_dir=patch_dir)
+        self.assertTrue(os.path.isfile(
+            os.path.join(patch_dir, "HTML", "Component", "hi", "world", "a", "हिन्दी_शीर्षक.php")
+        ))
+
+    def test_cli_requires_one_patch_target(self):
+        parser = ncms_fetch.build_parser()
+        with patch("sys.stderr"), self.assertRaises(SystemExit):
+            parser.parse_args([
+                "diff", "--bundle-dir", "b", "--metadata-file", "m",
+                "--previous-metadata-file", "p",
+            ])
+
+
+if __name__ == "__main__":
+    unittest.main()
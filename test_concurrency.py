@@ -0,0 +1,166 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import ncms_notion
+
+
+class FakeNotionServer(ThreadingHTTPServer):
+    """Local stand-in for the Notion API that throttles above ``capacity``.
+
+    Every request takes ``delay`` seconds. A request arriving while
+    ``capacity`` others are already being served is answered with 429.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, capacity, delay=0.02):
+        super().__init__(("127.0.0.1", 0), FakeNotionHandler)
+        self.capacity = capacity
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.served = 0
+        self.throttled = 0
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeNotionHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            throttle = server.in_flight >= server.capacity
+            if throttle:
+                server.throttled += 1
+            else:
+                server.in_flight += 1
+                server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+        if throttle:
+            self.respond(429, {"object": "error", "code": "rate_limited", "message": "Slow down"})
+            return
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+            server.served += 1
+        self.respond(200, {"object": "page", "id": self.path.rsplit("/", 1)[-1]})
+
+    def respond(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ConcurrencyControllerTests(unittest.TestCase):
+    def test_window_grows_additively_and_halves_on_throttle(self):
+        controller = ncms_notion.ConcurrencyController(initial=2, maximum=8, latency_target=1.0)
+        for _ in range(4):
+            controller.acquire()
+            controller.release(latency=0.1)
+        self.assertGreater(controller.window, 3.0)
+        self.assertLess(controller.window, 4.0)
+
+        window = controller.window
+        controller.acquire()
+        controller.release(throttled=True)
+        self.assertAlmostEqual(window / 2, controller.window)
+        self.assertEqual(1, controller.decreases)
+
+    def test_slow_responses_stop_growth(self):
+        controller = ncms_notion.ConcurrencyController(initial=2, maximum=8, latency_target=0.5)
+        for _ in range(5):
+            controller.acquire()
+            controller.release(latency=2.0)
+        self.assertEqual(2.0, controller.window)
+
+    def test_window_never_drops_below_one(self):
+        controller = ncms_notion.ConcurrencyController(initial=1, maximum=4, latency_target=1.0)
+        controller.acquire()
+        controller.release(throttled=True)
+        self.assertEqual(1, controller.window)
+
+
+class FakeServerTests(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeNotionServer(capacity=3)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        ncms_notion.reset_stats()
+        self.controller = ncms_notion.ConcurrencyController(
+            initial=8, maximum=8, latency_target=5.0
+        )
+        for name, value in (
+            ("_concurrency", self.controller),
+            ("_rate_limiter", ncms_notion.TokenBucket(rate=1000, burst=1000)),
+            ("BACKOFF_BASE_SECONDS", 0.01),
+        ):
+            patcher = patch.object(ncms_notion, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.dict("os.environ", {"NOTION_MAX_RETRIES": "50"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sync_workers_back_off_to_server_capacity(self):
+        client = ncms_notion.create_client(base_url=self.server.base_url)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            pages = list(pool.map(
+                lambda n: client.pages.retrieve(page_id=f"page-{n}"), range(60)
+            ))
+
+        self.assertEqual([f"page-{n}" for n in range(60)], [page["id"] for page in pages])
+        self.assertGreater(self.server.throttled, 0)
+        self.assertGreater(self.controller.decreases, 0)
+        self.assertLess(self.controller.window, 8)
+        self.assertEqual(0, self.controller.in_flight)
+        self.assertIn("concurrency window", ncms_notion.format_stats())
+
+    def test_async_requests_share_the_controller(self):
+        async def run():
+            client = ncms_notion.create_async_client(base_url=self.server.base_url)
+            async with client:
+                return await asyncio.gather(*(
+                    client.pages.retrieve(page_id=f"page-{n}") for n in range(60)
+                ))
+
+        pages = asyncio.run(run())
+
+        self.assertEqual(60, len(pages))
+        self.assertGreater(self.controller.decreases, 0)
+        self.assertLess(self.controller.window, 8)
+        self.assertEqual(0, self.controller.in_flight)
+
+    def test_healthy_server_lets_window_grow(self):
+        self.server.capacity = 100
+        self.controller.window = 1.0
+        client = ncms_notion.create_client(base_url=self.server.base_url)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda n: client.pages.retrieve(page_id=f"page-{n}"), range(30)))
+
+        self.assertEqual(0, self.server.throttled)
+        self.assertGreater(self.controller.window, 4)
+        self.assertGreater(self.server.peak_in_flight, 1)
+        self.assertIsNotNone(self.controller.latency)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+import ncms_upload
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ARTICLE = """<div id='message'>
+\t<?php $alt='A lighthouse at dusk'; require('../HTML/Fragment/Component_cover.php') ?>
+\t<h2><?php echo $desc; ?></h2>
+\t<p class='first-letter-high'>Once upon a time &amp; far away&mdash;a <b>bold</b> start.</p>
+\t<h3>Getting there</h3>
+\t<p>Read <a href="/world/map">the map</a> or <?php link_xurl('world/guide', 'the guide') ?>.<br>
+\t\tThen <i>walk</i> &#150; slowly, <span class="bold">really</span> <code>slowly</code>.</p>
+\t<ul>
+\t\t<li><div>First <u>stop</u></div></li>
+\t\t<li><div>Second <s>stop</s></div></li>
+\t</ul>
+\t<ol><li>One</li><li><div>Two</div> ignored</li></ol>
+\t<?php $img_title='harbour'; $ext='png'; $alt='The harbour'; require('Fragment/Component_image.php') ?>
+\t<div class='indent-c'><table>
+\t\t<tr><td>Mile</td><td>Town &amp; port</td></tr>
+\t\t<tr><td>12</td><td><b>Dover</b> <!-- check --> </td></tr>
+\t</table></div>
+\t<pre><code>for step in steps:
+    walk(step)</code></pre>
+\t<blockquote>Go <em>west</em>.</blockquote>
+\t<h4>Notes</h4>
+\t<p>Line one<br/>line two<br />line three</p>
+\t<?php group_image('coast', 3, 'svg') ?>
+\t<div class='content-body-separator'></div>
+\t<div id='fb_components'><p>Like us</p></div>
+\t<div class='message_leave'><p>Bye</p></div>
+</div>
+<div class='content-body-separator'></div>
+<?php require('../HTML/Fragment/Component_bottom.php') ?>
+<div id='home-menu'><p>Home</p><?php link_xurl('index', 'Index') ?></div>
+"""
+
+# Markup where html.parser and BeautifulSoup behave in less obvious ways.
+QUIRKS = (
+    "<div id='message'><p>a<br>b<br/>c<br/>d</p><p>after</p></div>",
+    "<div id='message'><p>a<br>b</br>c</p><p>x</y>\n  y</p></div>",
+    "<div id='message'><p>unclosed<h3>nested</h3></div><p>outside</p>",
+    "<div id='message'><h2>echo </x>$desc</h2><h2>x<!--echo $desc-->y</h2><h2>kept</h2></div>",
+    "<div id='message'><p>&foo; &amp &#0; &#x110000; &#129; &copymore a < b & c</p></div>",
+    "<div id='message'><P CLASS=first-letter-high>Upper</P><p class=x class=first-letter-high>d</p></div>",
+    "<div id='message'><pre>  keep \n\n  <b> </b> <code> a </code></pre></div>",
+    "<section><div id='message'><p>nested</p></div></section><div class='content-body-separator'></div>",
+    "<p>no message div</p><?php link_xurl('a', 'b') ?><div><h2>t</h2></div>",
+    "<div id='message'><table><tr><td>a<table><tr><td>inner</td></tr></table></td></tr></table></div>",
+)
+
+UNSUPPORTED = (
+    "<div id='message'><script>var a = '<p>';</script></div>",
+    "<!DOCTYPE html><div id='message'><p>a</p></div>",
+    "<div id='message'><a href=\"<?php echo $url ?>\">x</a></div>",
+    "<div id='message'><p><a href=/x>unquoted</a></p></div>",
+    "<div id='message'><p>cut off &amp</p></div>&amp",
+    "<div id='message'></div><div id='message'></div>",
+)
+
+
+def as_json(blocks):
+    return json.dumps(blocks, ensure_ascii=False)
+
+
+class FastParserTests(unittest.TestCase):
+    def assertSameBlocks(self, markup):
+        expected = ncms_upload.parse_markup_to_blocks(markup)
+        self.assertEqual(as_json(expected), as_json(ncms_upload.parse_markup_fast(markup)))
+        return expected
+
+    def test_article_blocks_are_identical(self):
+        blocks = self.assertSameBlocks(ARTICLE)
+        self.assertEqual([
+            'callout', 'callout', 'heading_1', 'paragraph', 'bulleted_list_item',
+            'bulleted_list_item', 'numbered_list_item', 'numbered_list_item', 'callout',
+            'table', 'code', 'quote', 'heading_3', 'paragraph', 'callout', 'divider',
+            'divider', 'paragraph', 'callout',
+        ], [block['type'] for block in blocks])
+
+    def test_parser_quirks_are_reproduced(self):
+        for markup in QUIRKS:
+            with self.subTest(markup=markup):
+                self.assertSameBlocks(markup)
+
+    def test_unsupported_markup_falls_back_to_beautifulsoup(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "article.php")
+            for markup in UNSUPPORTED:
+                with self.subTest(markup=markup):
+                    with self.assertRaises(ncms_upload.UnsupportedMarkup):
+                        ncms_upload.parse_markup_fast(markup)
+                    with open(path, "w", encoding="utf-8") as f:
+                        f.write(markup)
+                    self.assertEqual(
+                        ncms_upload.parse_file_to_blocks(path),
+                        ncms_upload.parse_file_to_blocks(path, parser="fast"),
+                    )
+
+    def test_fast_parse_does_not_load_beautifulsoup(self):
+        result = subprocess.run(
+            [sys.executable, "-c", (
+                "import sys, ncms_upload\n"
+                f"ncms_upload.parse_markup_fast({ARTICLE!r})\n"
+                "print('bs4' in sys.modules)"
+            )],
+            cwd=HERE, capture_output=True, text=True, check=True,
+        )
+        self.assertEqual("False", result.stdout.strip())
+
+    def test_working_memory_is_a_fraction_of_beautifulsoup(self):
+        markup = ARTICLE.replace("</div>\n<div class='content", "\n".join(
+            ARTICLE.split("\n")[3:24] * 20
+        ) + "</div>\n<div class='content", 1)
+        ncms_upload.parse_markup_to_blocks(markup)  # Load bs4 outside the measurement.
+        peaks = {}
+        for name, parse in (
+            ("bs4", ncms_upload.parse_markup_to_blocks),
+            ("fast", ncms_upload.parse_markup_fast),
+        ):
+            tracemalloc.start()
+            try:
+                blocks = parse(markup)
+                peaks[name] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        self.assertGreater(len(blocks), 300)
+        self.assertLess(peaks["fast"] * 2, peaks["bs4"])
+
+
+class ParserOptionTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = temp_dir.name
+        self.paths = []
+        for name, markup in (("article", ARTICLE), ("quirks", QUIRKS[0]),
+                             ("script", UNSUPPORTED[0])):
+            path = os.path.join(self.root, f"{name}.php")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(markup)
+            self.paths.append(path)
+
+    def test_pooled_fast_parse_matches_serial_bs4_parse(self):
+        self.assertEqual(
+            list(ncms_upload.parse_files(self.paths)),
+            list(ncms_upload.parse_files(self.paths, jobs=2, parser="fast")),
+        )
+
+    def test_compare_parsers_reports_fallbacks(self):
+        report = ncms_upload.compare_parsers(self.paths)
+        self.assertEqual(3, report["files"])
+        self.assertEqual([], report["mismatched"])
+        self.assertEqual([self.paths[2]], report["fallback"])
+
+    def test_check_parser_cli_summarises_the_corpus(self):
+        printed = []
+        with (
+            patch.object(ncms_upload, "COMPONENT_DIR", self.root),
+            patch("sys.argv", ["ncms_upload.py", "--check-parser"]),
+            patch("builtins.print", side_effect=lambda *args: printed.append(" ".join(map(str, args)))),
+        ):
+            ncms_upload.main()
+
+        self.assertIn(f"FALLBACK {self.paths[2]}", printed)
+        self.assertTrue(printed[-1].startswith(
+            "Parser check: 2 identical, 0 mismatched, 1 fell back to bs4;"
+        ))
+
+    def test_check_parser_cli_fails_on_a_mismatch(self):
+        printed = []
+        with (
+            patch.object(ncms_upload, "COMPONENT_DIR", self.root),
+            patch.object(ncms_upload, "parse_markup_fast", return_value=[]),
+            patch("sys.argv", ["ncms_upload.py", "--check-parser"]),
+            patch("builtins.print", side_effect=lambda *args: printed.append(" ".join(map(str, args)))),
+            self.assertRaises(SystemExit) as exit,
+        ):
+            ncms_upload.main()
+
+        self.assertEqual(1, exit.exception.code)
+        self.assertIn(f"MISMATCH {self.paths[0]}", printed)
+        self.assertTrue(printed[-1].startswith("Parser check: 1 identical, 2 mismatched,"))
+
+    def test_unknown_parser_is_rejected(self):
+        printed = []
+        with (
+            patch("sys.argv", ["ncms_upload.py", "--parser=lxml", "--dry-run"]),
+            patch("builtins.print", side_effect=lambda *args: printed.append(" ".join(map(str, args)))),
+            patch.object(ncms_upload, "build_file_map") as build_file_map,
+            self.assertRaises(SystemExit) as exit,
+        ):
+            ncms_upload.main()
+        self.assertEqual(1, exit.exception.code)
+        build_file_map.assert_not_called()
+        self.assertEqual(["Error: unknown parser 'lxml' (expected one of bs4, fast)"], printed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,7 +12,7 @@ from ncms_fetch import render_rich_text, wrap_lists
 from ncms_fetch import (
     handle_paragraph, handle_heading_1, handle_heading_2, handle_heading_3,
     handle_bulleted_list_item, handle_numbered_list_item,
-    handle_quote, handle_code, handle_divider,
+    handle_quote, handle_code, handle_divider, handle_table,
     handle_callout, handle_cover_image, handle_content_image,
     handle_link_xurl, handle_raw_php, handle_first_letter_high,
     extract_fields, update_id_tsv, update_translations_tsv, update_sitemap_xml,
@@ -184,6 +184,36 @@ block = {"divider": {}}
 btype, html = handle_divider(block, None)
 check("Divider", html, "content-body-separator")
 
+# Table with prefetched rows
+def table_row(*cells):
+    return {"type": "table_row", "table_row": {"cells": [[rt(cell)] for cell in cells]}}
+
+block = {"id": "table-1", "table": {"children": [table_row("a", "b"), table_row("c", "d")]}}
+btype, html = handle_table(block, None)
+check("Table rows", html, "\t\t<tr><td>a</td><td>b</td></tr>\n\t\t<tr><td>c</td><td>d</td></tr>\n")
+
+# Table fetched on demand pages through every row
+class PagedRows:
+    def __init__(self, total, page_size=100):
+        self.rows = [table_row(f"r{n}") for n in range(total)]
+        self.page_size = page_size
+        self.calls = 0
+        self.blocks = self
+        self.children = self
+
+    def list(self, block_id, start_cursor=None):
+        self.calls += 1
+        start = int(start_cursor or 0)
+        end = start + self.page_size
+        return {"results": self.rows[start:end], "has_more": end < len(self.rows),
+                "next_cursor": str(end) if end < len(self.rows) else None}
+
+paged = PagedRows(250)
+btype, html = handle_table({"id": "table-2", "table": {}}, paged)
+check("Table pages past 100 rows", str(html.count("<tr>")), "250")
+check("Table last row", html, "<td>r249</td></tr>\n\t</table>")
+check("Table cursor pages", str(paged.calls), "3")
+
 
 print("\n=== Callout Handlers ===")
 
@@ -450,10 +480,12 @@ mock_page_no_lang = {
     }
 }
 
-# Monkey-patch fetch_page_content to avoid API calls
+# Monkey-patch fetch_block_trees to avoid API calls
 import ncms_fetch
-original_fpc = ncms_fetch.fetch_page_content
-ncms_fetch.fetch_page_content = lambda page_id: '<p>Mock content</p>'
+original_fbt = ncms_fetch.fetch_block_trees
+ncms_fetch.fetch_block_trees = lambda page_ids, **kwargs: {
+    page_id: [] for page_id in page_ids
+}
 
 try:
     articles = extract_fields([mock_page_en, mock_page_hi, mock_page_no_lang])
@@ -482,7 +514,7 @@ try:
     check("Explicit test status included", str(len(test_articles)), "1")
     check("Explicit test status retained", test_articles[0]['status'], "test")
 finally:
-    ncms_fetch.fetch_page_content = original_fpc
+    ncms_fetch.fetch_block_trees = original_fbt
 
 
 print(f"\n=== Results: {passed} passed, {failed} failed ===")
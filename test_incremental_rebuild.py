@@ -0,0 +1,188 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ncms_fetch
+import ncms_notion
+import test_block_cache
+from test_block_cache import NEW_EDIT, OLD_EDIT
+from test_block_trees import make_page, metadata_callout
+
+BASE_EDIT = "2024-01-01T09:00:00.000Z"
+
+
+class TranslatedPageClient(test_block_cache.FakeAsyncClient):
+    """test_block_cache's page, whose child page carries translation metadata."""
+
+    async def list_children(self, block_id, start_cursor=None):
+        response = await super().list_children(block_id, start_cursor)
+        if block_id == "child-hi":
+            response["results"].insert(0, metadata_callout("hi"))
+        return response
+
+
+def make_article(slug, language="en", status="publish"):
+    return {
+        "id": f"{slug}-{language}",
+        "status": status,
+        "slug": slug,
+        "language": language,
+        "translation_group": slug,
+        "label": slug,
+        "title": slug,
+        "js": "0",
+        "description": "",
+        "type": "article",
+        "content": "<p>Body</p>",
+    }
+
+
+class IncrementalQueryTests(unittest.TestCase):
+    def test_unchanged_nested_translation_is_skipped(self):
+        blocks = [{
+            "id": "child-hi",
+            "type": "child_page",
+            "last_edited_time": "2024-01-01T09:00:00.000Z",
+            "child_page": {"title": "हिन्दी (hi)"},
+        }]
+        with patch.object(ncms_fetch, "fetch_page_blocks") as fetch:
+            translations = ncms_fetch.extract_nested_translations(
+                blocks,
+                make_article("world/example"),
+                edited_after="2024-01-01T10:00:00.000Z",
+            )
+        self.assertEqual([], translations)
+        fetch.assert_not_called()
+
+
+class IncrementalConfigTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = temp_dir.name
+        patcher = patch.object(ncms_fetch, "project_dir", self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_merged_sitemap_keeps_other_urls_and_skipped_alternates(self):
+        full = [
+            make_article("about"),
+            make_article("world/example"),
+            make_article("world/example", "hi"),
+        ]
+        ncms_fetch.update_id_tsv(full, self.root)
+        ncms_fetch.update_sitemap_xml(full, self.root)
+
+        edited = [make_article("world/example")]
+        ncms_fetch.update_id_tsv(edited, self.root)
+        ncms_fetch.update_sitemap_xml(edited, self.root, merge=True)
+
+        with open(os.path.join(self.root, "Site", "sitemap.xml"), encoding="utf-8") as f:
+            sitemap = f.read()
+        self.assertEqual(3, sitemap.count("<url>"))
+        self.assertIn("<loc>https://ujnotes.com/about</loc>", sitemap)
+        self.assertEqual(2, sitemap.count('hreflang="hi"'))
+
+    def test_merged_firebase_keeps_other_rules(self):
+        ncms_fetch.update_firebase_json(
+            [make_article("world/about"), make_article("world/example")], self.root
+        )
+        ncms_fetch.update_firebase_json(
+            [make_article("world/example")], self.root, merge=True
+        )
+        with open(os.path.join(self.root, "build", "firebase.json"), encoding="utf-8") as f:
+            hosting = json.load(f)["hosting"]
+        self.assertEqual(
+            ["/about", "/example"], [rule["source"] for rule in hosting["redirects"]]
+        )
+        self.assertEqual(4, len(hosting["rewrites"]))
+
+
+class IncrementalRebuildTests(unittest.TestCase):
+    def test_rebuild_records_and_reuses_watermark(self):
+        pages = [
+            ncms_fetch.page_record({"id": "a", "last_edited_time": "2024-01-01T10:00:00.000Z"}),
+            ncms_fetch.page_record({"id": "b", "last_edited_time": "2024-01-02T08:30:00.000Z"}),
+        ]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with (
+                patch.object(ncms_fetch, "database_id", "database"),
+                patch.object(ncms_fetch, "output_dir", temp_dir),
+                patch.object(
+                    ncms_fetch, "iter_database_content", side_effect=lambda *a, **k: iter(pages)
+                ) as query,
+                patch.object(
+                    ncms_fetch, "rebuild_pipeline", side_effect=lambda pages, **k: list(pages) and []
+                ) as extract,
+                patch.object(ncms_fetch, "write_ids_tsv"),
+                patch.object(ncms_fetch, "update_site_config") as transform,
+            ):
+                ncms_fetch.legacy_main(incremental=True)
+                query.assert_called_with("database")
+                transform.assert_called_with([], merge_config=False)
+
+                ncms_fetch.legacy_main(incremental=True)
+                query.assert_called_with("database")
+                self.assertEqual(
+                    "2024-01-02T08:30:00.000Z", extract.call_args.kwargs["edited_after"]
+                )
+                transform.assert_called_with([], merge_config=True)
+
+    def test_watermark_file_records_newest_page_record(self):
+        pages = [
+            ncms_fetch.page_record({"id": "a", "last_edited_time": "2024-01-03T10:00:00.000Z"}),
+            ncms_fetch.page_record({"id": "b", "last_edited_time": "2024-01-02T08:30:00.000Z"}),
+        ]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with (
+                patch.object(ncms_fetch, "database_id", "database"),
+                patch.object(ncms_fetch, "output_dir", temp_dir),
+                patch.object(
+                    ncms_fetch, "iter_database_content", side_effect=lambda *a, **k: iter(pages)
+                ),
+                patch.object(
+                    ncms_fetch, "rebuild_pipeline", side_effect=lambda pages, **k: list(pages) and []
+                ),
+                patch.object(ncms_fetch, "write_ids_tsv"),
+                patch.object(ncms_fetch, "update_site_config"),
+            ):
+                self.assertEqual(0, ncms_fetch.legacy_main(incremental=True))
+            with open(ncms_fetch.sync_state_path(temp_dir), encoding="utf-8") as f:
+                self.assertEqual({"last_edited_time": "2024-01-03T10:00:00.000Z"}, json.load(f))
+
+    def test_edit_inside_a_child_page_re_renders_only_that_translation(self):
+        page = make_page("world/example", "page-a")
+        page["last_edited_time"] = BASE_EDIT
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with (
+                patch.object(ncms_fetch, "database_id", "database"),
+                patch.object(ncms_fetch, "output_dir", temp_dir),
+                patch.object(ncms_fetch, "block_cache_enabled", True),
+                patch.object(ncms_fetch, "block_cache_dir", os.path.join(temp_dir, "cache")),
+                patch.object(
+                    ncms_fetch, "iter_database_content",
+                    side_effect=lambda *a, **k: iter([ncms_fetch.page_record(page)]),
+                ),
+                patch.object(ncms_fetch, "write_ids_tsv"),
+                patch.object(ncms_fetch, "update_site_config") as transform,
+                patch("builtins.print"),
+            ):
+                for child_edited_time in (OLD_EDIT, NEW_EDIT):
+                    client = TranslatedPageClient(child_edited_time)
+                    with patch.object(ncms_notion, "create_async_client", return_value=client):
+                        ncms_fetch.legacy_main(incremental=True)
+
+            # The base page came from the cache; its stale child_page block
+            # was checked against the child page itself.
+            self.assertEqual(["child-hi"], client.listed)
+            articles = transform.call_args.args[0]
+            self.assertEqual([("world/example", "hi")],
+                             [(article["slug"], article["language"]) for article in articles])
+            with open(ncms_fetch.sync_state_path(temp_dir), encoding="utf-8") as f:
+                self.assertEqual(NEW_EDIT, json.load(f)["last_edited_time"])
+
+
+if __name__ == "__main__":
+    unittest.main()
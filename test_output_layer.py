@@ -0,0 +1,101 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ncms_fetch
+
+
+def make_article(slug, language="en"):
+    return {
+        "id": f"{slug}-{language}",
+        "status": "publish",
+        "slug": slug,
+        "language": language,
+        "translation_group": slug,
+        "label": slug,
+        "title": slug,
+        "js": "0",
+        "description": "",
+        "type": "article",
+        "content": "<p>Body</p>",
+    }
+
+
+class OutputFileTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = temp_dir.name
+        self.path = os.path.join(self.root, "file.txt")
+        ncms_fetch.reset_output_changes()
+
+    def test_unchanged_content_keeps_file_and_mtime(self):
+        self.assertTrue(ncms_fetch.write_output(self.path, "same\n"))
+        os.utime(self.path, (1_000_000, 1_000_000))
+
+        self.assertFalse(ncms_fetch.write_output(self.path, "same\n"))
+        self.assertEqual(1_000_000, os.path.getmtime(self.path))
+        self.assertEqual([self.path], ncms_fetch.output_changes)
+        self.assertEqual(["file.txt"], os.listdir(self.root))
+
+    def test_changed_content_replaces_file(self):
+        ncms_fetch.write_output(self.path, "before")
+        self.assertTrue(ncms_fetch.write_output(self.path, "after!"))
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual("after!", f.read())
+        self.assertEqual([self.path, self.path], ncms_fetch.output_changes)
+
+    def test_manifest_records_digest_and_size_of_written_bytes(self):
+        ncms_fetch.write_output(self.path, "caf\u00e9\n")
+        ncms_fetch.write_output(self.path, "caf\u00e9\n")
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        expected = {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+        self.assertEqual({os.path.abspath(self.path): expected}, ncms_fetch.output_manifest)
+        self.assertEqual(expected, ncms_fetch.manifest_entry(self.path))
+
+    def test_failed_write_leaves_original_and_no_temp_file(self):
+        ncms_fetch.write_output(self.path, "original")
+        with self.assertRaises(RuntimeError):
+            with ncms_fetch.OutputFile(self.path) as f:
+                f.write("partial")
+                raise RuntimeError("render failed")
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual("original", f.read())
+        self.assertEqual(["file.txt"], os.listdir(self.root))
+
+
+class SiteOutputTests(unittest.TestCase):
+    def test_second_identical_run_changes_nothing(self):
+        with tempfile.TemporaryDirectory() as root, patch("builtins.print"):
+            with (
+                patch.object(ncms_fetch, "output_dir", root),
+                patch.object(ncms_fetch, "project_dir", root),
+                patch.object(ncms_fetch, "git_push_enabled", False),
+                patch.object(ncms_fetch, "notion_update_enabled", False),
+            ):
+                articles = [make_article("world/a"), make_article("world/a", "hi")]
+                ncms_fetch.transform_to_php([dict(article) for article in articles])
+                first = list(ncms_fetch.output_changes)
+                ncms_fetch.transform_to_php([dict(article) for article in articles])
+                second = list(ncms_fetch.output_changes)
+
+                articles[1]["content"] = "<p>Changed</p>"
+                ncms_fetch.transform_to_php([dict(article) for article in articles])
+                third = list(ncms_fetch.output_changes)
+
+        self.assertIn(
+            os.path.join(root, "HTML/Component/", "world/a", "index.php"), first
+        )
+        self.assertGreaterEqual(len(first), 8)
+        self.assertEqual([], second)
+        self.assertEqual(
+            [os.path.join(root, "HTML/Component/hi/", "world/a", "index.php")], third
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
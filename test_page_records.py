@@ -0,0 +1,84 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+import ncms_fetch
+
+
+def raw_page(**properties):
+    return {
+        "id": "page-1",
+        "last_edited_time": "2024-01-01T10:00:00.000Z",
+        "properties": properties,
+    }
+
+
+class PageRecordTests(unittest.TestCase):
+    def test_projects_consumed_properties(self):
+        record = ncms_fetch.page_record(raw_page(
+            Id={"title": [{"plain_text": "world/example"}]},
+            Status={"select": {"name": "publish"}},
+            Label={"rich_text": [{"plain_text": "Label"}]},
+            Title={"rich_text": [{"plain_text": "Title"}]},
+            JS={"select": {"name": "1"}},
+            Description={"rich_text": []},
+            Type={"select": {"name": "article"}},
+            Flags={"multi_select": [{"name": "a"}, {"name": "b"}]},
+            Language={"select": {"name": "hi"}},
+            TranslationGroup={"rich_text": [{"plain_text": "world/group"}]},
+            Unused={"rich_text": [{"plain_text": "x" * 1000}]},
+        ))
+
+        self.assertEqual("page-1", record.id)
+        self.assertEqual("2024-01-01T10:00:00.000Z", record.last_edited_time)
+        self.assertEqual(
+            ("world/example", "publish", "Label", "Title", "1", "", "article", "a b", "hi", "world/group"),
+            (record.slug, record.status, record.label, record.title, record.js,
+             record.description, record.type, record.flags, record.language,
+             record.translation_group),
+        )
+        self.assertFalse(hasattr(record, "__dict__"))
+
+    def test_defaults_for_missing_properties(self):
+        record = ncms_fetch.page_record(raw_page(Id={"title": [{"plain_text": "slug"}]}))
+        self.assertEqual("", record.status)
+        self.assertEqual("0", record.js)
+        self.assertIsNone(record.flags)
+        self.assertEqual("en", record.language)
+        self.assertEqual("slug", record.translation_group)
+        self.assertIs(record, ncms_fetch.page_record(record))
+
+    def test_query_requests_only_consumed_property_ids(self):
+        calls = []
+
+        async def retrieve(database_id):
+            calls.append(("retrieve", database_id))
+            return {"properties": {
+                "Id": {"id": "title"},
+                "Status": {"id": "%3ASt"},
+                "Flags": {"id": "Fl"},
+                "Internal notes": {"id": "zz"},
+            }}
+
+        async def query(**kwargs):
+            calls.append(("query", kwargs["filter_properties"]))
+            return {"results": [raw_page(Id={"title": [{"plain_text": "a"}]})], "has_more": False}
+
+        client = SimpleNamespace(databases=SimpleNamespace(query=query, retrieve=retrieve))
+        for _ in range(2):
+            pages = asyncio.run(
+                ncms_fetch.fetch_database_content_async(client, "database-records")
+            )
+
+        self.assertEqual(
+            [("retrieve", "database-records"),
+             ("query", ["title", "%3ASt", "Fl"]),
+             ("query", ["title", "%3ASt", "Fl"])],
+            calls,
+        )
+        self.assertIsInstance(pages[0], ncms_fetch.PageRecord)
+        self.assertEqual("a", pages[0].slug)
+
+
+if __name__ == "__main__":
+    unittest.main()
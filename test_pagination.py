@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import unittest
+
+import ncms_notion
+
+
+class PagedEndpoint:
+    """Serve ``pages`` (lists of results) one cursor page per call."""
+
+    def __init__(self, *pages):
+        self.pages = pages
+        self.calls = []
+        self.requested = [threading.Event() for _ in pages]
+
+    def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        index = int(kwargs.get("start_cursor") or 0)
+        self.requested[index].set()
+        has_more = index + 1 < len(self.pages)
+        return {
+            "results": list(self.pages[index]),
+            "has_more": has_more,
+            "next_cursor": str(index + 1) if has_more else None,
+        }
+
+
+class IterPaginatedTests(unittest.TestCase):
+    def test_yields_results_across_cursor_pages(self):
+        endpoint = PagedEndpoint([1, 2], [3], [4, 5])
+        results = list(ncms_notion.iter_paginated(endpoint, database_id="db"))
+
+        self.assertEqual([1, 2, 3, 4, 5], results)
+        self.assertEqual(
+            [{"database_id": "db"},
+             {"database_id": "db", "start_cursor": "1"},
+             {"database_id": "db", "start_cursor": "2"}],
+            endpoint.calls,
+        )
+
+    def test_next_page_is_requested_while_first_is_consumed(self):
+        endpoint = PagedEndpoint(["a"], ["b"])
+        results = ncms_notion.iter_paginated(endpoint, block_id="page")
+
+        self.assertEqual("a", next(results))
+        self.assertTrue(endpoint.requested[1].wait(5))
+        self.assertEqual(["b"], list(results))
+
+    def test_stops_without_next_cursor(self):
+        endpoint = PagedEndpoint([])
+        self.assertEqual([], list(ncms_notion.iter_paginated(endpoint)))
+        self.assertEqual(1, len(endpoint.calls))
+
+
+class AsyncIterPaginatedTests(unittest.TestCase):
+    def test_async_iterator_prefetches_and_preserves_order(self):
+        calls = []
+
+        async def endpoint(**kwargs):
+            calls.append(kwargs.get("start_cursor"))
+            index = int(kwargs.get("start_cursor") or 0)
+            await asyncio.sleep(0)
+            return {
+                "results": [index * 10, index * 10 + 1],
+                "has_more": index < 2,
+                "next_cursor": str(index + 1) if index < 2 else None,
+            }
+
+        async def run():
+            seen = []
+            async for result in ncms_notion.aiter_paginated(endpoint, block_id="page"):
+                if result == 0:
+                    await asyncio.sleep(0)
+                    seen.append(list(calls))
+                seen.append(result)
+            return seen
+
+        seen = asyncio.run(run())
+        self.assertEqual([None, "1"], seen[0])
+        self.assertEqual([0, 1, 10, 11, 20, 21], seen[1:])
+
+    def test_closing_early_cancels_prefetch(self):
+        started = []
+
+        async def endpoint(**kwargs):
+            started.append(kwargs.get("start_cursor"))
+            if kwargs.get("start_cursor"):
+                await asyncio.sleep(10)
+            return {"results": [1, 2], "has_more": True, "next_cursor": "1"}
+
+        async def run():
+            results = ncms_notion.aiter_paginated(endpoint)
+            first = await results.__anext__()
+            await asyncio.sleep(0)
+            await results.aclose()
+            return first
+
+        self.assertEqual(1, asyncio.run(run()))
+        self.assertEqual([None, "1"], started)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import ncms_fetch
+import ncms_notion
+from test_block_trees import FakeAsyncClient, make_page
+
+
+def read_tree(root):
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, encoding="utf-8") as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+class RebuildPipelineTests(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(
+            ncms_notion, "create_async_client", side_effect=lambda: FakeAsyncClient()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = temp_dir.name
+        self.pages = [
+            make_page("alpha", "page-a"),
+            make_page("beta", "page-b"),
+            make_page("alpha", "page-a2"),
+        ]
+        self.pages[2]["id"] = "page-b"  # Same tree, colliding slug.
+        self.pages[2]["properties"]["Title"]["rich_text"][0]["plain_text"] = "Second Alpha"
+
+    def write_components(self, articles, output_base):
+        written_dirs = set()
+        for article in articles:
+            ncms_fetch.write_component(article, output_base, written_dirs)
+
+    def test_pipeline_writes_the_same_files_as_the_batch_path(self):
+        batch_root = os.path.join(self.root, "batch")
+        pipeline_root = os.path.join(self.root, "pipeline")
+
+        expected = ncms_fetch.extract_fields(self.pages, workers=2)
+        self.write_components(expected, batch_root)
+        with patch.object(ncms_fetch, "output_dir", pipeline_root):
+            articles = ncms_fetch.rebuild_pipeline(iter(self.pages), workers=2, depth=1)
+
+        self.assertEqual(read_tree(batch_root), read_tree(pipeline_root))
+        self.assertIn(os.path.join("HTML", "Component", "alpha", "second_alpha.php"),
+                      read_tree(pipeline_root))
+        self.assertEqual(
+            [{key: value for key, value in article.items() if key != "content"}
+             for article in expected],
+            articles,
+        )
+
+    def test_skipped_pages_are_not_fetched(self):
+        self.pages[1]["properties"]["Status"]["select"]["name"] = "draft"
+        with patch.object(ncms_fetch, "output_dir", self.root):
+            articles = ncms_fetch.rebuild_pipeline(self.pages, depth=2)
+        self.assertEqual(
+            ["alpha", "alpha", "alpha"], [article["slug"] for article in articles]
+        )
+
+    def test_render_failure_stops_every_stage(self):
+        def fail(*args, **kwargs):
+            raise RuntimeError("render failed")
+
+        with (
+            patch.object(ncms_fetch, "output_dir", self.root),
+            patch.object(ncms_fetch, "build_articles", side_effect=fail),
+        ):
+            with self.assertRaisesRegex(RuntimeError, "render failed"):
+                ncms_fetch.rebuild_pipeline(self.pages * 10, depth=1)
+        self.assertEqual(
+            [], [t.name for t in threading.enumerate() if t.name.startswith("ncms-")]
+        )
+
+    def test_bodies_render_on_the_render_thread(self):
+        render_threads = set()
+        paragraph = ncms_fetch.BLOCK_HANDLERS["paragraph"]
+
+        def record_thread(block, notion_client):
+            render_threads.add(threading.current_thread().name)
+            return paragraph(block, notion_client)
+
+        with (
+            patch.object(ncms_fetch, "output_dir", self.root),
+            patch.dict(ncms_fetch.BLOCK_HANDLERS, {"paragraph": record_thread}),
+            patch("builtins.print"),
+        ):
+            ncms_fetch.rebuild_pipeline(self.pages[:2], depth=1)
+        self.assertEqual({"ncms-render"}, render_threads)
+
+    def test_render_failure_skips_only_that_page(self):
+        paragraph = ncms_fetch.BLOCK_HANDLERS["paragraph"]
+
+        def fail_on_beta(block, notion_client):
+            if block["id"] == "b-1":
+                raise ValueError("bad block")
+            return paragraph(block, notion_client)
+
+        printed = []
+        with (
+            patch.object(ncms_fetch, "output_dir", self.root),
+            patch.dict(ncms_fetch.BLOCK_HANDLERS, {"paragraph": fail_on_beta}),
+            patch("builtins.print", side_effect=lambda *args: printed.append(" ".join(args))),
+        ):
+            articles = ncms_fetch.rebuild_pipeline(self.pages[:2], depth=1)
+
+        self.assertEqual(["alpha", "alpha", "beta"], [article["slug"] for article in articles])
+        component = os.path.join("HTML", "Component", "{}", "index.php")
+        written = read_tree(self.root)
+        self.assertIn(component.format("alpha"), written)
+        self.assertNotIn(component.format("beta"), written)
+        self.assertTrue(any(line.startswith("Error writing to") and line.endswith("bad block")
+                            for line in printed))
+
+
+def text_block(block_type, text):
+    return {"type": block_type, block_type: {"rich_text": [{"plain_text": text, "annotations": {}}]}}
+
+
+LONG_PAGE = [
+    text_block("heading_1", "Title"),
+    text_block("bulleted_list_item", "one"),
+    text_block("bulleted_list_item", "two"),
+    text_block("numbered_list_item", "three"),
+    {"id": "t", "type": "table", "table": {"children": [
+        {"table_row": {"cells": [[{"plain_text": f"r{n}", "annotations": {}}]]}}
+        for n in range(300)
+    ]}},
+    text_block("paragraph", ""),
+    text_block("numbered_list_item", "four"),
+]
+
+
+class StreamingRenderTests(unittest.TestCase):
+    def test_fragments_join_to_the_rendered_page(self):
+        fragments = list(ncms_fetch.render_page_fragments(LONG_PAGE))
+        self.assertGreater(len(fragments), 300)
+        self.assertEqual(ncms_fetch.render_page_blocks(LONG_PAGE), "".join(fragments))
+
+    def test_streaming_wrap_lists_matches_wrap_lists(self):
+        tuples = [
+            ("bulleted_list_item", "<li>a</li>"),
+            ("paragraph", ""),
+            ("numbered_list_item", "<li>b</li>"),
+            ("table", iter(["<table>", "</table>"])),
+        ]
+        expected = ncms_fetch.wrap_lists([
+            tuples[0], tuples[1], tuples[2], ("table", "<table></table>")
+        ])
+        self.assertEqual(expected, "".join(ncms_fetch.iter_wrap_lists(tuples)))
+
+    def test_streamed_component_is_byte_identical(self):
+        with tempfile.TemporaryDirectory() as root, patch("builtins.print"):
+            for name, content in (
+                ("joined", ncms_fetch.render_page_blocks(LONG_PAGE)),
+                ("streamed", ncms_fetch.render_page_fragments(LONG_PAGE)),
+            ):
+                article = {"slug": "page", "title": "Page", "js": "1", "content": content}
+                ncms_fetch.write_component(article, os.path.join(root, name), set())
+            written = {}
+            for name in ("joined", "streamed"):
+                path = os.path.join(root, name, "HTML", "Component", "page", "index.php")
+                with open(path, "rb") as f:
+                    written[name] = f.read()
+            joined, streamed = written["joined"], written["streamed"]
+        self.assertEqual(joined, streamed)
+        self.assertTrue(joined.startswith(b"<div id='message'>\n\t\t<h3>Title</h3>"))
+
+
+if __name__ == "__main__":
+    unittest.main()
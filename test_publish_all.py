@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ncms_fetch
+import ncms_notion
+from test_block_trees import FakeAsyncClient, blocking_client
+
+
+class FailingClient(FakeAsyncClient):
+    async def list_children(self, block_id, start_cursor=None):
+        if block_id == "page-b":
+            raise RuntimeError("Notion is down")
+        return await super().list_children(block_id, start_cursor)
+
+
+class PublishAllTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = temp_dir.name
+        self.client_class = FakeAsyncClient
+        for target, name, value in (
+            (ncms_notion, "create_async_client", lambda: self.client_class()),
+            (ncms_fetch, "notion", blocking_client(FakeAsyncClient())),
+            (ncms_fetch, "database_id", "database"),
+            (ncms_fetch, "block_cache_enabled", False),
+            (ncms_fetch, "git_push_enabled", True),
+            (ncms_fetch, "notion_update_enabled", True),
+            (ncms_fetch, "output_dir", None),
+            (ncms_fetch, "project_dir", None),
+        ):
+            patcher = patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def publish(self, *extra):
+        return ncms_fetch.main([
+            "publish", "--all", "--bundle-dir", os.path.join(self.root, "bundles"),
+            "--metadata-file", os.path.join(self.root, "index.json"), *extra,
+        ])
+
+    def read_index(self):
+        with open(os.path.join(self.root, "index.json"), encoding="utf-8") as source:
+            return json.load(source)
+
+    def test_every_queued_page_gets_its_own_bundle(self):
+        self.assertEqual(0, self.publish())
+
+        index = self.read_index()
+        self.assertEqual([], index["failed"])
+        self.assertEqual(["alpha", "beta"], [entry["slug"] for entry in index["bundles"]])
+        for entry in index["bundles"]:
+            bundle_dir = os.path.join(self.root, "bundles", entry["bundle_dir"])
+            with open(os.path.join(self.root, "bundles", entry["metadata_file"]),
+                      encoding="utf-8") as source:
+                metadata = json.load(source)
+            self.assertEqual(metadata, {
+                key: value for key, value in entry.items()
+                if key not in ("bundle_dir", "metadata_file")
+            })
+            for item in metadata["files"]:
+                self.assertTrue(os.path.isfile(os.path.join(bundle_dir, *item["path"].split("/"))))
+        alpha, beta = index["bundles"]
+        self.assertEqual(["en", "hi"], [variant["language"] for variant in alpha["variants"]])
+        self.assertNotIn(
+            "HTML/Component/alpha/index.php", [item["path"] for item in beta["files"]]
+        )
+        self.assertFalse(ncms_fetch.git_push_enabled)
+        self.assertFalse(ncms_fetch.notion_update_enabled)
+
+    def test_failed_fetch_is_isolated_to_its_page(self):
+        self.client_class = FailingClient
+
+        self.assertEqual(1, self.publish())
+
+        index = self.read_index()
+        self.assertEqual(["beta"], index["failed"])
+        alpha, beta = index["bundles"]
+        self.assertIn("Notion is down", beta["error"])
+        self.assertNotIn("variants", beta)
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.root, "bundles", alpha["bundle_dir"], alpha["component"])
+        ))
+
+    def test_failed_render_is_isolated_to_its_page(self):
+        build_articles = ncms_fetch.build_articles
+
+        def fail_alpha(record, block_trees, *args, **kwargs):
+            if record.slug == "alpha":
+                raise RuntimeError("render failed")
+            return build_articles(record, block_trees, *args, **kwargs)
+
+        with patch.object(ncms_fetch, "build_articles", side_effect=fail_alpha):
+            self.assertEqual(1, self.publish())
+
+        index = self.read_index()
+        self.assertEqual(["alpha"], index["failed"])
+        self.assertEqual("render failed", index["bundles"][0]["error"])
+        self.assertEqual("beta", index["bundles"][1]["slug"])
+
+    def test_empty_queue(self):
+        with patch.object(ncms_fetch, "fetch_database_content", return_value=[]):
+            with self.assertRaisesRegex(RuntimeError, "No pages"):
+                self.publish()
+            self.assertEqual(0, self.publish("--allow-empty"))
+        self.assertTrue(self.read_index()["no_work"])
+
+    def test_all_and_slug_are_exclusive(self):
+        with patch("sys.stderr"), self.assertRaises(SystemExit):
+            self.publish("--slug", "alpha")
+
+
+if __name__ == "__main__":
+    unittest.main()
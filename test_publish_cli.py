@@ -1,7 +1,10 @@
+import asyncio
+import hashlib
 import json
 import os
 import tempfile
 import unittest
+from types import SimpleNamespace
 from unittest.mock import Mock, patch
 
 import ncms_fetch
@@ -98,6 +101,42 @@ class PublishBundleTests(unittest.TestCase):
             self.assertFalse(ncms_fetch.git_push_enabled)
             self.assertFalse(ncms_fetch.notion_update_enabled)
 
+    def test_metadata_lists_digests_of_bundle_files(self):
+        article = {
+            "id": "page-1", "status": "publish", "slug": "world/example",
+            "language": "en", "translation_group": "", "label": "Example",
+            "title": "Example", "js": "0", "description": "", "type": "article",
+            "content": "<p>Example</p>",
+        }
+        with tempfile.TemporaryDirectory() as temp_dir, patch("builtins.print"):
+            with (
+                patch.object(ncms_fetch, "database_id", "database"),
+                patch.object(
+                    ncms_fetch,
+                    "fetch_database_content",
+                    return_value=[make_page("world/example")],
+                ),
+                patch.object(ncms_fetch, "extract_fields", return_value=[article]),
+            ):
+                metadata = ncms_fetch.publish_to_bundle(
+                    "publish", None, temp_dir, os.path.join(temp_dir, "metadata.json")
+                )
+
+            files = {item["path"]: item for item in metadata["files"]}
+            for path, item in files.items():
+                with open(os.path.join(temp_dir, *path.split("/")), "rb") as f:
+                    data = f.read()
+                self.assertEqual(hashlib.sha256(data).hexdigest(), item["sha256"])
+                self.assertEqual(len(data), item["size"])
+
+        variant = metadata["variants"][0]
+        self.assertEqual(files[variant["component"]]["sha256"], variant["sha256"])
+        self.assertIn("Config/Url.tsv", files)
+        self.assertEqual(ncms_fetch.bundle_digest(metadata["files"]), metadata["bundle_sha256"])
+        self.assertEqual(
+            metadata["bundle_sha256"], ncms_fetch.bundle_digest(reversed(metadata["files"]))
+        )
+
     def test_bundle_contains_base_and_nested_translation_variants(self):
         base = {
             "id": "page-1",
@@ -275,5 +314,99 @@ class MarkPublishedTests(unittest.TestCase):
         pages.update.assert_not_called()
 
 
+class FakePagesClient:
+    """AsyncClient stand-in whose pages start queued and record concurrency."""
+
+    def __init__(self, pages):
+        self.statuses = {page_id: status for page_id, (_, status) in pages.items()}
+        self.slugs = {page_id: slug for page_id, (slug, _) in pages.items()}
+        self.updates = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.pages = SimpleNamespace(retrieve=self.retrieve, update=self.update)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def call(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+    async def retrieve(self, page_id):
+        await self.call()
+        return make_page(self.slugs[page_id], self.statuses[page_id], page_id)
+
+    async def update(self, page_id, properties):
+        await self.call()
+        self.updates.append(page_id)
+        self.statuses[page_id] = properties["Status"]["select"]["name"]
+
+
+class MarkPublishedBatchTests(unittest.TestCase):
+    def setUp(self):
+        self.client = FakePagesClient({
+            "page-1": ("world/one", "publish"),
+            "page-2": ("world/two", "published"),
+            "page-3": ("world/three", "draft"),
+            "page-4": ("world/four", "publish"),
+        })
+        patcher = patch.object(
+            ncms_fetch.ncms_notion, "create_async_client", return_value=self.client
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pages_are_marked_concurrently_and_failures_reported(self):
+        summary = ncms_fetch.mark_published_batch([
+            ("page-1", "world/one"),
+            ("page-2", "world/two"),
+            ("page-3", "world/three"),
+            ("page-4", "world/renamed"),
+            ("page-1", "world/one"),
+        ])
+
+        self.assertEqual(2, summary["published"])
+        self.assertEqual(["world/three", "world/renamed"], summary["failed"])
+        self.assertEqual(
+            ["publish", "published"],
+            [result["previous_status"] for result in summary["results"][:2]],
+        )
+        self.assertIn("unexpected status", summary["results"][2]["error"])
+        self.assertIn("slug changed", summary["results"][3]["error"])
+        self.assertEqual(["page-1"], self.client.updates)
+        self.assertGreater(self.client.max_in_flight, 1)
+
+    def test_cli_reads_targets_from_publish_all_index(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index_path = os.path.join(temp_dir, "index.json")
+            summary_path = os.path.join(temp_dir, "summary.json")
+            with open(index_path, "w", encoding="utf-8") as target:
+                json.dump({"bundles": [
+                    {"page_id": "page-1", "slug": "world/one"},
+                    {"page_id": "page-4", "slug": "world/four", "error": "render failed"},
+                ]}, target)
+
+            result = ncms_fetch.main([
+                "mark-published", "--from-metadata", index_path,
+                "--page", "page-2", "world/two", "--summary-file", summary_path,
+            ])
+            with open(summary_path, encoding="utf-8") as source:
+                summary = json.load(source)
+
+        self.assertEqual(0, result)
+        self.assertEqual(
+            ["page-2", "page-1"], [item["page_id"] for item in summary["results"]]
+        )
+        self.assertEqual("publish", self.client.statuses["page-4"])
+
+
 if __name__ == "__main__":
     unittest.main()
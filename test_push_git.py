@@ -0,0 +1,114 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ncms_fetch
+
+
+def git(cwd, *args):
+    return subprocess.run(
+        ["git", *args], cwd=cwd, text=True, capture_output=True, check=True
+    ).stdout.strip()
+
+
+class PushGitTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        origin = os.path.join(temp_dir.name, "origin.git")
+        self.repo = os.path.join(temp_dir.name, "site")
+        git(temp_dir.name, "init", "-q", "--bare", "-b", "main", origin)
+        git(temp_dir.name, "init", "-q", "-b", "main", self.repo)
+        git(self.repo, "config", "user.email", "ncms@example.com")
+        git(self.repo, "config", "user.name", "NCMS")
+        git(self.repo, "remote", "add", "origin", origin)
+        self.write("README.md", "site\n")
+        git(self.repo, "add", "README.md")
+        git(self.repo, "commit", "-q", "-m", "Initial")
+        patcher = patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, relative_path, text):
+        path = os.path.join(self.repo, *relative_path.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def committed_files(self):
+        return git(self.repo, "show", "--name-only", "--format=", "HEAD").splitlines()
+
+    def check_scoped_commit(self):
+        changed = [
+            self.write("HTML/Component/world/a/index.php", "<p>A</p>"),
+            self.write("Config/ID.tsv", "Status\tId\n"),
+        ]
+        self.write("notes/untracked.txt", "not generated")
+        outside = os.path.join(os.path.dirname(self.repo), "outside.txt")
+
+        self.assertTrue(ncms_fetch.push_git(self.repo, changed + [outside], ["world/a", "world/a"]))
+
+        self.assertEqual(
+            ["Config/ID.tsv", "HTML/Component/world/a/index.php"], sorted(self.committed_files())
+        )
+        message = git(self.repo, "log", "-1", "--format=%B")
+        self.assertTrue(message.startswith("Update articles from Notion - "))
+        self.assertEqual(1, message.count("- world/a"))
+        self.assertIn("?? notes/", git(self.repo, "status", "--porcelain"))
+        self.assertEqual(git(self.repo, "rev-parse", "HEAD"), git(self.repo, "rev-parse", "origin/main"))
+
+        head = git(self.repo, "rev-parse", "HEAD")
+        self.assertTrue(ncms_fetch.push_git(self.repo, changed, ["world/a"]))
+        self.assertEqual(head, git(self.repo, "rev-parse", "HEAD"))
+
+    def test_stages_only_changed_paths(self):
+        with patch.object(ncms_fetch, "git_plumbing_enabled", False):
+            self.check_scoped_commit()
+
+    def test_plumbing_commit_matches_porcelain(self):
+        with patch.object(ncms_fetch, "git_plumbing_enabled", True):
+            self.check_scoped_commit()
+        self.assertEqual("", git(self.repo, "diff", "--cached", "--name-only"))
+
+    def test_user_staged_changes_stay_out_of_the_commit(self):
+        for plumbing in (False, True):
+            with self.subTest(plumbing=plumbing):
+                staged = self.write("notes/staged.txt", f"draft {plumbing}\n")
+                git(self.repo, "add", staged)
+                changed = [self.write("HTML/Component/world/a/index.php", f"<p>{plumbing}</p>")]
+
+                with patch.object(ncms_fetch, "git_plumbing_enabled", plumbing):
+                    self.assertTrue(ncms_fetch.push_git(self.repo, changed, ["world/a"]))
+
+                self.assertEqual(["HTML/Component/world/a/index.php"], self.committed_files())
+                self.assertEqual(
+                    ["notes/staged.txt"], git(self.repo, "diff", "--cached", "--name-only").splitlines()
+                )
+                self.assertEqual("", git(self.repo, "status", "--porcelain", "HTML"))
+
+    def test_no_changed_paths_skips_commit_and_push(self):
+        git(self.repo, "push", "-q", "-u", "origin", "main")
+        with patch.object(ncms_fetch, "_run_cmd", wraps=ncms_fetch._run_cmd) as run:
+            self.assertTrue(ncms_fetch.push_git(self.repo, []))
+        commands = [call.args[0][1] for call in run.call_args_list]
+        self.assertNotIn("commit", commands)
+        self.assertNotIn("push", commands)
+
+    def test_failed_push_is_retried_by_the_next_run(self):
+        changed = [self.write("HTML/Component/world/a/index.php", "<p>A</p>")]
+        origin = git(self.repo, "remote", "get-url", "origin")
+        git(self.repo, "remote", "set-url", "origin", origin + ".missing")
+        self.assertFalse(ncms_fetch.push_git(self.repo, changed, ["world/a"]))
+        head = git(self.repo, "rev-parse", "HEAD")
+
+        git(self.repo, "remote", "set-url", "origin", origin)
+        self.assertTrue(ncms_fetch.push_git(self.repo, changed, ["world/a"]))
+        self.assertEqual(head, git(self.repo, "rev-parse", "HEAD"))
+        self.assertEqual(head, git(self.repo, "rev-parse", "origin/main"))
+
+
+if __name__ == "__main__":
+    unittest.main()
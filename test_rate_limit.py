@@ -0,0 +1,189 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import httpx
+from notion_client.errors import APIResponseError
+
+import ncms_notion
+
+
+def rate_limited(request):
+    return httpx.Response(
+        429,
+        headers={"Retry-After": "7"},
+        json={"object": "error", "code": "rate_limited", "message": "Slow down"},
+    )
+
+
+def server_error(request):
+    return httpx.Response(
+        500,
+        json={"object": "error", "code": "internal_server_error", "message": "Oops"},
+    )
+
+
+def ok(request):
+    return httpx.Response(200, json={"object": "list", "results": [], "has_more": False})
+
+
+class ScriptedTransport:
+    """Answer requests with a fixed sequence of handlers."""
+
+    def __init__(self, *handlers):
+        self.handlers = list(handlers)
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        return self.handlers.pop(0)(request)
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_burst_then_spaced_reservations(self):
+        bucket = ncms_notion.TokenBucket(rate=2, burst=3)
+        with patch("ncms_notion.time.monotonic", return_value=100.0):
+            bucket.updated = 100.0
+            waits = [bucket.reserve() for _ in range(5)]
+        self.assertEqual([0.0, 0.0, 0.0, 0.5, 1.0], waits)
+
+    def test_tokens_refill_over_time(self):
+        bucket = ncms_notion.TokenBucket(rate=2, burst=3)
+        with patch("ncms_notion.time.monotonic", side_effect=[100.0, 100.0, 100.0, 101.5]):
+            bucket.updated = 100.0
+            bucket.reserve()
+            bucket.reserve()
+            bucket.reserve()
+            self.assertEqual(0.0, bucket.reserve())
+
+
+RESERVE_SCRIPT = """
+import sys, time
+import ncms_notion
+bucket = ncms_notion.SharedTokenBucket(sys.argv[1], rate=20, burst=3)
+print(' '.join(str(time.time() + bucket.reserve()) for _ in range(5)))
+bucket.close()
+"""
+
+
+class SharedTokenBucketTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, "bucket")
+
+    def test_buckets_on_one_file_share_the_burst(self):
+        first = ncms_notion.SharedTokenBucket(self.path, rate=1, burst=2)
+        second = ncms_notion.SharedTokenBucket(self.path, rate=1, burst=2)
+        self.addCleanup(first.close)
+        self.addCleanup(second.close)
+        self.assertEqual(0.0, first.reserve())
+        self.assertEqual(0.0, second.reserve())
+        self.assertGreater(first.reserve(), 0.9)
+        self.assertGreater(second.reserve(), 1.9)
+
+    def test_processes_are_spaced_at_the_combined_rate(self):
+        here = os.path.dirname(os.path.abspath(__file__))
+        processes = [
+            subprocess.Popen(
+                [sys.executable, "-c", RESERVE_SCRIPT, self.path],
+                cwd=here,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            for _ in range(3)
+        ]
+        schedule = sorted(
+            float(value)
+            for process in processes
+            for value in process.communicate(timeout=60)[0].split()
+        )
+        self.assertEqual(15, len(schedule))
+        # 3 burst tokens, then 12 reservations at 20/s: at least 0.6s apart.
+        self.assertGreaterEqual(schedule[-1] - schedule[0], 0.5)
+
+    def test_rate_limit_file_can_be_disabled(self):
+        with patch.dict("os.environ", {"NOTION_RATE_LIMIT_FILE": "none"}):
+            self.assertIsNone(ncms_notion.rate_limit_file())
+        with patch.dict("os.environ", {"NOTION_API_KEY": "secret_a"}, clear=True):
+            first = ncms_notion.rate_limit_file()
+        with patch.dict("os.environ", {"NOTION_API_KEY": "secret_b"}, clear=True):
+            self.assertNotEqual(first, ncms_notion.rate_limit_file())
+
+
+class RetryPolicyTests(unittest.TestCase):
+    def setUp(self):
+        ncms_notion.reset_stats()
+        patcher = patch.object(
+            ncms_notion, "_rate_limiter", ncms_notion.TokenBucket(rate=1000, burst=1000)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sleeps = []
+        patcher = patch("ncms_notion.time.sleep", side_effect=self.sleeps.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_client(self, transport):
+        return ncms_notion.create_client(
+            client=httpx.Client(transport=httpx.MockTransport(transport))
+        )
+
+    def test_retries_429_honouring_retry_after(self):
+        transport = ScriptedTransport(rate_limited, ok)
+        client = self.make_client(transport)
+
+        result = client.blocks.children.list(block_id="page")
+
+        self.assertEqual([], result["results"])
+        self.assertEqual(2, len(transport.requests))
+        self.assertGreaterEqual(self.sleeps[-1], 7)
+        self.assertEqual(1, ncms_notion.stats["retries"])
+        self.assertEqual(2, ncms_notion.stats["requests"])
+        self.assertIn("1 retries", ncms_notion.format_stats())
+
+    def test_retries_429_even_for_appends(self):
+        transport = ScriptedTransport(rate_limited, ok)
+        self.make_client(transport).blocks.children.append(block_id="page", children=[])
+        self.assertEqual(2, len(transport.requests))
+
+    def test_does_not_replay_failed_append(self):
+        transport = ScriptedTransport(server_error, ok)
+        client = self.make_client(transport)
+        with self.assertRaises(APIResponseError):
+            client.blocks.children.append(block_id="page", children=[])
+        self.assertEqual(1, len(transport.requests))
+
+    def test_gives_up_after_max_retries(self):
+        transport = ScriptedTransport(*([server_error] * 3))
+        client = self.make_client(transport)
+        with patch.dict("os.environ", {"NOTION_MAX_RETRIES": "2"}):
+            with self.assertRaises(APIResponseError):
+                client.pages.retrieve(page_id="page")
+        self.assertEqual(3, len(transport.requests))
+
+    def test_async_client_shares_policy(self):
+        transport = ScriptedTransport(rate_limited, ok)
+        async_sleeps = []
+
+        async def fake_sleep(delay):
+            async_sleeps.append(delay)
+
+        async def run():
+            client = ncms_notion.create_async_client(
+                client=httpx.AsyncClient(transport=httpx.MockTransport(transport))
+            )
+            return await client.databases.query(database_id="database")
+
+        with patch("asyncio.sleep", side_effect=fake_sleep):
+            asyncio.run(run())
+        self.assertEqual(2, len(transport.requests))
+        self.assertGreaterEqual(async_sleeps[-1], 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
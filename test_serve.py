@@ -0,0 +1,146 @@
+import io
+import json
+import os
+import socket
+import tarfile
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import ncms_client
+import ncms_fetch
+import ncms_notion
+from test_block_trees import FakeAsyncClient, blocking_client
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "needs Unix domain sockets")
+class ServeTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = temp_dir.name
+        self.socket_path = os.path.join(self.root, "ncms.sock")
+        self.clients = []
+
+        def create_async_client():
+            self.clients.append(FakeAsyncClient())
+            return self.clients[-1]
+
+        for target, name, value in (
+            (ncms_notion, "create_async_client", create_async_client),
+            (ncms_fetch, "notion", blocking_client(FakeAsyncClient())),
+            (ncms_fetch, "database_id", "database"),
+            (ncms_fetch, "block_cache_enabled", False),
+            (ncms_fetch, "git_push_enabled", True),
+        ):
+            patcher = patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        started = threading.Event()
+        servers = []
+
+        def ready(server):
+            servers.append(server)
+            started.set()
+
+        with patch("builtins.print"):
+            thread = threading.Thread(
+                target=ncms_fetch.serve, args=(self.socket_path, ready), daemon=True
+            )
+            thread.start()
+            self.assertTrue(started.wait(5))
+        self.server = servers[0]
+
+        def stop():
+            self.server.shutdown()
+            thread.join(5)
+
+        self.addCleanup(stop)
+
+    def run_client(self, *argv):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        code = ncms_client.run(argv, self.socket_path, stdout, stderr)
+        return code, stdout.getvalue(), stderr.getvalue()
+
+    def test_publish_jobs_share_one_warm_client(self):
+        work_dir = os.path.realpath(os.path.join(self.root, "work"))
+        os.makedirs(work_dir)
+        previous_cwd = os.getcwd()
+        os.chdir(work_dir)
+        self.addCleanup(os.chdir, previous_cwd)
+
+        results = []
+        for slug in ("alpha", "beta"):
+            code, stdout, _ = self.run_client(
+                "publish", "--slug", slug, "--bundle-dir", f"bundle-{slug}",
+                "--metadata-file", f"{slug}.json",
+            )
+            self.assertEqual(0, code)
+            with open(os.path.join(work_dir, f"{slug}.json"), encoding="utf-8") as source:
+                metadata = json.load(source)
+            self.assertIn("NCMS_RESULT=" + json.dumps(metadata, ensure_ascii=True), stdout)
+            results.append(metadata)
+
+        self.assertEqual(["alpha", "beta"], [metadata["slug"] for metadata in results])
+        self.assertEqual(1, len(self.clients))
+        self.assertTrue(ncms_fetch.git_push_enabled)
+        self.assertEqual(work_dir, os.getcwd())
+
+    def test_errors_keep_cli_exit_codes(self):
+        code, _, stderr = self.run_client("publish", "--bundle-dir", "b")
+        self.assertEqual(2, code)
+        self.assertIn("--metadata-file", stderr)
+
+        code, _, stderr = self.run_client("serve")
+        self.assertEqual(1, code)
+        self.assertIn("NCMS error: serve accepts", stderr)
+
+        code, _, stderr = self.run_client(
+            "diff", "--bundle-dir", self.root, "--metadata-file", "missing.json",
+            "--previous-metadata-file", "missing.json", "--tar", "-",
+        )
+        self.assertEqual(1, code)
+        self.assertIn("NCMS error:", stderr)
+
+    def test_diff_streams_a_binary_tar_through_the_socket(self):
+        metadata_files = []
+        for name, text in (("old", "<p>Old</p>"), ("new", "<p>New</p>")):
+            bundle_dir = os.path.join(self.root, name)
+            os.makedirs(os.path.join(bundle_dir, "HTML"))
+            with patch("builtins.print"):
+                ncms_fetch.write_output(os.path.join(bundle_dir, "HTML", "a.php"), text)
+            manifest = ncms_fetch.bundle_files(bundle_dir)
+            metadata_files.append(os.path.join(self.root, f"{name}.json"))
+            with open(metadata_files[-1], "w", encoding="utf-8") as target:
+                json.dump({"files": manifest, "bundle_sha256": ncms_fetch.bundle_digest(manifest)}, target)
+        tar_path = os.path.join(self.root, "patch.tar")
+        with patch("builtins.print"):
+            ncms_fetch.diff_bundle(bundle_dir, metadata_files[1], metadata_files[0], tar_file=tar_path)
+
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+        code = ncms_client.run(
+            ["diff", "--bundle-dir", bundle_dir, "--metadata-file", metadata_files[1],
+             "--previous-metadata-file", metadata_files[0], "--tar", "-"],
+            self.socket_path, stdout, io.StringIO(),
+        )
+
+        self.assertEqual(0, code)
+        stdout.flush()
+        streamed = stdout.buffer.getvalue()
+        with open(tar_path, "rb") as source:
+            self.assertEqual(source.read(), streamed)
+        with tarfile.open(fileobj=io.BytesIO(streamed)) as archive:
+            self.assertEqual(b"<p>New</p>", archive.extractfile("HTML/a.php").read())
+
+    def test_refuses_to_replace_a_regular_file(self):
+        path = os.path.join(self.root, "not-a-socket")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("data")
+        with self.assertRaisesRegex(RuntimeError, "non-socket"):
+            ncms_fetch.serve(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
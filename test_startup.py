@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+import unittest
+
+SCRIPTS = ("ncms_fetch", "ncms_upload", "ncms_translate", "ncms_translate_setup")
+DEFERRED_MODULES = ("notion_client", "httpx", "bs4")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_python(*args):
+    return subprocess.run(
+        [sys.executable, *args], cwd=HERE, capture_output=True, text=True, check=True
+    )
+
+
+class StartupTests(unittest.TestCase):
+    def test_importing_scripts_defers_clients_and_heavy_modules(self):
+        for module in SCRIPTS:
+            with self.subTest(module=module):
+                loaded = run_python("-c", (
+                    f"import sys, {module}; "
+                    f"print(' '.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+                )).stdout.split()
+                self.assertEqual([], loaded)
+
+    def test_cli_help_does_not_load_notion_client(self):
+        result = run_python("-c", (
+            "import sys, ncms_fetch\n"
+            "try:\n"
+            "    ncms_fetch.main(['--help'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print('notion_client' in sys.modules)"
+        ))
+        self.assertEqual("False", result.stdout.splitlines()[-1])
+
+    def test_client_is_created_on_first_use(self):
+        result = run_python("-c", (
+            "import sys, ncms_fetch\n"
+            "ncms_fetch.notion.pages\n"
+            "print('notion_client' in sys.modules, type(ncms_fetch.notion._client).__name__)"
+        ))
+        self.assertEqual("True RateLimitedClient", result.stdout.strip())
+
+
+if __name__ == "__main__":
+    unittest.main()
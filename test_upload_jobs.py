@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ncms_upload
+
+
+def component(title, paragraphs):
+    body = "".join(f"<p>{text}</p>\n" for text in paragraphs)
+    return f"<div id='message'>\n<h3>{title}</h3>\n{body}</div>\n"
+
+
+class ParseFilesTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = temp_dir.name
+        self.paths = []
+        for n in range(9):
+            path = os.path.join(self.root, f"article{n}.php")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(component(f"Title {n}", [f"Body {n}.{m}" for m in range(n + 1)]))
+            self.paths.append(path)
+
+    def test_process_pool_matches_serial_parse_in_order(self):
+        paths = self.paths[:4] + [os.path.join(self.root, "missing.php")] + self.paths[4:]
+
+        serial = list(ncms_upload.parse_files(paths))
+        pooled = list(ncms_upload.parse_files(paths, jobs=3))
+
+        self.assertEqual([blocks for blocks, _ in serial], [blocks for blocks, _ in pooled])
+        self.assertEqual(
+            [len(blocks) for blocks, _ in serial[:4]], [2, 3, 4, 5]
+        )
+        self.assertIsInstance(pooled[4][1], FileNotFoundError)
+        self.assertIsNone(pooled[4][0])
+
+    def test_closing_early_stops_the_pool(self):
+        parsed = ncms_upload.parse_files(self.paths, jobs=2)
+        first, error = next(parsed)
+        parsed.close()
+        self.assertIsNone(error)
+        self.assertEqual(ncms_upload.parse_file_to_blocks(self.paths[0]), first)
+
+    def test_dry_run_with_jobs_reports_in_tsv_order(self):
+        tsv_path = os.path.join(self.root, "ID.tsv")
+        slugs = [f"article{n}" for n in (3, 0, 8, 5)] + ["unknown"]
+        with open(tsv_path, "w", encoding="utf-8") as f:
+            f.write("Status\tId\n" + "".join(f"publish\t{slug}\n" for slug in slugs))
+        printed = []
+
+        with (
+            patch.object(ncms_upload, "COMPONENT_DIR", self.root),
+            patch.object(ncms_upload, "TSV_PATH", tsv_path),
+            patch("sys.argv", ["ncms_upload.py", "--dry-run", "--jobs", "2"]),
+            patch("builtins.print", side_effect=lambda *args: printed.append(" ".join(map(str, args)))),
+        ):
+            ncms_upload.main()
+
+        self.assertEqual(
+            [f"\nProcessing: {slug}" for slug in slugs[:4]],
+            [line for line in printed if line.startswith("\nProcessing:")],
+        )
+        self.assertIn("Results: 4 uploaded, 1 skipped, 0 failed", printed)
+
+    def test_bad_jobs_value_is_rejected(self):
+        for argv in (["--jobs", "many"], ["--jobs=-2"], ["--dry-run", "--jobs"]):
+            printed = []
+            with (
+                self.subTest(argv=argv),
+                patch("sys.argv", ["ncms_upload.py", *argv]),
+                patch("builtins.print", side_effect=lambda *args: printed.append(" ".join(map(str, args)))),
+                patch.object(ncms_upload, "build_file_map") as build_file_map,
+            ):
+                with self.assertRaises(SystemExit) as exit:
+                    ncms_upload.main()
+                self.assertEqual(1, exit.exception.code)
+                build_file_map.assert_not_called()
+                self.assertEqual(1, len(printed))
+                self.assertTrue(printed[0].startswith("Error: --jobs expects a number of processes"))
+
+
+if __name__ == "__main__":
+    unittest.main()
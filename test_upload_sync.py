@@ -0,0 +1,339 @@
+import copy
+import itertools
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import ncms_upload
+
+
+def response_rich_text(rich_text):
+    """Request rich_text as Notion returns it, with every annotation spelled out."""
+    return [{
+        **rt,
+        "annotations": {**ncms_upload.ANNOTATION_DEFAULTS, **rt.get("annotations", {})},
+        "plain_text": rt["text"]["content"],
+        "href": (rt["text"].get("link") or {}).get("url"),
+    } for rt in rich_text]
+
+
+class RejectedError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def rejected(block):
+    """Blocks the fake Notion refuses: text containing BAD or a javascript: link."""
+    for rt in block[block["type"]].get("rich_text", []):
+        if "BAD" in rt["text"]["content"]:
+            return "body.children should be valid"
+        if (rt["text"].get("link") or {}).get("url", "").startswith("javascript:"):
+            return "Invalid URL for link"
+    return None
+
+
+class FakePage:
+    """In-memory Notion page for blocks.children.list/append, update and delete."""
+
+    def __init__(self, page_id="page"):
+        self.page_id = page_id
+        self.children = {page_id: []}
+        self.ids = (f"block-{n}" for n in itertools.count())
+        self.calls = []
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failing = set()
+        self.outage = False
+        self.blocks = SimpleNamespace(
+            children=SimpleNamespace(list=self.list, append=self.append),
+            update=self.update,
+            delete=self.delete,
+        )
+
+    def stored(self, block):
+        block = copy.deepcopy(block)
+        block.pop("object", None)
+        block_id = next(self.ids)
+        payload = block[block["type"]]
+        if "rich_text" in payload:
+            payload["rich_text"] = response_rich_text(payload["rich_text"])
+        rows = payload.pop("children", None)
+        block.update(id=block_id, has_children=bool(rows))
+        if rows:
+            self.children[block_id] = [self.stored(row) for row in rows]
+        return block
+
+    def list(self, block_id, start_cursor=None):
+        self.calls.append("list")
+        start = int(start_cursor or 0)
+        blocks = self.children[block_id]
+        more = start + 100 < len(blocks)
+        return {
+            "results": copy.deepcopy(blocks[start:start + 100]),
+            "has_more": more,
+            "next_cursor": str(start + 100) if more else None,
+        }
+
+    def append(self, block_id, children, after=None):
+        self.calls.append("append")
+        if self.outage:
+            raise RejectedError("Service unavailable", status=503)
+        for block in children:
+            if rejected(block):
+                raise RejectedError(rejected(block))
+        blocks = self.children[block_id]
+        position = len(blocks)
+        if after is not None:
+            position = [b["id"] for b in blocks].index(after) + 1
+        new = [self.stored(block) for block in children]
+        blocks[position:position] = new
+        return {"results": copy.deepcopy(new)}
+
+    def update(self, block_id, **payload):
+        self.calls.append("update")
+        for block in self.children[self.page_id]:
+            if block["id"] == block_id:
+                (block_type, value), = payload.items()
+                assert block["type"] == block_type
+                block[block_type] = self.stored({"type": block_type, block_type: value})[block_type]
+
+    def delete(self, block_id):
+        with self.lock:
+            self.calls.append("delete")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.001)
+        with self.lock:
+            self.in_flight -= 1
+            if block_id in self.failing:
+                raise RuntimeError("Conflict")
+            self.children[self.page_id] = [
+                b for b in self.children[self.page_id] if b["id"] != block_id
+            ]
+
+    def keys(self):
+        blocks = copy.deepcopy(self.children[self.page_id])
+        for block in blocks:
+            if block["type"] == "table":
+                block["table"]["children"] = self.children[block["id"]]
+        return [ncms_upload.block_key(block) for block in blocks]
+
+
+def text(content, **annotations):
+    rt = ncms_upload.make_text(content, annotations)
+    return [rt]
+
+
+def article(count=300):
+    blocks = [ncms_upload.make_heading(1, text("Title"))]
+    blocks += [ncms_upload.make_paragraph(text(f"Paragraph {n}")) for n in range(count)]
+    blocks.append(ncms_upload.make_table([["a", "b"], ["c", "d"]]))
+    blocks.append(ncms_upload.make_code("print(1)", "python"))
+    return blocks
+
+
+class SyncPageBlocksTests(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        patcher = patch.object(ncms_upload, "notion", self.page)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ncms_upload.upload_blocks("page", article())
+        self.page.calls.clear()
+
+    def sync(self, blocks):
+        result = ncms_upload.sync_page_blocks("page", blocks)
+        self.assertEqual([ncms_upload.block_key(block) for block in blocks], self.page.keys())
+        return result
+
+    def writes(self):
+        return [call for call in self.page.calls if call != "list"]
+
+    def test_one_word_fix_is_one_update(self):
+        blocks = article()
+        blocks[150] = ncms_upload.make_paragraph(text("Paragraph 149, fixed"))
+
+        result = self.sync(blocks)
+
+        self.assertEqual(["update"], self.writes())
+        self.assertEqual(
+            {"kept": 302, "updated": 1, "inserted": 0, "deleted": 0, "rejected": []}, result
+        )
+
+    def test_unchanged_page_needs_no_writes(self):
+        self.sync(article())
+        self.assertEqual([], self.writes())
+
+    def test_inserts_land_in_position_and_removed_blocks_are_deleted(self):
+        blocks = article()
+        blocks[10:12] = [ncms_upload.make_divider()]
+        blocks.insert(200, ncms_upload.make_quote(text("Quoted", bold=True)))
+        blocks.append(ncms_upload.make_paragraph(text("The end")))
+
+        result = self.sync(blocks)
+
+        self.assertEqual(3, result["inserted"])
+        self.assertEqual(2, result["deleted"])
+        self.assertEqual(["append"] * 3 + ["delete"] * 2, self.writes())
+
+    def test_changed_table_is_replaced(self):
+        blocks = article()
+        blocks[-2] = ncms_upload.make_table([["a", "b"], ["c", "changed"]])
+
+        result = self.sync(blocks)
+
+        self.assertEqual((0, 1, 1), (result["updated"], result["inserted"], result["deleted"]))
+
+    def test_new_first_block_falls_back_to_full_replace(self):
+        blocks = [ncms_upload.make_callout("💡", "Note")] + article(5)
+
+        result = self.sync(blocks)
+
+        self.assertEqual(len(blocks), result["inserted"])
+
+
+class ClearPageContentTests(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.printed = []
+        for patcher in (
+            patch.object(ncms_upload, "notion", self.page),
+            patch("builtins.print", side_effect=lambda *args: self.printed.append(" ".join(args))),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.page.children["page"] = [
+            self.page.stored(ncms_upload.make_divider()) for _ in range(250)
+        ]
+
+    def test_lists_once_and_deletes_concurrently(self):
+        result = ncms_upload.clear_page_content("page", workers=8)
+
+        self.assertEqual({"deleted": 250, "failed": []}, result)
+        self.assertEqual([], self.page.children["page"])
+        self.assertEqual(["list"] * 3, [c for c in self.page.calls if c == "list"])
+        self.assertGreater(self.page.max_in_flight, 1)
+        self.assertLessEqual(self.page.max_in_flight, 8)
+        self.assertIn("  Deleted 250 of 250 blocks", self.printed)
+
+    def test_failures_are_reported_together(self):
+        self.page.failing = {f"block-{n}" for n in range(7)}
+
+        result = ncms_upload.clear_page_content("page", workers=4)
+
+        self.assertEqual(243, result["deleted"])
+        self.assertEqual(self.page.failing, {block_id for block_id, _ in result["failed"]})
+        self.assertIn("  Warning: Failed to delete 7 blocks", self.printed)
+        self.assertIn("    ... and 2 more", self.printed)
+
+
+class UploadBlocksTests(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        for patcher in (patch.object(ncms_upload, "notion", self.page), patch("builtins.print")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def paragraphs(self, count, bad=(), link_bad=()):
+        blocks = []
+        for n in range(count):
+            if n in bad:
+                blocks.append(ncms_upload.make_paragraph(text(f"BAD {n}")))
+            elif n in link_bad:
+                blocks.append(ncms_upload.make_paragraph(
+                    [ncms_upload.make_text(f"Link {n}", link="javascript:alert(1)")]
+                ))
+            else:
+                blocks.append(ncms_upload.make_paragraph(text(f"Paragraph {n}")))
+        return blocks
+
+    def page_texts(self):
+        return [
+            "".join(rt["plain_text"] for rt in block["paragraph"]["rich_text"])
+            for block in self.page.children["page"]
+        ]
+
+    def test_bad_block_is_found_by_bisection_and_order_is_kept(self):
+        blocks = self.paragraphs(250, bad={137})
+
+        report = ncms_upload.upload_blocks("page", blocks)
+
+        self.assertEqual(
+            [f"Paragraph {n}" for n in range(250) if n != 137], self.page_texts()
+        )
+        self.assertEqual(
+            [{"index": 137, "type": "paragraph", "text": "BAD 137",
+              "error": "body.children should be valid", "action": "skipped"}],
+            report,
+        )
+        # Two clean batches, plus the failed batch bisected down to one block.
+        self.assertLessEqual(self.page.calls.count("append"), 2 + 1 + 2 * 7)
+
+    def test_sanitized_block_is_kept_in_position(self):
+        report = ncms_upload.upload_blocks("page", self.paragraphs(5, link_bad={2}))
+
+        self.assertEqual(["Paragraph 0", "Paragraph 1", "Link 2", "Paragraph 3", "Paragraph 4"],
+                         self.page_texts())
+        self.assertEqual("sanitized", report[0]["action"])
+        self.assertIsNone(self.page.children["page"][2]["paragraph"]["rich_text"][0]["href"])
+
+    def test_sanitizing_can_be_disabled(self):
+        report = ncms_upload.upload_blocks(
+            "page", self.paragraphs(5, link_bad={2}), sanitize=False
+        )
+        self.assertEqual("skipped", report[0]["action"])
+        self.assertEqual(4, len(self.page.children["page"]))
+
+    def test_outages_are_not_bisected(self):
+        self.page.outage = True
+        with self.assertRaisesRegex(RejectedError, "unavailable"):
+            ncms_upload.upload_blocks("page", self.paragraphs(100))
+        self.assertEqual(["append"], self.page.calls)
+
+    def test_sync_reports_rejected_inserts(self):
+        ncms_upload.upload_blocks("page", self.paragraphs(5))
+        blocks = self.paragraphs(5)
+        blocks.insert(3, ncms_upload.make_paragraph(text("BAD insert")))
+
+        result = ncms_upload.sync_page_blocks("page", blocks)
+
+        self.assertEqual(0, result["inserted"])
+        self.assertEqual(["BAD insert"], [entry["text"] for entry in result["rejected"]])
+        self.assertEqual([f"Paragraph {n}" for n in range(5)], self.page_texts())
+
+
+class BlockKeyTests(unittest.TestCase):
+    def test_request_and_response_forms_compare_equal(self):
+        request = ncms_upload.make_paragraph([
+            ncms_upload.make_text("Hello ", {"bold": True}),
+            ncms_upload.make_text("world", {"bold": True}),
+            ncms_upload.make_text("!", link="https://example.com"),
+        ])
+        response = {"type": "paragraph", "paragraph": {
+            "rich_text": response_rich_text([
+                ncms_upload.make_text("Hello world", {"bold": True}),
+                ncms_upload.make_text("!", link="https://example.com"),
+            ]),
+            "color": "default",
+        }}
+        self.assertEqual(ncms_upload.block_key(request), ncms_upload.block_key(response))
+
+    def test_annotations_and_language_matter(self):
+        plain = ncms_upload.make_paragraph(text("Hi"))
+        bold = ncms_upload.make_paragraph(text("Hi", bold=True))
+        self.assertNotEqual(ncms_upload.block_key(plain), ncms_upload.block_key(bold))
+        self.assertNotEqual(
+            ncms_upload.block_key(ncms_upload.make_code("x", "python")),
+            ncms_upload.block_key(ncms_upload.make_code("x", "php")),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()